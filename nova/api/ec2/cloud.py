@@ -995,12 +995,14 @@ class CloudController(object):
         return {'instancesSet': instances_set}
 
     def _format_instance_bdm(self, context, instance_uuid, root_device_name,
-                             result):
+                             result, bdms=None):
         """Format InstanceBlockDeviceMappingResponseItemType"""
         root_device_type = 'instance-store'
         mapping = []
-        for bdm in db.block_device_mapping_get_all_by_instance(context,
-                                                               instance_uuid):
+        if bdms is None:
+            bdms = db.block_device_mapping_get_all_by_instance(context,
+                                                               instance_uuid)
+        for bdm in bdms:
             volume_id = bdm['volume_id']
             if (volume_id is None or bdm['no_device']):
                 continue
@@ -1073,18 +1075,41 @@ class CloudController(object):
                                                      sort_dir='asc')
             except exception.NotFound:
                 instances = []
+        if not context.is_admin:
+            instances = [instance for instance in instances
+                         if instance['image_ref'] != str(CONF.vpn_image_id)]
+
+        # Look up what every instance refers to with one query per table.
+        instance_uuids = [instance['uuid'] for instance in instances]
+        ec2_ids = ec2utils.ids_to_ec2_inst_ids(instance_uuids)
+        image_uuids = []
+        for instance in instances:
+            image_uuids.append(instance['image_ref'])
+            image_uuids += [instance[key]
+                            for key in ('kernel_id', 'ramdisk_id')
+                            if instance[key]]
+        image_ids = ec2utils.glance_ids_to_ids(context, image_uuids)
+        bdms = db.block_device_mapping_get_all_by_instances(context,
+                                                            instance_uuids)
+        hosts = set(instance['host'] for instance in instances
+                    if instance['host'] is not None)
+        services = {}
+        for service in db.service_get_all_by_hosts(context.elevated(),
+                                                   list(hosts)):
+            services.setdefault(service['host'], []).append(service)
+
         for instance in instances:
-            if not context.is_admin:
-                if instance['image_ref'] == str(CONF.vpn_image_id):
-                    continue
             i = {}
             instance_uuid = instance['uuid']
-            ec2_id = ec2utils.id_to_ec2_inst_id(instance_uuid)
-            i['instanceId'] = ec2_id
-            image_uuid = instance['image_ref']
-            i['imageId'] = ec2utils.glance_id_to_ec2_id(context, image_uuid)
-            self._format_kernel_id(context, instance, i, 'kernelId')
-            self._format_ramdisk_id(context, instance, i, 'ramdiskId')
+            i['instanceId'] = ec2_ids[instance_uuid]
+            i['imageId'] = ec2utils.image_ec2_id(
+                    image_ids.get(instance['image_ref']))
+            if instance['kernel_id']:
+                i['kernelId'] = ec2utils.image_ec2_id(
+                        image_ids[instance['kernel_id']], 'aki')
+            if instance['ramdisk_id']:
+                i['ramdiskId'] = ec2utils.image_ec2_id(
+                        image_ids[instance['ramdisk_id']], 'ari')
             i['instanceState'] = _state_description(
                 instance['vm_state'], instance['shutdown_terminate'])
 
@@ -1118,10 +1143,11 @@ class CloudController(object):
             i['amiLaunchIndex'] = instance['launch_index']
             self._format_instance_root_device_name(instance, i)
             self._format_instance_bdm(context, instance['uuid'],
-                                      i['rootDeviceName'], i)
+                                      i['rootDeviceName'], i,
+                                      bdms=bdms[instance_uuid])
             host = instance['host']
-            services = db.service_get_all_by_host(context.elevated(), host)
-            zone = ec2utils.get_availability_zone_by_host(services, host)
+            zone = ec2utils.get_availability_zone_by_host(
+                    services.get(host, []), host)
             i['placement'] = {'availabilityZone': zone}
             if instance['reservation_id'] not in reservations:
                 r = {}
@@ -18,6 +18,7 @@
 
 import re
 
+from nova.common import memorycache
 from nova import context
 from nova import db
 from nova import exception
@@ -28,6 +29,29 @@ from nova.openstack.common import uuidutils
 
 LOG = logging.getLogger(__name__)
 
+# The mappings between instance and image uuids and the int ids their ec2
+# ids are made of never change once created, so they are kept in process.
+_id_cache = None
+
+
+def _get_id_cache():
+    global _id_cache
+    if _id_cache is None:
+        _id_cache = memorycache.Client()
+    return _id_cache
+
+
+def reset_cache():
+    """Forget the id mappings kept in process."""
+    global _id_cache
+    _id_cache = None
+
+
+def _cache_id_mapping(kind, uuid, int_id):
+    cache = _get_id_cache()
+    cache.set('%s-id:%s' % (kind, uuid), int_id)
+    cache.set('%s-uuid:%s' % (kind, int_id), uuid)
+
 
 def image_type(image_type):
     """Converts to a three letter image type.
@@ -48,17 +72,55 @@ def image_type(image_type):
 
 def id_to_glance_id(context, image_id):
     """Convert an internal (db) id to a glance id."""
-    return db.s3_image_get(context, image_id)['uuid']
+    glance_id = _get_id_cache().get('image-uuid:%s' % image_id)
+    if glance_id is None:
+        glance_id = db.s3_image_get(context, image_id)['uuid']
+        _cache_id_mapping('image', glance_id, image_id)
+    return glance_id
 
 
 def glance_id_to_id(context, glance_id):
     """Convert a glance id to an internal (db) id."""
     if glance_id is None:
         return
+    image_id = _get_id_cache().get('image-id:%s' % glance_id)
+    if image_id is not None:
+        return image_id
     try:
-        return db.s3_image_get_by_uuid(context, glance_id)['id']
+        image_id = db.s3_image_get_by_uuid(context, glance_id)['id']
     except exception.NotFound:
-        return db.s3_image_create(context, glance_id)['id']
+        image_id = db.s3_image_create(context, glance_id)['id']
+    _cache_id_mapping('image', glance_id, image_id)
+    return image_id
+
+
+def glance_ids_to_ids(context, glance_ids):
+    """Convert glance ids to internal (db) ids with a single lookup.
+
+    Returns a dict of glance id to internal id.
+    """
+    cache = _get_id_cache()
+    ids = {}
+    missing = set()
+    for glance_id in glance_ids:
+        if glance_id is None or glance_id in ids:
+            continue
+        image_id = cache.get('image-id:%s' % glance_id)
+        if image_id is None:
+            missing.add(glance_id)
+        else:
+            ids[glance_id] = image_id
+    if not missing:
+        return ids
+    s3_images = db.s3_image_get_by_uuids(context, missing)
+    found = dict((s3_image['uuid'], s3_image['id']) for s3_image in s3_images)
+    for glance_id in missing:
+        image_id = found.get(str(glance_id))
+        if image_id is None:
+            image_id = db.s3_image_create(context, glance_id)['id']
+        _cache_id_mapping('image', glance_id, image_id)
+        ids[glance_id] = image_id
+    return ids
 
 
 def ec2_id_to_glance_id(context, ec2_id):
@@ -137,6 +199,17 @@ def id_to_ec2_inst_id(instance_id):
         return id_to_ec2_id(instance_id)
 
 
+def ids_to_ec2_inst_ids(instance_ids):
+    """Get or create the ec2 instance IDs of a list of uuids at once.
+
+    Returns a dict of uuid to ec2 instance ID.
+    """
+    ctxt = context.get_admin_context()
+    int_ids = get_int_ids_from_instance_uuids(ctxt, instance_ids)
+    return dict((instance_id, id_to_ec2_id(int_id))
+                for instance_id, int_id in int_ids.iteritems())
+
+
 def ec2_inst_id_to_uuid(context, ec2_id):
     """"Convert an instance id to uuid."""
     int_id = ec2_id_to_id(ec2_id)
@@ -144,7 +217,11 @@ def ec2_inst_id_to_uuid(context, ec2_id):
 
 
 def get_instance_uuid_from_int_id(context, int_id):
-    return db.get_instance_uuid_by_ec2_id(context, int_id)
+    instance_uuid = _get_id_cache().get('instance-uuid:%s' % int_id)
+    if instance_uuid is None:
+        instance_uuid = db.get_instance_uuid_by_ec2_id(context, int_id)
+        _cache_id_mapping('instance', instance_uuid, int_id)
+    return instance_uuid
 
 
 def id_to_ec2_snap_id(snapshot_id):
@@ -212,10 +289,44 @@ def is_ec2_timestamp_expired(request, expires=None):
 def get_int_id_from_instance_uuid(context, instance_uuid):
     if instance_uuid is None:
         return
+    int_id = _get_id_cache().get('instance-id:%s' % instance_uuid)
+    if int_id is not None:
+        return int_id
     try:
-        return db.get_ec2_instance_id_by_uuid(context, instance_uuid)
+        int_id = db.get_ec2_instance_id_by_uuid(context, instance_uuid)
     except exception.NotFound:
-        return db.ec2_instance_create(context, instance_uuid)['id']
+        int_id = db.ec2_instance_create(context, instance_uuid)['id']
+    _cache_id_mapping('instance', instance_uuid, int_id)
+    return int_id
+
+
+def get_int_ids_from_instance_uuids(context, instance_uuids):
+    """Get or create the int ids of a list of instance uuids at once.
+
+    Returns a dict of instance uuid to int id.
+    """
+    cache = _get_id_cache()
+    int_ids = {}
+    missing = set()
+    for instance_uuid in instance_uuids:
+        if instance_uuid is None or instance_uuid in int_ids:
+            continue
+        int_id = cache.get('instance-id:%s' % instance_uuid)
+        if int_id is None:
+            missing.add(instance_uuid)
+        else:
+            int_ids[instance_uuid] = int_id
+    if not missing:
+        return int_ids
+    mappings = db.ec2_instance_get_by_uuids(context, missing)
+    found = dict((mapping['uuid'], mapping['id']) for mapping in mappings)
+    for instance_uuid in missing:
+        int_id = found.get(instance_uuid)
+        if int_id is None:
+            int_id = db.ec2_instance_create(context, instance_uuid)['id']
+        _cache_id_mapping('instance', instance_uuid, int_id)
+        int_ids[instance_uuid] = int_id
+    return int_ids
 
 
 def get_int_id_from_volume_uuid(context, volume_uuid):
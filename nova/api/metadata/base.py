@@ -16,7 +16,15 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-"""Instance Metadata information."""
+"""Instance Metadata information.
+
+An InstanceMetadata is a snapshot of an instance: it renders each path
+once and keeps the result.  The metadata handler caches snapshots by
+instance uuid, metadata generation and requesting address, as local-ipv4
+is that address, for 15 seconds.  Updating an instance through the compute
+API starts a new generation, so its cached snapshots are no longer served.
+Changes made elsewhere show up once the cached snapshot expires.
+"""
 
 import base64
 import json
@@ -28,6 +36,7 @@ from nova import block_device
 from nova import context
 from nova import db
 from nova import network
+from nova.network import model as network_model
 from nova.openstack.common import cfg
 from nova.virt import netutils
 
@@ -96,7 +105,10 @@ class InstanceMetadata():
 
         self.ip_info = ec2utils.get_ip_info_for_instance(ctxt, instance)
 
-        self.security_groups = db.security_group_get_by_instance(ctxt,
+        # The instance usually comes with its security groups joined in.
+        self.security_groups = instance.get('security_groups')
+        if self.security_groups is None:
+            self.security_groups = db.security_group_get_by_instance(ctxt,
                                                             instance['id'])
 
         self.mappings = _format_instance_mapping(ctxt, instance)
@@ -110,16 +122,21 @@ class InstanceMetadata():
 
         self.ec2_ids['instance-id'] = ec2utils.id_to_ec2_inst_id(
             instance['uuid'])
-        self.ec2_ids['ami-id'] = ec2utils.glance_id_to_ec2_id(ctxt,
-            instance['image_ref'])
 
-        for image_type in ['kernel', 'ramdisk']:
-            if self.instance.get('%s_id' % image_type):
-                image_id = self.instance['%s_id' % image_type]
-                ec2_image_type = ec2utils.image_type(image_type)
-                ec2_id = ec2utils.glance_id_to_ec2_id(ctxt, image_id,
-                                                      ec2_image_type)
-                self.ec2_ids['%s-id' % image_type] = ec2_id
+        image_types = [image_type for image_type in ['kernel', 'ramdisk']
+                       if self.instance.get('%s_id' % image_type)]
+        image_ids = ec2utils.glance_ids_to_ids(ctxt,
+                [instance['image_ref']] +
+                [instance['%s_id' % image_type] for image_type in image_types])
+
+        self.ec2_ids['ami-id'] = ec2utils.image_ec2_id(
+            image_ids.get(instance['image_ref']))
+
+        for image_type in image_types:
+            image_id = image_ids[self.instance['%s_id' % image_type]]
+            ec2_image_type = ec2utils.image_type(image_type)
+            ec2_id = ec2utils.image_ec2_id(image_id, ec2_image_type)
+            self.ec2_ids['%s-id' % image_type] = ec2_id
 
         self.address = address
 
@@ -133,9 +150,15 @@ class InstanceMetadata():
         self.content = {}
         self.files = []
 
-        # get network info, and the rendered network template
-        ctxt = context.get_admin_context()
-        network_info = network.API().get_instance_nw_info(ctxt, instance)
+        # Results of lookup() by path, so each item is only rendered once
+        # however many requests ask for it.
+        self._lookups = {}
+
+        # get network info, and the rendered network template.  The info
+        # cache of the instance has it unless the instance is brand new.
+        network_info = _get_cached_nw_info(instance)
+        if not network_info:
+            network_info = network.API().get_instance_nw_info(ctxt, instance)
 
         self.network_config = None
         cfg = netutils.get_injected_network_template(network_info)
@@ -328,6 +351,8 @@ class InstanceMetadata():
             path = "/" + "/".join(path_tokens)
 
         # all values of 'path' input starts with '/' and have no trailing /
+        if path in self._lookups:
+            return self._lookups[path]
 
         # specifically handle the top level request
         if len(path_tokens) == 1:
@@ -345,6 +370,7 @@ class InstanceMetadata():
         except (InvalidMetadataVersion, KeyError):
             raise InvalidMetadataPath(path)
 
+        self._lookups[path] = data
         return data
 
     def metadata_for_config_drive(self):
@@ -380,13 +406,16 @@ class InstanceMetadata():
             yield ('%s/%s/%s' % ("openstack", CONTENT_DIR, cid), content)
 
 
-def get_metadata_by_address(address):
-    ctxt = context.get_admin_context()
+def get_instance_uuid_by_address(address, ctxt=None):
+    ctxt = ctxt or context.get_admin_context()
     fixed_ip = network.API().get_fixed_ip_by_address(ctxt, address)
+    return fixed_ip['instance_uuid']
+
 
-    return get_metadata_by_instance_id(fixed_ip['instance_uuid'],
-                                       address,
-                                       ctxt)
+def get_metadata_by_address(address):
+    ctxt = context.get_admin_context()
+    return get_metadata_by_instance_id(
+        get_instance_uuid_by_address(address, ctxt), address, ctxt)
 
 
 def get_metadata_by_instance_id(instance_id, address, ctxt=None):
@@ -395,6 +424,12 @@ def get_metadata_by_instance_id(instance_id, address, ctxt=None):
     return InstanceMetadata(instance, address)
 
 
+def _get_cached_nw_info(instance):
+    info_cache = instance.get('info_cache') or {}
+    return network_model.NetworkInfo.hydrate(
+            info_cache.get('network_info') or [])
+
+
 def _format_instance_mapping(ctxt, instance):
     bdms = db.block_device_mapping_get_all_by_instance(ctxt, instance['uuid'])
     return block_device.instance_block_mapping(instance, bdms)
@@ -0,0 +1,75 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Cache of instance metadata snapshots.
+
+Snapshots are cached under a generation of their instance, which the
+compute API drops whenever it updates the instance.  This module only
+depends on the configuration, so the compute API can use it without
+importing the metadata service.
+"""
+
+import uuid
+
+from nova.openstack.common import cfg
+
+CONF = cfg.CONF
+CONF.import_opt('memcached_servers', 'nova.config')
+
+# Shared by the metadata handler and the compute API, so that updates made
+# in this process invalidate its snapshots even without memcached.
+_cache = None
+
+
+def get_client():
+    """Return the cache metadata snapshots are kept in."""
+    global _cache
+    if _cache is None:
+        if CONF.memcached_servers:
+            import memcache
+        else:
+            from nova.common import memorycache as memcache
+        _cache = memcache.Client(CONF.memcached_servers, debug=0)
+    return _cache
+
+
+def reset_cache():
+    """Forget the metadata snapshots kept in process."""
+    global _cache
+    _cache = None
+
+
+def get_metadata_generation(instance_uuid):
+    """Return the generation the metadata of an instance is cached under.
+
+    A generation is random rather than counted, so one started after the
+    previous one was dropped or evicted never matches stale snapshots.
+    """
+    cache = get_client()
+    key = 'metadata-gen-%s' % instance_uuid
+    generation = cache.get(key)
+    if generation is None:
+        # Another request may have started a generation meanwhile, in
+        # which case add() keeps that one.
+        cache.add(key, str(uuid.uuid4()))
+        generation = cache.get(key)
+    return generation
+
+
+def invalidate_metadata(instance_uuid):
+    """Stop serving the cached metadata snapshots of an instance."""
+    get_client().delete('metadata-gen-%s' % instance_uuid)
@@ -20,20 +20,23 @@
 import hashlib
 import hmac
 import os
+import sys
 
+from eventlet import event
 import webob.dec
 import webob.exc
 
 from nova.api.metadata import base
+from nova.api.metadata import cache
 from nova import exception
 from nova.openstack.common import cfg
+from nova.openstack.common import excutils
 from nova.openstack.common import log as logging
 from nova import wsgi
 
 CACHE_EXPIRATION = 15  # in seconds
 
 CONF = cfg.CONF
-CONF.import_opt('memcached_servers', 'nova.config')
 CONF.import_opt('use_forwarded_for', 'nova.api.auth')
 
 metadata_proxy_opts = [
@@ -52,50 +55,70 @@ CONF.register_opts(metadata_proxy_opts)
 
 LOG = logging.getLogger(__name__)
 
-if CONF.memcached_servers:
-    import memcache
-else:
-    from nova.common import memorycache as memcache
-
 
 class MetadataRequestHandler(wsgi.Application):
     """Serve metadata."""
 
     def __init__(self):
-        self._cache = memcache.Client(CONF.memcached_servers, debug=0)
-
-    def get_metadata_by_remote_address(self, address):
-        if not address:
-            raise exception.FixedIpNotFoundForAddress(address=address)
+        self._cache = cache.get_client()
+        # Builds in progress by cache key, so that concurrent requests for
+        # the same instance wait for one build instead of each doing it.
+        self._builds = {}
 
-        cache_key = 'metadata-%s' % address
+    def _get_cached(self, cache_key, build):
         data = self._cache.get(cache_key)
         if data:
             return data
 
-        try:
-            data = base.get_metadata_by_address(address)
-        except exception.NotFound:
-            return None
+        if cache_key in self._builds:
+            return self._builds[cache_key].wait()
 
-        self._cache.set(cache_key, data, CACHE_EXPIRATION)
+        done = event.Event()
+        self._builds[cache_key] = done
+        try:
+            data = build()
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                done.send_exception(*sys.exc_info())
+        finally:
+            del self._builds[cache_key]
 
+        if data:
+            self._cache.set(cache_key, data, CACHE_EXPIRATION)
+        done.send(data)
         return data
 
-    def get_metadata_by_instance_id(self, instance_id, address):
-        cache_key = 'metadata-%s' % instance_id
-        data = self._cache.get(cache_key)
-        if data:
-            return data
+    def get_metadata_by_remote_address(self, address):
+        if not address:
+            raise exception.FixedIpNotFoundForAddress(address=address)
 
-        try:
-            data = base.get_metadata_by_instance_id(instance_id, address)
-        except exception.NotFound:
+        def get_instance_uuid():
+            try:
+                return base.get_instance_uuid_by_address(address)
+            except exception.NotFound:
+                return None
+
+        instance_uuid = self._get_cached('metadata-address-%s' % address,
+                                         get_instance_uuid)
+        if instance_uuid is None:
             return None
 
-        self._cache.set(cache_key, data, CACHE_EXPIRATION)
+        return self.get_metadata_by_instance_id(instance_uuid, address)
 
-        return data
+    def get_metadata_by_instance_id(self, instance_id, address):
+        def get_metadata():
+            try:
+                return base.get_metadata_by_instance_id(instance_id, address)
+            except exception.NotFound:
+                return None
+
+        # Both ways of looking up metadata share this snapshot of the
+        # instance, which is built once per cache period or generation.
+        # The address is part of the key since the snapshot serves it as
+        # local-ipv4.
+        generation = cache.get_metadata_generation(instance_id)
+        cache_key = 'metadata-%s-%s-%s' % (instance_id, generation, address)
+        return self._get_cached(cache_key, get_metadata)
 
     @webob.dec.wsgify(RequestClass=wsgi.Request)
     def __call__(self, req):
@@ -32,17 +32,23 @@ class ExtendedServerAttributesController(wsgi.Controller):
                                                                  **kwargs)
         self.compute_api = compute.API()
 
-    def _get_hypervisor_hostname(self, context, instance):
-        compute_node = db.compute_node_get_by_host(context, instance["host"])
-
-        try:
-            return compute_node["hypervisor_hostname"]
-        except TypeError:
-            return
-
-    def _extend_server(self, context, server, instance):
+    def _get_compute_nodes(self, req, context, instances):
+        """Look up the compute nodes of all instances in one query."""
+        def fetch(hosts):
+            compute_nodes = {}
+            for compute_node in db.compute_node_get_by_hosts(context, hosts):
+                compute_nodes.setdefault(compute_node['service']['host'],
+                                         compute_node)
+            return compute_nodes
+
+        hosts = [instance['host'] for instance in instances
+                 if instance['host']]
+        return req.get_or_fetch_db_items('compute_nodes', hosts, fetch)
+
+    def _extend_server(self, server, instance, compute_nodes):
         key = "%s:hypervisor_hostname" % Extended_server_attributes.alias
-        server[key] = self._get_hypervisor_hostname(context, instance)
+        compute_node = compute_nodes.get(instance['host'])
+        server[key] = compute_node and compute_node['hypervisor_hostname']
 
         for attr in ['host', 'name']:
             if attr == 'name':
@@ -52,17 +58,22 @@ class ExtendedServerAttributesController(wsgi.Controller):
                 key = "%s:%s" % (Extended_server_attributes.alias, attr)
             server[key] = instance[attr]
 
+    def _extend_servers(self, req, servers):
+        context = req.environ['nova.context']
+        # server['id'] is guaranteed to be in the cache due to the core
+        # API adding it in its 'show' and 'detail' methods.
+        instances = [req.get_db_instance(server['id']) for server in servers]
+        compute_nodes = self._get_compute_nodes(req, context, instances)
+        for server, instance in zip(servers, instances):
+            self._extend_server(server, instance, compute_nodes)
+
     @wsgi.extends
     def show(self, req, resp_obj, id):
         context = req.environ['nova.context']
         if authorize(context):
             # Attach our slave template to the response object
             resp_obj.attach(xml=ExtendedServerAttributeTemplate())
-            server = resp_obj.obj['server']
-            db_instance = req.get_db_instance(server['id'])
-            # server['id'] is guaranteed to be in the cache due to
-            # the core API adding it in its 'show' method.
-            self._extend_server(context, server, db_instance)
+            self._extend_servers(req, [resp_obj.obj['server']])
 
     @wsgi.extends
     def detail(self, req, resp_obj):
@@ -70,13 +81,7 @@ class ExtendedServerAttributesController(wsgi.Controller):
         if authorize(context):
             # Attach our slave template to the response object
             resp_obj.attach(xml=ExtendedServerAttributesTemplate())
-
-            servers = list(resp_obj.obj['servers'])
-            for server in servers:
-                db_instance = req.get_db_instance(server['id'])
-                # server['id'] is guaranteed to be in the cache due to
-                # the core API adding it in its 'detail' method.
-                self._extend_server(context, server, db_instance)
+            self._extend_servers(req, list(resp_obj.obj['servers']))
 
 
 class Extended_server_attributes(extensions.ExtensionDescriptor):
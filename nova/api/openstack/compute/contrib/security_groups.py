@@ -16,6 +16,7 @@
 
 """The security groups extension."""
 
+import functools
 from xml.dom import minidom
 
 import webob
@@ -462,11 +463,37 @@ class SecurityGroupsOutputController(wsgi.Controller):
         super(SecurityGroupsOutputController, self).__init__(*args, **kwargs)
         self.compute_api = compute.API()
 
+    def _get_security_groups(self, req, instances):
+        """Security groups of each instance, looked up together.
+
+        Groups joined onto the instances are used as they are; the
+        rest are fetched with one query shared through the request.
+        """
+        key = "security_groups"
+        groups = {}
+        missing = []
+        for instance in instances:
+            # iteritems() only includes relations that are already loaded,
+            # so this does not lazy load the groups of each instance.
+            joined = dict(instance.iteritems())
+            if key in joined:
+                groups[instance['uuid']] = joined[key]
+            else:
+                missing.append(instance['uuid'])
+        if missing:
+            context = req.environ['nova.context']
+            fetch = functools.partial(db.security_group_get_by_instances,
+                                      context)
+            groups.update(req.get_or_fetch_db_items('instance_security_groups',
+                                                    missing, fetch))
+        return groups
+
     def _extend_servers(self, req, servers):
         key = "security_groups"
-        for server in servers:
-            instance = req.get_db_instance(server['id'])
-            groups = instance.get(key)
+        instances = [req.get_db_instance(server['id']) for server in servers]
+        groups_by_uuid = self._get_security_groups(req, instances)
+        for server, instance in zip(servers, instances):
+            groups = groups_by_uuid.get(instance['uuid'])
             if groups:
                 server[key] = [{"name": group["name"]} for group in groups]
 
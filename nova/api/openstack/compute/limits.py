@@ -22,6 +22,7 @@ import copy
 import httplib
 import math
 import re
+import socket
 import time
 
 import webob.dec
@@ -30,12 +31,31 @@ import webob.exc
 from nova.api.openstack.compute.views import limits as limits_views
 from nova.api.openstack import wsgi
 from nova.api.openstack import xmlutil
+from nova.openstack.common import cfg
 from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
+from nova.openstack.common import log as logging
 from nova import quota
 from nova import wsgi as base_wsgi
 
 
+ratelimit_opts = [
+    cfg.StrOpt('ratelimit_socket',
+               default='$state_path/ratelimit.sock',
+               help='Unix socket nova-ratelimit listens on, and the default '
+                    'address SharedLimiter sends rate limit checks to'),
+    cfg.StrOpt('ratelimit_limits',
+               default='',
+               help='Rate limits enforced by nova-ratelimit, in the same '
+                    'format as the limits option of the ratelimit filter. '
+                    'The default limits are used when empty'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(ratelimit_opts)
+
+LOG = logging.getLogger(__name__)
+
 QUOTAS = quota.QUOTAS
 
 
@@ -128,6 +148,11 @@ class Limit(object):
         self.verb = verb
         self.uri = uri
         self.regex = regex
+        try:
+            self._regex_match = re.compile(regex).match
+        except re.error:
+            # Invalid expressions are only reported once the limit is used.
+            self._regex_match = None
         self.value = int(value)
         self.unit = unit
         self.unit_string = self.display_unit().lower()
@@ -153,7 +178,12 @@ class Limit(object):
         @param verb: string http verb (POST, GET, etc.)
         @param url: string URL
         """
-        if self.verb != verb or not re.match(self.regex, url):
+        if self.verb != verb:
+            return
+
+        if self._regex_match is None:
+            self._regex_match = re.compile(self.regex).match
+        if not self._regex_match(url):
             return
 
         now = self._get_time()
@@ -183,6 +213,11 @@ class Limit(object):
         self.remaining = math.floor(((cap - water) / cap) * val)
         self.next_request = now
 
+    def __deepcopy__(self, memo):
+        # Compiled patterns can not be deep copied, and all the other
+        # attributes are immutable, so a shallow copy is enough.
+        return copy.copy(self)
+
     def _get_time(self):
         """Retrieve the current time. Broken out for testability."""
         return time.time()
@@ -266,14 +301,21 @@ class RateLimitingMiddleware(base_wsgi.Middleware):
         else:
             username = None
 
-        delay, error = self._limiter.check_for_delay(verb, url, username)
+        check = getattr(self._limiter, "check_and_get_limits", None)
+        if check is not None:
+            delay, error, limits = check(verb, url, username)
+        else:
+            delay, error = self._limiter.check_for_delay(verb, url, username)
+            limits = None
 
         if delay:
             msg = _("This request was rate-limited.")
             retry = time.time() + delay
             return wsgi.OverLimitFault(msg, error, retry)
 
-        req.environ["nova.limits"] = self._limiter.get_limits(username)
+        if limits is None:
+            limits = self._limiter.get_limits(username)
+        req.environ["nova.limits"] = limits
 
         return self.application
 
@@ -281,6 +323,10 @@ class RateLimitingMiddleware(base_wsgi.Middleware):
 class Limiter(object):
     """
     Rate-limit checking class which handles limits in memory.
+
+    Every user gets its own copy of the limits.  Users that have been idle
+    for longer than the longest limit unit are forgotten, since their
+    buckets have drained and are the same as new ones by then.
     """
 
     def __init__(self, limits, **kwargs):
@@ -289,20 +335,73 @@ class Limiter(object):
 
         @param limits: List of `Limit` objects
         """
-        self.limits = copy.deepcopy(limits)
-        self.levels = collections.defaultdict(lambda: copy.deepcopy(limits))
+        self.limits = [copy.copy(limit) for limit in limits]
+        self.levels = {}
+        self._last_seen = {}
+        self._seen = collections.deque()
+        self._user_limits = {}
+        self._verb_indexes = {None: self._index_by_verb(self.limits)}
 
         # Pick up any per-user limit information
         for key, value in kwargs.items():
             if key.startswith('user:'):
                 username = key[5:]
-                self.levels[username] = self.parse_limits(value)
+                user_limits = self.parse_limits(value)
+                self._user_limits[username] = user_limits
+                self._verb_indexes[username] = self._index_by_verb(
+                        user_limits)
+
+        units = [limit.unit for limit in self.limits]
+        for user_limits in self._user_limits.values():
+            units.extend(limit.unit for limit in user_limits)
+        self._idle_timeout = max(units or [0])
+
+        for username in self._user_limits:
+            self._get_levels(username)
+
+    @staticmethod
+    def _index_by_verb(limits):
+        """Map each verb to the positions of the limits for it."""
+        index = {}
+        for position, limit in enumerate(limits):
+            index.setdefault(limit.verb, []).append(position)
+        return index
+
+    def _get_time(self):
+        """Retrieve the current time. Broken out for testability."""
+        return time.time()
+
+    def _get_levels(self, username):
+        """Return the limits of a user, forgetting idle users."""
+        now = self._get_time()
+        levels = self.levels.get(username)
+        if levels is None:
+            levels = [copy.copy(limit) for limit in
+                      self._user_limits.get(username, self.limits)]
+            self.levels[username] = levels
+        # Every use is queued in time order, so idle users come first.
+        self._last_seen[username] = now
+        self._seen.append((now, username))
+
+        while self._seen and now - self._seen[0][0] >= self._idle_timeout:
+            seen, idle_username = self._seen.popleft()
+            # The queue keeps entries for users seen again since, so
+            # check when the user was last seen.
+            if self._last_seen.get(idle_username) == seen:
+                del self.levels[idle_username]
+                del self._last_seen[idle_username]
+
+        # Rebuild the queue once stale entries make up most of it.
+        if len(self._seen) > 2 * len(self.levels) + 64:
+            self._seen = collections.deque(sorted(
+                    (seen, name) for name, seen in self._last_seen.items()))
+        return levels
 
     def get_limits(self, username=None):
         """
         Return the limits for a given user.
         """
-        return [limit.display() for limit in self.levels[username]]
+        return [limit.display() for limit in self._get_levels(username)]
 
     def check_for_delay(self, verb, url, username=None):
         """
@@ -312,7 +411,14 @@ class Limiter(object):
         """
         delays = []
 
-        for limit in self.levels[username]:
+        levels = self._get_levels(username)
+        if username in self._user_limits:
+            verb_index = self._verb_indexes[username]
+        else:
+            verb_index = self._verb_indexes[None]
+
+        for position in verb_index.get(verb, ()):
+            limit = levels[position]
             delay = limit(verb, url)
             if delay:
                 delays.append((delay, limit.error_message))
@@ -323,6 +429,16 @@ class Limiter(object):
 
         return None, None
 
+    def check_and_get_limits(self, verb, url, username=None):
+        """
+        Check the given verb/url/user triplet for limit, and return the
+        limits of the user along with the answer.
+
+        @return: Tuple of delay, error message and limits
+        """
+        delay, error = self.check_for_delay(verb, url, username)
+        return delay, error, self.get_limits(username)
+
     # Note: This method gets called before the class is instantiated,
     # so this must be either a static method or a class method.  It is
     # used to develop a list of limits to feed to the constructor.  We
@@ -397,7 +513,8 @@ class WsgiLimiter(object):
 
     and receive a 204 No Content, or a 403 Forbidden with an X-Wait-Seconds
     header containing the number of seconds to wait before the action would
-    succeed.
+    succeed.  If the JSON data also has ``"limits": true``, an acceptable
+    request gets a 200 OK with the current limits of the user instead.
     """
 
     def __init__(self, limits=None):
@@ -432,10 +549,29 @@ class WsgiLimiter(object):
         if delay:
             headers = {"X-Wait-Seconds": "%.2f" % delay}
             return webob.exc.HTTPForbidden(headers=headers, explanation=error)
+        elif info.get("limits"):
+            limits = self._limiter.get_limits(username)
+            return webob.Response(body=jsonutils.dumps({"limits": limits}),
+                                  content_type="application/json")
         else:
             return webob.exc.HTTPNoContent()
 
 
+class UnixHTTPConnection(httplib.HTTPConnection):
+    """
+    HTTP connection over a Unix domain socket.
+    """
+
+    def __init__(self, socket_path):
+        httplib.HTTPConnection.__init__(self, "localhost")
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
 class WsgiLimiterProxy(object):
     """
     Rate-limit requests based on answers from a remote source.
@@ -445,27 +581,40 @@ class WsgiLimiterProxy(object):
         """
         Initialize the new `WsgiLimiterProxy`.
 
-        @param limiter_address: IP/port combination of where to request limit
+        @param limiter_address: IP/port combination of where to request
+                                limit, or unix:<path> of a Unix socket
         """
         self.limiter_address = limiter_address
 
-    def check_for_delay(self, verb, path, username=None):
-        body = jsonutils.dumps({"verb": verb, "path": path})
+    def _connect(self):
+        if self.limiter_address.startswith("unix:"):
+            return UnixHTTPConnection(self.limiter_address[5:])
+        return httplib.HTTPConnection(self.limiter_address)
+
+    def _request(self, username, info):
+        body = jsonutils.dumps(info)
         headers = {"Content-Type": "application/json"}
 
-        conn = httplib.HTTPConnection(self.limiter_address)
+        conn = self._connect()
+        try:
+            if username:
+                conn.request("POST", "/%s" % (username), body, headers)
+            else:
+                conn.request("POST", "/", body, headers)
 
-        if username:
-            conn.request("POST", "/%s" % (username), body, headers)
-        else:
-            conn.request("POST", "/", body, headers)
+            resp = conn.getresponse()
+            return resp.status, resp.getheader("X-Wait-Seconds"), resp.read()
+        finally:
+            conn.close()
 
-        resp = conn.getresponse()
+    def check_for_delay(self, verb, path, username=None):
+        status, delay, body = self._request(username,
+                                            {"verb": verb, "path": path})
 
-        if 200 >= resp.status < 300:
+        if 200 <= status < 300:
             return None, None
 
-        return resp.getheader("X-Wait-Seconds"), resp.read() or None
+        return delay, body or None
 
     # Note: This method gets called before the class is instantiated,
     # so this must be either a static method or a class method.  It is
@@ -482,3 +631,58 @@ class WsgiLimiterProxy(object):
         """
 
         return []
+
+
+class SharedLimiter(WsgiLimiterProxy):
+    """
+    Rate-limit checking class for `RateLimitingMiddleware` which leaves
+    the limits to a `WsgiLimiter` shared by all API workers, such as the
+    one nova-ratelimit serves on a Unix socket.
+
+    Set ``limiter = nova.api.openstack.compute.limits.SharedLimiter`` on
+    the ratelimit filter to use it.  The limits themselves are configured
+    on the shared server, so the limits given here are ignored.
+    """
+
+    def __init__(self, limits=None, limiter_address=None, **kwargs):
+        """
+        Initialize the new `SharedLimiter`.
+
+        @param limits: Ignored, the shared server has its own limits
+        @param limiter_address: Where the shared server listens, defaults
+                                to the ratelimit_socket option
+        """
+        if limiter_address is None:
+            limiter_address = "unix:%s" % CONF.ratelimit_socket
+        super(SharedLimiter, self).__init__(limiter_address)
+
+    def check_for_delay(self, verb, path, username=None):
+        delay, error, _limits = self.check_and_get_limits(verb, path,
+                                                          username)
+        return delay, error
+
+    def check_and_get_limits(self, verb, path, username=None):
+        """
+        Check the given verb/path/user triplet for limit.  The limits of
+        the user come back in the same round trip, so nothing about the
+        request is kept on the limiter, which all requests share.
+
+        @return: Tuple of delay, error message and limits
+        """
+        try:
+            status, delay, body = self._request(username,
+                    {"verb": verb, "path": path, "limits": True})
+        except (socket.error, httplib.HTTPException) as e:
+            # Rather let requests through than fail all of them while the
+            # shared limiter is unavailable.
+            LOG.warn(_("Unable to reach rate limiter at %(address)s: "
+                       "%(e)s") % {'address': self.limiter_address, 'e': e})
+            return None, None, []
+
+        if delay is None:
+            limits = []
+            if status == httplib.OK:
+                limits = jsonutils.loads(body)["limits"]
+            return None, None, limits
+
+        return float(delay), body or None, []
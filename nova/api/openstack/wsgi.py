@@ -99,6 +99,25 @@ class Request(webob.Request):
         """
         return self.get_db_items(key).get(item_key)
 
+    def get_or_fetch_db_items(self, key, item_keys, fetch):
+        """
+        Allow API extensions to share a batched DB lookup within the
+        same API request.
+
+        Returns a dict of the cached objects for item_keys.  Keys not
+        cached yet are passed in a single call to fetch, which must
+        return a dict of key to object; keys it does not return are
+        cached as None so they are not looked up again.
+        """
+        db_items = self._extension_data['db_items'].setdefault(key, {})
+        missing = [item_key for item_key in set(item_keys)
+                   if item_key not in db_items]
+        if missing:
+            fetched = fetch(missing)
+            for item_key in missing:
+                db_items[item_key] = fetched.get(item_key)
+        return dict((item_key, db_items[item_key]) for item_key in item_keys)
+
     def cache_db_instances(self, instances):
         self.cache_db_items('instances', instances, 'uuid')
 
@@ -18,39 +18,116 @@
 
 """Super simple fake memcache client."""
 
+import collections
+import heapq
+import itertools
+
+from nova.openstack.common import cfg
 from nova.openstack.common import timeutils
 
+memorycache_opts = [
+    cfg.IntOpt('memory_cache_max_items',
+               default=100000,
+               help='Maximum number of keys held by the in process cache '
+                    'used when memcached_servers is not set. The least '
+                    'recently used keys are dropped first. 0 means no '
+                    'limit'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(memorycache_opts)
+
 
 class Client(object):
-    """Replicates a tiny subset of memcached client interface."""
+    """Replicates a tiny subset of memcached client interface.
+
+    Every use of a key is appended to a queue in least recently used order,
+    and keys with a timeout are also kept in a heap ordered by expiry time,
+    so no call has to look at keys other than the one it is asked for and
+    the ones it expires or evicts.
+    """
 
     def __init__(self, *args, **kwargs):
         """Ignores the passed in args."""
         self.cache = {}
+        self.max_items = CONF.memory_cache_max_items
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._expiry = []
+        self._recent = collections.deque()
+        self._last_used = {}
+        self._uses = itertools.count()
 
-    def get(self, key):
-        """Retrieves the value for a key or None.
+    def _touch(self, key):
+        """Mark a key as the most recently used one."""
+        use = next(self._uses)
+        self._last_used[key] = use
+        self._recent.append((use, key))
+        # Rebuild the queue once stale entries make up most of it.
+        if len(self._recent) > 2 * len(self.cache) + 64:
+            self._recent = collections.deque(sorted(
+                    (use, key) for key, use in self._last_used.items()))
 
-        this expunges expired keys during each get"""
+    def _forget(self, key):
+        """Drop a key and its use marker."""
+        self.cache.pop(key, None)
+        self._last_used.pop(key, None)
 
-        for k in self.cache.keys():
-            (timeout, _value) = self.cache[k]
-            if timeout and timeutils.utcnow_ts() >= timeout:
-                del self.cache[k]
+    def _expire(self):
+        """Drop the keys whose timeout has passed."""
+        now = timeutils.utcnow_ts()
+        while self._expiry and self._expiry[0][0] <= now:
+            timeout, key = heapq.heappop(self._expiry)
+            # The heap keeps entries for keys that were set again or
+            # deleted since, so check the timeout.
+            if key in self.cache and self.cache[key][0] == timeout:
+                self._forget(key)
 
-        return self.cache.get(key, (0, None))[1]
+    def _evict(self):
+        """Drop the least recently used keys beyond max_items."""
+        while self.max_items and len(self.cache) > self.max_items:
+            use, key = self._recent.popleft()
+            # The queue keeps entries for keys that were used again or
+            # deleted since, so check the use marker.
+            if self._last_used.get(key) == use:
+                self._forget(key)
+                self.evictions += 1
+        # Rebuild the heap once stale entries make up most of it.
+        if len(self._expiry) > 2 * len(self.cache) + 64:
+            self._expiry = [(timeout, key)
+                            for key, (timeout, _value) in self.cache.items()
+                            if timeout]
+            heapq.heapify(self._expiry)
+
+    def get(self, key):
+        """Retrieves the value for a key or None."""
+        self._expire()
+        try:
+            timeout, value = self.cache[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._touch(key)
+        self.hits += 1
+        return value
 
     def set(self, key, value, time=0, min_compress_len=0):
         """Sets the value for a key."""
+        self._expire()
         timeout = 0
         if time != 0:
             timeout = timeutils.utcnow_ts() + time
+            heapq.heappush(self._expiry, (timeout, key))
         self.cache[key] = (timeout, value)
+        self._touch(key)
+        self._evict()
         return True
 
     def add(self, key, value, time=0, min_compress_len=0):
         """Sets the value for a key if it doesn't exist."""
-        if not self.get(key) is None:
+        self._expire()
+        if key in self.cache:
             return False
         return self.set(key, value, time, min_compress_len)
 
@@ -62,3 +139,16 @@ class Client(object):
         new_value = int(value) + delta
         self.cache[key] = (self.cache[key][0], str(new_value))
         return new_value
+
+    def delete(self, key, time=0):
+        """Deletes the value for a key."""
+        self._forget(key)
+        return 1
+
+    def get_stats(self):
+        """Returns hit, miss and eviction counters like memcached does."""
+        self._expire()
+        return [('memorycache', {'get_hits': self.hits,
+                                 'get_misses': self.misses,
+                                 'evictions': self.evictions,
+                                 'curr_items': len(self.cache)})]
@@ -29,6 +29,7 @@ import time
 import urllib
 import uuid
 
+from nova.api.metadata import cache as metadata_cache
 from nova import block_device
 from nova.compute import instance_types
 from nova.compute import power_state
@@ -178,6 +179,7 @@ class API(base.Base):
 
         (old_ref, instance_ref) = self.db.instance_update_and_get_original(
                 context, instance_uuid, kwargs)
+        metadata_cache.invalidate_metadata(instance_uuid)
         notifications.send_update(context, old_ref, instance_ref)
 
         return instance_ref
@@ -850,6 +852,7 @@ class API(base.Base):
         # if task or vm state changed
         old_ref, instance_ref = self.db.instance_update_and_get_original(
                 context, instance['uuid'], kwargs)
+        metadata_cache.invalidate_metadata(instance['uuid'])
         notifications.send_update(context, old_ref, instance_ref,
                 service="api")
 
@@ -2036,6 +2039,7 @@ class API(base.Base):
     def delete_instance_metadata(self, context, instance, key):
         """Delete the given metadata item from an instance."""
         self.db.instance_metadata_delete(context, instance['uuid'], key)
+        metadata_cache.invalidate_metadata(instance['uuid'])
         instance['metadata'] = {}
         notifications.send_update(context, instance, instance)
         self.compute_rpcapi.change_instance_metadata(context,
@@ -2062,6 +2066,7 @@ class API(base.Base):
         self._check_metadata_properties_quota(context, _metadata)
         metadata = self.db.instance_metadata_update(context, instance['uuid'],
                                          _metadata, True)
+        metadata_cache.invalidate_metadata(instance['uuid'])
         instance['metadata'] = metadata
         notifications.send_update(context, instance, instance)
         diff = utils.diff_dict(orig, _metadata)
@@ -2905,27 +2905,27 @@ class ComputeManager(manager.SchedulerDependentManager):
                 return
 
             refreshed = timeutils.utcnow()
+            uuids = list(set(bw_ctr['uuid'] for bw_ctr in bw_counters))
+            curr_usages = self._get_bw_usages_by_mac(context, uuids,
+                                                     start_time)
+            prev_usages = self._get_bw_usages_by_mac(context, uuids,
+                                                     prev_time)
+
+            updates = []
             for bw_ctr in bw_counters:
-                # Allow switching of greenthreads between queries.
-                greenthread.sleep(0)
                 bw_in = 0
                 bw_out = 0
                 last_ctr_in = None
                 last_ctr_out = None
-                usage = self.db.bw_usage_get(context,
-                                             bw_ctr['uuid'],
-                                             start_time,
-                                             bw_ctr['mac_address'])
+                key = (bw_ctr['uuid'], bw_ctr['mac_address'])
+                usage = curr_usages.get(key)
                 if usage:
                     bw_in = usage['bw_in']
                     bw_out = usage['bw_out']
                     last_ctr_in = usage['last_ctr_in']
                     last_ctr_out = usage['last_ctr_out']
                 else:
-                    usage = self.db.bw_usage_get(context,
-                                             bw_ctr['uuid'],
-                                             prev_time,
-                                             bw_ctr['mac_address'])
+                    usage = prev_usages.get(key)
                     if usage:
                         last_ctr_in = usage['last_ctr_in']
                         last_ctr_out = usage['last_ctr_out']
@@ -2944,15 +2944,23 @@ class ComputeManager(manager.SchedulerDependentManager):
                     else:
                         bw_out += (bw_ctr['bw_out'] - last_ctr_out)
 
-                self.db.bw_usage_update(context,
-                                        bw_ctr['uuid'],
-                                        bw_ctr['mac_address'],
-                                        start_time,
-                                        bw_in,
-                                        bw_out,
-                                        bw_ctr['bw_in'],
-                                        bw_ctr['bw_out'],
-                                        last_refreshed=refreshed)
+                updates.append({'uuid': bw_ctr['uuid'],
+                                'mac': bw_ctr['mac_address'],
+                                'bw_in': bw_in,
+                                'bw_out': bw_out,
+                                'last_ctr_in': bw_ctr['bw_in'],
+                                'last_ctr_out': bw_ctr['bw_out']})
+
+            self.db.bw_usage_bulk_update(context, start_time, updates,
+                                         last_refreshed=refreshed)
+
+    def _get_bw_usages_by_mac(self, context, uuids, start_period):
+        """Return bw usages of the instances keyed by (uuid, mac)."""
+        if not uuids:
+            return {}
+        usages = self.db.bw_usage_get_by_uuids(context, uuids, start_period)
+        return dict(((usage['uuid'], usage['mac']), usage)
+                    for usage in usages)
 
     @manager.periodic_task
     def _report_driver_status(self, context):
@@ -2968,15 +2976,65 @@ class ComputeManager(manager.SchedulerDependentManager):
                 capability['host_ip'] = CONF.my_ip
             self.update_service_capabilities(capabilities)
 
+    def _query_power_states(self, db_instances):
+        """Return the hypervisor power state of each instance by uuid.
+
+        Uses a single driver.get_power_states() call when the driver has
+        one and falls back to one driver.get_info() call per instance.
+        """
+        try:
+            vm_power_states = self.driver.get_power_states()
+        except NotImplementedError:
+            vm_power_states = None
+
+        power_states = {}
+        for db_instance in db_instances:
+            if vm_power_states is not None:
+                vm_power_state = vm_power_states.get(db_instance['name'],
+                                                     power_state.NOSTATE)
+            else:
+                try:
+                    vm_instance = self.driver.get_info(db_instance)
+                    vm_power_state = vm_instance['state']
+                except exception.InstanceNotFound:
+                    vm_power_state = power_state.NOSTATE
+            power_states[db_instance['uuid']] = vm_power_state
+        return power_states
+
+    @staticmethod
+    def _power_state_needs_sync(vm_state, db_power_state, vm_power_state):
+        """Whether _sync_power_states may have to act on an instance.
+
+        Mirrors the checks made by _sync_power_states so that instances
+        already in sync are not re-read from the database.
+        """
+        if vm_power_state != db_power_state:
+            return True
+        if vm_state == vm_states.ACTIVE:
+            return vm_power_state in (power_state.NOSTATE,
+                                      power_state.SHUTDOWN,
+                                      power_state.CRASHED,
+                                      power_state.PAUSED,
+                                      power_state.SUSPENDED)
+        if vm_state == vm_states.STOPPED:
+            return vm_power_state not in (power_state.NOSTATE,
+                                          power_state.SHUTDOWN,
+                                          power_state.CRASHED)
+        if vm_state in (vm_states.SOFT_DELETED, vm_states.DELETED):
+            return vm_power_state not in (power_state.NOSTATE,
+                                          power_state.SHUTDOWN)
+        return False
+
     @manager.periodic_task(ticks_between_runs=10)
     def _sync_power_states(self, context):
         """Align power states between the database and the hypervisor.
 
         To sync power state data we make a DB call to get the number of
         virtual machines known by the hypervisor and if the number matches the
-        number of virtual machines known by the database, we proceed in a lazy
-        loop, one database record at a time, checking if the hypervisor has the
-        same power state as is in the database.
+        number of virtual machines known by the database, we proceed to ask
+        the hypervisor for the power state of all of them at once.  The
+        instances whose power state does not match the database are then
+        re-read in a single DB call and synced one at a time.
 
         If the instance is not found on the hypervisor, but is in the database,
         then a stop() API will be called on the instance.
@@ -2990,24 +3048,43 @@ class ComputeManager(manager.SchedulerDependentManager):
             LOG.warn(_("Found %(num_db_instances)s in the database and "
                        "%(num_vm_instances)s on the hypervisor.") % locals())
 
+        idle_instances = []
         for db_instance in db_instances:
-            db_power_state = db_instance['power_state']
             if db_instance['task_state'] is not None:
                 LOG.info(_("During sync_power_state the instance has a "
                            "pending task. Skip."), instance=db_instance)
                 continue
-            # No pending tasks. Now try to figure out the real vm_power_state.
-            try:
-                vm_instance = self.driver.get_info(db_instance)
-                vm_power_state = vm_instance['state']
-            except exception.InstanceNotFound:
-                vm_power_state = power_state.NOSTATE
-            # Note(maoy): the above get_info call might take a long time,
-            # for example, because of a broken libvirt driver.
-            # We re-query the DB to get the latest instance info to minimize
-            # (not eliminate) race condition.
-            u = self.conductor_api.instance_get_by_uuid(context,
-                                                        db_instance['uuid'])
+            idle_instances.append(db_instance)
+
+        # No pending tasks. Now try to figure out the real vm_power_states.
+        vm_power_states = self._query_power_states(idle_instances)
+        changed_instances = [db_instance for db_instance in idle_instances
+                             if self._power_state_needs_sync(
+                                 db_instance['vm_state'],
+                                 db_instance['power_state'],
+                                 vm_power_states[db_instance['uuid']])]
+        if not changed_instances:
+            return
+
+        # Note(maoy): the above power state query might take a long time,
+        # for example, because of a broken libvirt driver.
+        # We re-query the DB to get the latest instance info to minimize
+        # (not eliminate) race condition.
+        # NOTE: filtering on 'deleted' would also drop SOFT_DELETED
+        # instances, which still need their power state checked, so only
+        # deleted rows are skipped below.
+        uuids = [db_instance['uuid'] for db_instance in changed_instances]
+        current_instances = {}
+        for instance in self.conductor_api.instance_get_all_by_filters(
+                context, {'uuid': uuids}):
+            current_instances[instance['uuid']] = instance
+
+        for db_instance in changed_instances:
+            vm_power_state = vm_power_states[db_instance['uuid']]
+            u = current_instances.get(db_instance['uuid'])
+            if u is None or u['deleted']:
+                # The instance was deleted while we were looking at it.
+                continue
             db_power_state = u["power_state"]
             vm_state = u['vm_state']
             if self.host != u['host']:
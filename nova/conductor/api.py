@@ -53,6 +53,11 @@ class LocalAPI(object):
     def instance_get_all_by_host(self, context, host):
         return self._manager.instance_get_all_by_host(context, host)
 
+    def instance_get_all_by_filters(self, context, filters,
+                                    sort_key='created_at', sort_dir='desc'):
+        return self._manager.instance_get_all_by_filters(context, filters,
+                                                         sort_key, sort_dir)
+
     def migration_update(self, context, migration, status):
         return self._manager.migration_update(context, migration, status)
 
@@ -81,6 +86,13 @@ class API(object):
     def instance_get_all_by_host(self, context, host):
         return self.conductor_rpcapi.instance_get_all_by_host(context, host)
 
+    def instance_get_all_by_filters(self, context, filters,
+                                    sort_key='created_at', sort_dir='desc'):
+        return self.conductor_rpcapi.instance_get_all_by_filters(context,
+                                                                 filters,
+                                                                 sort_key,
+                                                                 sort_dir)
+
     def migration_update(self, context, migration, status):
         return self.conductor_rpcapi.migration_update(context, migration,
                                                       status)
@@ -30,6 +30,7 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
     1.1 - Added migration_update
     1.2 - Added instance_get_by_uuid and instance_get_all_by_host
     1.3 - Added aggregate_host_add and aggregate_host_delete
+    1.4 - Added instance_get_all_by_filters
     """
 
     BASE_RPC_API_VERSION = '1.0'
@@ -55,6 +56,12 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         msg = self.make_msg('instance_get_all_by_host', host=host)
         return self.call(context, msg, version='1.2')
 
+    def instance_get_all_by_filters(self, context, filters, sort_key,
+                                    sort_dir):
+        msg = self.make_msg('instance_get_all_by_filters', filters=filters,
+                            sort_key=sort_key, sort_dir=sort_dir)
+        return self.call(context, msg, version='1.4')
+
     def migration_update(self, context, migration, status):
         migration_p = jsonutils.to_primitive(migration)
         msg = self.make_msg('migration_update', migration=migration_p,
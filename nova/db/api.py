@@ -139,6 +139,11 @@ def service_get_all_by_host(context, host):
     return IMPL.service_get_all_by_host(context, host)
 
 
+def service_get_all_by_hosts(context, hosts):
+    """Get all services for a list of hosts."""
+    return IMPL.service_get_all_by_hosts(context, hosts)
+
+
 def service_get_all_compute_by_host(context, host):
     """Get all compute services for a given host."""
     return IMPL.service_get_all_compute_by_host(context, host)
@@ -180,9 +185,13 @@ def compute_node_get(context, compute_id):
     return IMPL.compute_node_get(context, compute_id)
 
 
-def compute_node_get_all(context):
-    """Get all computeNodes."""
-    return IMPL.compute_node_get_all(context)
+def compute_node_get_all(context, updated_since=None):
+    """Get all computeNodes.
+
+    If updated_since is given, only return computeNodes created or
+    updated after that time.
+    """
+    return IMPL.compute_node_get_all(context, updated_since=updated_since)
 
 
 def compute_node_search_by_hypervisor(context, hypervisor_match):
@@ -207,6 +216,11 @@ def compute_node_get_by_host(context, host):
     return IMPL.compute_node_get_by_host(context, host)
 
 
+def compute_node_get_by_hosts(context, hosts):
+    """Get compute nodes, with their service, for a list of hosts."""
+    return IMPL.compute_node_get_by_hosts(context, hosts)
+
+
 def compute_node_statistics(context):
     return IMPL.compute_node_statistics(context)
 
@@ -442,7 +456,10 @@ def fixed_ip_create(context, values):
 
 
 def fixed_ip_bulk_create(context, ips):
-    """Create a lot of fixed ips from the values dictionary."""
+    """Create a lot of fixed ips from a list of values dictionaries.
+
+    All of the dictionaries must have the same keys.
+    """
     return IMPL.fixed_ip_bulk_create(context, ips)
 
 
@@ -491,6 +508,27 @@ def fixed_ips_by_virtual_interface(context, vif_id):
     return IMPL.fixed_ips_by_virtual_interface(context, vif_id)
 
 
+def fixed_ips_get_by_address_filter(context, address_like=None,
+                                    address=None):
+    """Get the interface fixed ips matching an address filter.
+
+    A fixed ip matches if its address is LIKE address_like or equal to
+    address, or if the address of one of its floating ips is LIKE
+    address_like.  address_like uses '!' as its escape character.
+    """
+    return IMPL.fixed_ips_get_by_address_filter(context, address_like,
+                                                address)
+
+
+def fixed_ips_get_by_virtual_interfaces(context, vif_ids):
+    """Get the fixed ips of a list of virtual interfaces.
+
+    Returns a row per floating ip of each fixed ip, in the same format
+    as fixed_ips_get_by_address_filter.
+    """
+    return IMPL.fixed_ips_get_by_virtual_interfaces(context, vif_ids)
+
+
 def fixed_ip_update(context, address, values):
     """Create a fixed ip from the values dictionary."""
     return IMPL.fixed_ip_update(context, address, values)
@@ -523,6 +561,11 @@ def virtual_interface_get_by_instance(context, instance_id):
     return IMPL.virtual_interface_get_by_instance(context, instance_id)
 
 
+def virtual_interface_get_by_instances(context, instance_uuids):
+    """Gets all virtual_interfaces for a list of instances."""
+    return IMPL.virtual_interface_get_by_instances(context, instance_uuids)
+
+
 def virtual_interface_get_by_instance_and_network(context, instance_id,
                                                            network_id):
     """Gets all virtual interfaces for instance."""
@@ -811,7 +854,11 @@ def network_get_all_by_uuids(context, network_uuids,
 
 
 def network_get_associated_fixed_ips(context, network_id, host=None):
-    """Get all network's ips that have been associated."""
+    """Get all network's ips that have been associated.
+
+    default_route is set for the ips on the first interface of their
+    instance.
+    """
     return IMPL.network_get_associated_fixed_ips(context, network_id, host)
 
 
@@ -1049,6 +1096,15 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid):
                                                          instance_uuid)
 
 
+def block_device_mapping_get_all_by_instances(context, instance_uuids):
+    """Get all block device mapping belonging to a list of instances.
+
+    Returns a dict of instance uuid to the list of its block device mapping.
+    """
+    return IMPL.block_device_mapping_get_all_by_instances(context,
+                                                          instance_uuids)
+
+
 def block_device_mapping_destroy(context, bdm_id):
     """Destroy the block device mapping."""
     return IMPL.block_device_mapping_destroy(context, bdm_id)
@@ -1096,6 +1152,14 @@ def security_group_get_by_instance(context, instance_id):
     return IMPL.security_group_get_by_instance(context, instance_id)
 
 
+def security_group_get_by_instances(context, instance_uuids):
+    """Get security groups for a list of instances.
+
+    Returns a dict of instance uuid to the list of its security groups.
+    """
+    return IMPL.security_group_get_by_instances(context, instance_uuids)
+
+
 def security_group_exists(context, project_id, group_name):
     """Indicates if a group name exists in a project."""
     return IMPL.security_group_exists(context, project_id, group_name)
@@ -1409,6 +1473,16 @@ def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
             bw_out, last_ctr_in, last_ctr_out, last_refreshed=last_refreshed)
 
 
+def bw_usage_bulk_update(context, start_period, usages, last_refreshed=None):
+    """Update cached bandwidth usage for many instance networks at once.
+
+    usages is a list of dicts with uuid, mac, bw_in, bw_out, last_ctr_in
+    and last_ctr_out keys.  Creates new records where needed.
+    """
+    return IMPL.bw_usage_bulk_update(context, start_period, usages,
+                                     last_refreshed=last_refreshed)
+
+
 ####################
 
 
@@ -1443,6 +1517,11 @@ def s3_image_get_by_uuid(context, image_uuid):
     return IMPL.s3_image_get_by_uuid(context, image_uuid)
 
 
+def s3_image_get_by_uuids(context, image_uuids):
+    """Find local s3 images represented by the provided uuids"""
+    return IMPL.s3_image_get_by_uuids(context, image_uuids)
+
+
 def s3_image_create(context, image_uuid):
     """Create local s3 image represented by provided uuid"""
     return IMPL.s3_image_create(context, image_uuid)
@@ -1542,6 +1621,11 @@ def get_ec2_instance_id_by_uuid(context, instance_id):
     return IMPL.get_ec2_instance_id_by_uuid(context, instance_id)
 
 
+def ec2_instance_get_by_uuids(context, instance_uuids):
+    """Get the instance_id_mappings rows of a list of instance uuids"""
+    return IMPL.ec2_instance_get_by_uuids(context, instance_uuids)
+
+
 def get_instance_uuid_by_ec2_id(context, ec2_id):
     """Get uuid through ec2 id from instance_id_mappings table"""
     return IMPL.get_instance_uuid_by_ec2_id(context, ec2_id)
@@ -23,14 +23,18 @@ import collections
 import copy
 import datetime
 import functools
+import random
 import uuid
 
 from sqlalchemy import and_
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import or_
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm import contains_eager
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import joinedload_all
 from sqlalchemy.sql.expression import asc
+from sqlalchemy.sql.expression import bindparam
 from sqlalchemy.sql.expression import desc
 from sqlalchemy.sql.expression import literal_column
 from sqlalchemy.sql import func
@@ -353,6 +357,16 @@ def service_get_all_by_host(context, host):
                 all()
 
 
+@require_admin_context
+def service_get_all_by_hosts(context, hosts):
+    if not hosts:
+        return []
+    return model_query(context, models.Service, read_deleted="no").\
+                filter(models.Service.host.in_(hosts)).\
+                order_by(models.Service.id).\
+                all()
+
+
 @require_admin_context
 def service_get_all_compute_by_host(context, host):
     result = model_query(context, models.Service, read_deleted="no").\
@@ -457,11 +471,15 @@ def _compute_node_get(context, compute_id, session=None):
 
 
 @require_admin_context
-def compute_node_get_all(context):
-    return model_query(context, models.ComputeNode).\
+def compute_node_get_all(context, updated_since=None):
+    query = model_query(context, models.ComputeNode).\
             options(joinedload('service')).\
-            options(joinedload('stats')).\
-            all()
+            options(joinedload('stats'))
+    if updated_since is not None:
+        query = query.filter(or_(
+                models.ComputeNode.created_at > updated_since,
+                models.ComputeNode.updated_at > updated_since))
+    return query.all()
 
 
 @require_admin_context
@@ -555,6 +573,18 @@ def compute_node_get_by_host(context, host):
     return result
 
 
+def compute_node_get_by_hosts(context, hosts):
+    if not hosts:
+        return []
+    return model_query(context, models.ComputeNode).\
+            join('service').\
+            options(contains_eager('service')).\
+            filter(models.Service.host.in_(hosts)).\
+            filter(models.Service.deleted == False).\
+            order_by(models.ComputeNode.id).\
+            all()
+
+
 def compute_node_statistics(context):
     """Compute statistics over all compute nodes."""
     result = model_query(context,
@@ -1015,32 +1045,55 @@ def fixed_ip_associate_pool(context, network_id, instance_uuid=None,
         raise exception.InvalidUUID(uuid=instance_uuid)
 
     session = get_session()
-    with session.begin():
-        network_or_none = or_(models.FixedIp.network_id == network_id,
-                              models.FixedIp.network_id == None)
-        fixed_ip_ref = model_query(context, models.FixedIp, session=session,
-                                   read_deleted="no").\
-                               filter(network_or_none).\
-                               filter_by(reserved=False).\
-                               filter_by(instance_uuid=None).\
-                               filter_by(host=None).\
-                               with_lockmode('update').\
+    network_or_none = or_(models.FixedIp.network_id == network_id,
+                          models.FixedIp.network_id == None)
+
+    def _free_ips():
+        return model_query(context, models.FixedIp, session=session,
+                           read_deleted="no").\
+                       filter(network_or_none).\
+                       filter_by(reserved=False).\
+                       filter_by(instance_uuid=None).\
+                       filter_by(host=None)
+
+    min_id, max_id = session.query(func.min(models.FixedIp.id),
+                                   func.max(models.FixedIp.id)).\
+                             filter(network_or_none).\
+                             first()
+    if min_id is None:
+        raise exception.NoMoreFixedIps()
+
+    # Rather than locking the first free row, which every concurrent
+    # allocation would queue on, pick the first free row after a random
+    # point and claim it only if it is still free. Losing the race to
+    # another allocation just means probing again, and the loop ends once
+    # no free row is left.
+    values = {'network_id': network_id}
+    if instance_uuid:
+        values['instance_uuid'] = instance_uuid
+    if host:
+        values['host'] = host
+
+    while True:
+        probe = random.randint(min_id, max_id)
+        fixed_ip_ref = _free_ips().\
+                               filter(models.FixedIp.id >= probe).\
+                               order_by(asc(models.FixedIp.id)).\
+                               first()
+        if not fixed_ip_ref:
+            fixed_ip_ref = _free_ips().\
+                               filter(models.FixedIp.id < probe).\
+                               order_by(desc(models.FixedIp.id)).\
                                first()
-        # NOTE(vish): if with_lockmode isn't supported, as in sqlite,
-        #             then this has concurrency issues
         if not fixed_ip_ref:
             raise exception.NoMoreFixedIps()
 
-        if fixed_ip_ref['network_id'] is None:
-            fixed_ip_ref['network'] = network_id
-
-        if instance_uuid:
-            fixed_ip_ref['instance_uuid'] = instance_uuid
-
-        if host:
-            fixed_ip_ref['host'] = host
-        session.add(fixed_ip_ref)
-    return fixed_ip_ref['address']
+        with session.begin():
+            claimed = _free_ips().\
+                              filter_by(id=fixed_ip_ref['id']).\
+                              update(values, synchronize_session=False)
+        if claimed:
+            return fixed_ip_ref['address']
 
 
 @require_context
@@ -1053,12 +1106,13 @@ def fixed_ip_create(context, values):
 
 @require_context
 def fixed_ip_bulk_create(context, ips):
+    if not ips:
+        return
     session = get_session()
     with session.begin():
-        for ip in ips:
-            model = models.FixedIp()
-            model.update(ip)
-            session.add(model)
+        # A single multi-row insert, rather than one per address, as a
+        # network can have tens of thousands of them.
+        session.execute(models.FixedIp.__table__.insert(), ips)
 
 
 @require_context
@@ -1214,6 +1268,73 @@ def fixed_ips_by_virtual_interface(context, vif_id):
     return result
 
 
+def _fixed_ip_vif_floating_query(session):
+    """Query interface fixed ips joined to their floating addresses.
+
+    Each row is (fixed ip id, fixed address, vif id, instance uuid,
+    floating address), one per floating ip of the fixed ip or a single
+    row with a floating address of None.
+    """
+    vif_and = and_(models.VirtualInterface.id ==
+                   models.FixedIp.virtual_interface_id,
+                   models.VirtualInterface.instance_uuid != None)
+    floating_and = and_(models.FloatingIp.fixed_ip_id == models.FixedIp.id,
+                        models.FloatingIp.deleted == False)
+    return session.query(models.FixedIp.id,
+                         models.FixedIp.address,
+                         models.VirtualInterface.id,
+                         models.VirtualInterface.instance_uuid,
+                         models.FloatingIp.address).\
+                   filter(models.FixedIp.deleted == False).\
+                   join((models.VirtualInterface, vif_and)).\
+                   outerjoin((models.FloatingIp, floating_and))
+
+
+def _fixed_ip_vif_floating_rows(query):
+    return [{'id': fixed_ip_id,
+             'address': fixed_address,
+             'virtual_interface_id': vif_id,
+             'instance_uuid': instance_uuid,
+             'floating_address': floating_address}
+            for (fixed_ip_id, fixed_address, vif_id, instance_uuid,
+                 floating_address) in query.all()]
+
+
+@require_context
+def fixed_ips_get_by_address_filter(context, address_like=None,
+                                    address=None):
+    session = get_session()
+
+    # Each half of the union filters on a single indexed address
+    # column, which an OR across the joined tables would not.
+    fixed_filters = []
+    if address_like is not None:
+        fixed_filters.append(models.FixedIp.address.like(address_like,
+                                                         escape='!'))
+    if address is not None:
+        fixed_filters.append(models.FixedIp.address == address)
+    if not fixed_filters:
+        return []
+
+    query = _fixed_ip_vif_floating_query(session).\
+                    filter(or_(*fixed_filters))
+    if address_like is not None:
+        query = query.union(_fixed_ip_vif_floating_query(session).filter(
+                models.FloatingIp.address.like(address_like, escape='!')))
+
+    return _fixed_ip_vif_floating_rows(query)
+
+
+@require_context
+def fixed_ips_get_by_virtual_interfaces(context, vif_ids):
+    if not vif_ids:
+        return []
+    query = _fixed_ip_vif_floating_query(get_session()).\
+                    filter(models.FixedIp.virtual_interface_id.in_(vif_ids)).\
+                    order_by(models.FixedIp.id)
+    return _fixed_ip_vif_floating_rows(query)
+
+
 @require_context
 def fixed_ip_update(context, address, values):
     session = get_session()
@@ -1299,6 +1420,22 @@ def virtual_interface_get_by_instance(context, instance_uuid):
     return vif_refs
 
 
+@require_context
+def virtual_interface_get_by_instances(context, instance_uuids):
+    """Gets all virtual interfaces for a list of instances.
+
+    :param instance_uuids: = uuids of the instances to retrieve vifs for
+    """
+    if not instance_uuids:
+        return []
+    vif_refs = _virtual_interface_query(context).\
+                       filter(models.VirtualInterface.instance_uuid.in_(
+                               instance_uuids)).\
+                       order_by(models.VirtualInterface.id).\
+                       all()
+    return vif_refs
+
+
 @require_context
 def virtual_interface_get_by_instance_and_network(context, instance_uuid,
                                                   network_id):
@@ -2203,6 +2340,13 @@ def network_get_associated_fixed_ips(context, network_id, host=None):
     inst_and = and_(models.Instance.uuid == models.FixedIp.instance_uuid,
                     models.Instance.deleted == False)
     session = get_session()
+    # The first interface of an instance is the one given a default route
+    first_vif = aliased(models.VirtualInterface)
+    first_vif_id = session.query(func.min(first_vif.id)).\
+                          filter(first_vif.instance_uuid ==
+                                 models.FixedIp.instance_uuid).\
+                          correlate(models.FixedIp).\
+                          as_scalar()
     query = session.query(models.FixedIp.address,
                           models.FixedIp.instance_uuid,
                           models.FixedIp.network_id,
@@ -2210,7 +2354,8 @@ def network_get_associated_fixed_ips(context, network_id, host=None):
                           models.VirtualInterface.address,
                           models.Instance.hostname,
                           models.Instance.updated_at,
-                          models.Instance.created_at).\
+                          models.Instance.created_at,
+                          first_vif_id).\
                           filter(models.FixedIp.deleted == False).\
                           filter(models.FixedIp.network_id == network_id).\
                           filter(models.FixedIp.allocated == True).\
@@ -2232,6 +2377,7 @@ def network_get_associated_fixed_ips(context, network_id, host=None):
         cleaned['instance_hostname'] = datum[5]
         cleaned['instance_updated'] = datum[6]
         cleaned['instance_created'] = datum[7]
+        cleaned['default_route'] = datum[3] == datum[8]
         data.append(cleaned)
     return data
 
@@ -2997,6 +3143,21 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid):
                  all()
 
 
+@require_context
+def block_device_mapping_get_all_by_instances(context, instance_uuids):
+    result = dict((instance_uuid, []) for instance_uuid in instance_uuids)
+    if not instance_uuids:
+        return result
+    bdms = _block_device_mapping_get_query(context).\
+                 filter(models.BlockDeviceMapping.instance_uuid.in_(
+                         instance_uuids)).\
+                 order_by(models.BlockDeviceMapping.id).\
+                 all()
+    for bdm in bdms:
+        result[bdm['instance_uuid']].append(bdm)
+    return result
+
+
 @require_context
 def block_device_mapping_destroy(context, bdm_id):
     session = get_session()
@@ -3126,6 +3287,25 @@ def security_group_get_by_instance(context, instance_id):
                    all()
 
 
+@require_context
+def security_group_get_by_instances(context, instance_uuids):
+    result = dict((instance_uuid, []) for instance_uuid in instance_uuids)
+    if not instance_uuids:
+        return result
+    association = models.SecurityGroupInstanceAssociation
+    rows = model_query(context, models.SecurityGroup,
+                       association.instance_uuid, read_deleted="no").\
+                   join(association, and_(
+                       association.security_group_id ==
+                           models.SecurityGroup.id,
+                       association.deleted == False)).\
+                   filter(association.instance_uuid.in_(instance_uuids)).\
+                   all()
+    for group, instance_uuid in rows:
+        result[instance_uuid].append(group)
+    return result
+
+
 @require_context
 def security_group_exists(context, project_id, group_name):
     try:
@@ -4057,6 +4237,53 @@ def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
         bwusage.save(session=session)
 
 
+@require_context
+def bw_usage_bulk_update(context, start_period, usages, last_refreshed=None):
+    if not usages:
+        return
+
+    if last_refreshed is None:
+        last_refreshed = timeutils.utcnow()
+
+    session = get_session()
+    with session.begin():
+        uuids = set(usage['uuid'] for usage in usages)
+        rows = model_query(context, models.BandwidthUsage,
+                           session=session, read_deleted="yes").\
+                      filter(models.BandwidthUsage.uuid.in_(uuids)).\
+                      filter_by(start_period=start_period).\
+                      all()
+        row_ids = dict(((row['uuid'], row['mac']), row['id'])
+                       for row in rows)
+
+        updates = []
+        inserts = []
+        for usage in usages:
+            values = {'last_refreshed': last_refreshed,
+                      'last_ctr_in': usage['last_ctr_in'],
+                      'last_ctr_out': usage['last_ctr_out'],
+                      'bw_in': usage['bw_in'],
+                      'bw_out': usage['bw_out']}
+            row_id = row_ids.get((usage['uuid'], usage['mac']))
+            if row_id is not None:
+                values['row_id'] = row_id
+                updates.append(values)
+            else:
+                values.update({'uuid': usage['uuid'],
+                               'mac': usage['mac'],
+                               'start_period': start_period})
+                inserts.append(values)
+
+        # Each of these is a single executemany round trip instead of one
+        # statement per instance network.
+        table = models.BandwidthUsage.__table__
+        if updates:
+            session.execute(table.update().where(
+                    table.c.id == bindparam('row_id')), updates)
+        if inserts:
+            session.execute(table.insert(), inserts)
+
+
 ####################
 
 
@@ -4158,6 +4385,13 @@ def s3_image_get_by_uuid(context, image_uuid):
     return result
 
 
+def s3_image_get_by_uuids(context, image_uuids):
+    """Find local s3 images represented by the provided uuids"""
+    return model_query(context, models.S3Image, read_deleted="yes").\
+                 filter(models.S3Image.uuid.in_(image_uuids)).\
+                 all()
+
+
 def s3_image_create(context, image_uuid):
     """Create local s3 image represented by provided uuid"""
     try:
@@ -4491,6 +4725,15 @@ def get_ec2_instance_id_by_uuid(context, instance_id, session=None):
     return result['id']
 
 
+@require_context
+def ec2_instance_get_by_uuids(context, instance_uuids):
+    if not instance_uuids:
+        return []
+    return _ec2_instance_get_query(context).\
+                    filter(models.InstanceIdMapping.uuid.in_(instance_uuids)).\
+                    all()
+
+
 @require_context
 def get_instance_uuid_by_ec2_id(context, ec2_id, session=None):
     result = _ec2_instance_get_query(context,
@@ -17,11 +17,21 @@
 Filter support
 """
 
+import time
+
 from nova import loadables
 
 
 class BaseFilter(object):
     """Base class for all filter classes."""
+
+    # Set this to True in a subclass if the result for an object only
+    # depends on the object and the request, and not on anything that
+    # changes while the request is handled (such as resources consumed on
+    # a host).  The result for each object is then computed only once per
+    # request when a FilterCache is used.
+    run_filter_once_per_request = False
+
     def _filter_one(self, obj, filter_properties):
         """Return True if it passes the filter, False otherwise.
         Override this in a subclass.
@@ -40,14 +50,94 @@ class BaseFilter(object):
                 yield obj
 
 
+class FilterCache(object):
+    """Filter instances and results kept for the length of one request.
+
+    The same filter instance is used for every filtering pass of the
+    request, and the results of filters that run once per request are
+    remembered for each object.
+    """
+    def __init__(self):
+        self._filters = {}
+        self._results = {}
+
+    def get_filter(self, filter_cls):
+        """Return the instance of filter_cls used for this request."""
+        filter_obj = self._filters.get(filter_cls)
+        if filter_obj is None:
+            filter_obj = filter_cls()
+            self._filters[filter_cls] = filter_obj
+        return filter_obj
+
+    def filter_all(self, filter_obj, objs, filter_properties):
+        """Return the objects in objs that pass filter_obj, only running
+        the filter for objects it has not seen yet during this request.
+        """
+        results = self._results.setdefault(filter_obj.__class__, {})
+        new_objs = [obj for obj in objs if obj not in results]
+        if new_objs:
+            passed = set(filter_obj.filter_all(new_objs, filter_properties))
+            for obj in new_objs:
+                results[obj] = obj in passed
+        return [obj for obj in objs if results[obj]]
+
+
 class BaseFilterHandler(loadables.BaseLoader):
     """Base class to handle loading filter classes.
 
     This class should be subclassed where one needs to use filters.
     """
 
+    def __init__(self, loadable_cls_type):
+        super(BaseFilterHandler, self).__init__(loadable_cls_type)
+        # { filter class : { 'time': t, 'objects': n, 'passed': n } }
+        self.filter_stats = {}
+
+    def _record_filter_stats(self, filter_cls, elapsed, num_objs,
+                             num_passed):
+        stats = self.filter_stats.setdefault(filter_cls,
+                dict(time=0.0, objects=0, passed=0))
+        stats['time'] += elapsed
+        stats['objects'] += num_objs
+        stats['passed'] += num_passed
+
+    def _filter_cost(self, filter_cls):
+        """Return the measured cost of a filter per object it rejects.
+
+        Filters that have not been measured yet cost nothing, so that they
+        run early and get measured.
+        """
+        stats = self.filter_stats.get(filter_cls)
+        if not stats or not stats['objects']:
+            return 0.0
+        time_per_obj = stats['time'] / stats['objects']
+        rejected = 1.0 - float(stats['passed']) / stats['objects']
+        return time_per_obj / max(rejected, 0.01)
+
+    def order_by_cost(self, filter_classes):
+        """Return filter_classes ordered so that cheap filters which
+        reject many objects run before expensive or unselective ones.
+        """
+        return sorted(filter_classes, key=self._filter_cost)
+
     def get_filtered_objects(self, filter_classes, objs,
-            filter_properties):
+            filter_properties, filter_cache=None):
+        objs = list(objs)
         for filter_cls in filter_classes:
-            objs = filter_cls().filter_all(objs, filter_properties)
-        return list(objs)
+            if not objs:
+                break
+            num_objs = len(objs)
+            start = time.time()
+            if filter_cache is None:
+                filter_obj = filter_cls()
+            else:
+                filter_obj = filter_cache.get_filter(filter_cls)
+            if filter_cache is not None and \
+                    filter_cls.run_filter_once_per_request:
+                objs = filter_cache.filter_all(filter_obj, objs,
+                                               filter_properties)
+            else:
+                objs = list(filter_obj.filter_all(objs, filter_properties))
+            self._record_filter_stats(filter_obj.__class__,
+                    time.time() - start, num_objs, len(objs))
+        return objs
@@ -60,11 +60,28 @@ from nova.openstack.common import cfg
 from nova.openstack.common import log as logging
 from nova.openstack.common.plugin import pluginmanager
 from nova.openstack.common.rpc import dispatcher as rpc_dispatcher
+from nova.openstack.common import timeutils
 from nova.scheduler import rpcapi as scheduler_rpcapi
+from nova import utils
 from nova import version
 
+periodic_opts = [
+    cfg.IntOpt('periodic_task_concurrency',
+               default=1,
+               help='Number of periodic tasks of a manager that may run at '
+                    'the same time. With 1 the tasks run one after another'),
+    cfg.IntOpt('periodic_task_budget',
+               default=0,
+               help='Seconds a periodic task may run before it is counted '
+                    'as an overrun. With periodic_task_concurrency above 1 '
+                    'the periodic loop stops waiting for it after this '
+                    'long. 0 disables the budget'),
+    ]
+
 CONF = cfg.CONF
+CONF.register_opts(periodic_opts)
 CONF.import_opt('host', 'nova.config')
+CONF.import_opt('periodic_interval', 'nova.service')
 LOG = logging.getLogger(__name__)
 
 
@@ -76,12 +93,19 @@ def periodic_task(*args, **kwargs):
         1. Without arguments '@periodic_task', this will be run on every tick
            of the periodic scheduler.
 
-        2. With arguments, @periodic_task(ticks_between_runs=N), this will be
-           run on every N ticks of the periodic scheduler.
+        2. With arguments, @periodic_task(spacing=N), this will be run at
+           most once every N seconds of wall-clock time.
+
+    @periodic_task(ticks_between_runs=N) is still accepted and is treated as
+    a spacing of N times periodic_interval seconds.
+
+    @periodic_task(budget=N) overrides periodic_task_budget for the task.
     """
     def decorator(f):
         f._periodic_task = True
         f._ticks_between_runs = kwargs.pop('ticks_between_runs', 0)
+        f._periodic_spacing = kwargs.pop('spacing', None)
+        f._periodic_budget = kwargs.pop('budget', None)
         return f
 
     # NOTE(sirp): The `if` is necessary to allow the decorator to be used with
@@ -116,18 +140,12 @@ class ManagerMeta(type):
         except AttributeError:
             cls._periodic_tasks = []
 
-        try:
-            cls._ticks_to_skip = cls._ticks_to_skip.copy()
-        except AttributeError:
-            cls._ticks_to_skip = {}
-
         for value in cls.__dict__.values():
             if getattr(value, '_periodic_task', False):
                 task = value
                 name = task.__name__
                 if task._ticks_between_runs >= 0:
                     cls._periodic_tasks.append((name, task))
-                    cls._ticks_to_skip[name] = task._ticks_between_runs
 
 
 class Manager(base.Base):
@@ -142,6 +160,14 @@ class Manager(base.Base):
         self.host = host
         self.load_plugins()
         self.backdoor_port = None
+        # Tasks with a spacing wait one full spacing before their first
+        # run, like they used to wait their ticks.
+        now = timeutils.utcnow_ts()
+        self._periodic_last_run = dict((name, now)
+                                       for name, task in self._periodic_tasks)
+        self._periodic_running = {}
+        self._periodic_overruns = {}
+        self._periodic_pool = None
         super(Manager, self).__init__(db_driver)
 
     def load_plugins(self):
@@ -156,31 +182,106 @@ class Manager(base.Base):
         '''
         return rpc_dispatcher.RpcDispatcher([self])
 
+    def _periodic_spacing(self, task):
+        """Seconds of wall-clock time to leave between runs of a task."""
+        if task._periodic_spacing is not None:
+            return task._periodic_spacing
+        return task._ticks_between_runs * CONF.periodic_interval
+
+    def _periodic_budget(self, task):
+        """Seconds a run of a task may take, or 0 for no budget."""
+        if task._periodic_budget is not None:
+            return task._periodic_budget
+        return CONF.periodic_task_budget
+
+    def _run_periodic_task(self, context, task_name, task, raise_on_error):
+        full_task_name = '.'.join([self.__class__.__name__, task_name])
+        LOG.debug(_("Running periodic task %(full_task_name)s"), locals())
+        start = timeutils.utcnow()
+        try:
+            task(self, context)
+        except Exception as e:
+            if raise_on_error:
+                raise
+            LOG.exception(_("Error during %(full_task_name)s: %(e)s"),
+                          locals())
+        finally:
+            self._periodic_running.pop(task_name, None)
+            elapsed = utils.total_seconds(timeutils.utcnow() - start)
+            budget = self._periodic_budget(task)
+            if budget and elapsed > budget:
+                overruns = self._periodic_overruns.get(task_name, 0) + 1
+                self._periodic_overruns[task_name] = overruns
+                # Count the spacing from the end of an overrun so a slow
+                # task does not run back to back.
+                self._periodic_last_run[task_name] = timeutils.utcnow_ts()
+                LOG.warn(_("%(full_task_name)s took %(elapsed).2f seconds, "
+                           "over its budget of %(budget)s seconds "
+                           "(%(overruns)d overruns)"), locals())
+
     def periodic_tasks(self, context, raise_on_error=False):
-        """Tasks to be run at a periodic interval."""
+        """Tasks to be run at a periodic interval.
+
+        A task runs when its spacing has passed since its last run and it is
+        not still running from an earlier call.  With periodic_task_concurrency
+        above 1 the due tasks run in a pool of green threads and this waits
+        for each one only until its budget is used up, so a slow task keeps
+        running in the background without holding back the others.
+        """
+        now = timeutils.utcnow_ts()
+        due_tasks = []
         for task_name, task in self._periodic_tasks:
             full_task_name = '.'.join([self.__class__.__name__, task_name])
 
-            ticks_to_skip = self._ticks_to_skip[task_name]
-            if ticks_to_skip > 0:
-                LOG.debug(_("Skipping %(full_task_name)s, %(ticks_to_skip)s"
-                            " ticks left until next run"), locals())
-                self._ticks_to_skip[task_name] -= 1
+            if task_name in self._periodic_running:
+                LOG.debug(_("Skipping %(full_task_name)s, still running "
+                            "from an earlier call"), locals())
                 continue
 
-            self._ticks_to_skip[task_name] = task._ticks_between_runs
-            LOG.debug(_("Running periodic task %(full_task_name)s"), locals())
+            spacing = self._periodic_spacing(task)
+            seconds_left = self._periodic_last_run[task_name] + spacing - now
+            if spacing > 0 and seconds_left > 0:
+                LOG.debug(_("Skipping %(full_task_name)s, %(seconds_left)s"
+                            " seconds left until next run"), locals())
+                continue
+
+            self._periodic_last_run[task_name] = now
+            due_tasks.append((task_name, task))
 
-            try:
-                task(self, context)
+        if CONF.periodic_task_concurrency <= 1:
+            for task_name, task in due_tasks:
+                self._run_periodic_task(context, task_name, task,
+                                        raise_on_error)
                 # NOTE(tiantian): After finished a task, allow manager to
                 # do other work (report_state, processing AMPQ request etc.)
                 eventlet.sleep(0)
-            except Exception as e:
-                if raise_on_error:
-                    raise
-                LOG.exception(_("Error during %(full_task_name)s: %(e)s"),
-                              locals())
+            return
+
+        if self._periodic_pool is None:
+            self._periodic_pool = eventlet.GreenPool(
+                    CONF.periodic_task_concurrency)
+        started = []
+        for task_name, task in due_tasks:
+            thread = self._periodic_pool.spawn(self._run_periodic_task,
+                                               context, task_name, task,
+                                               raise_on_error)
+            self._periodic_running[task_name] = thread
+            started.append((task_name, task, thread, timeutils.utcnow()))
+
+        for task_name, task, thread, start in started:
+            budget = self._periodic_budget(task)
+            if not budget:
+                thread.wait()
+                continue
+            elapsed = utils.total_seconds(timeutils.utcnow() - start)
+            with eventlet.Timeout(max(budget - elapsed, 0), False):
+                thread.wait()
+            if task_name in self._periodic_running:
+                full_task_name = '.'.join([self.__class__.__name__,
+                                           task_name])
+                LOG.warn(_("%(full_task_name)s is still running after its "
+                           "budget of %(budget)s seconds, not waiting for "
+                           "it"), locals())
 
     def init_host(self):
         """Hook to do additional manager initialization when one requests
@@ -246,6 +246,30 @@ class API(base.Base):
 
         return network_model.NetworkInfo.hydrate(nw_info)
 
+    def get_instances_nw_info(self, context, instances):
+        """Returns the network info of many instances at once.
+
+        The info cache of every instance is refreshed as well.
+
+        :returns: dict of instance uuid to NetworkInfo
+        """
+        if not instances:
+            return {}
+        args = [{'instance_uuid': instance['uuid'],
+                 'rxtx_factor': instance['instance_type']['rxtx_factor'],
+                 'host': instance['host']}
+                for instance in instances]
+        nw_infos = self.network_rpcapi.get_instances_nw_info(context, args)
+
+        result = {}
+        for instance in instances:
+            nw_info = network_model.NetworkInfo.hydrate(
+                    nw_infos[instance['uuid']])
+            update_instance_cache_with_nw_info(self, context, instance,
+                                               nw_info)
+            result[instance['uuid']] = nw_info
+        return result
+
     def validate_networks(self, context, requested_networks):
         """validate the networks passed at the time of creating
         the server
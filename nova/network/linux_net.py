@@ -23,10 +23,15 @@ import calendar
 import inspect
 import netaddr
 import os
+import sys
+
+from eventlet import event
+from eventlet import greenthread
 
 from nova import db
 from nova import exception
 from nova.openstack.common import cfg
+from nova.openstack.common import excutils
 from nova.openstack.common import fileutils
 from nova.openstack.common import importutils
 from nova.openstack.common import lockutils
@@ -84,6 +89,14 @@ linux_net_opts = [
                 default=False,
                 help='Use single default gateway. Only first nic of vm will '
                      'get default gateway from dhcp server'),
+    cfg.FloatOpt('iptables_apply_coalesce_seconds',
+                 default=0.05,
+                 help='How long iptables changes are collected before they '
+                      'are applied together'),
+    cfg.FloatOpt('dhcp_update_coalesce_seconds',
+                 default=0.05,
+                 help='How long dhcp host changes of a network are collected '
+                      'before dnsmasq is updated with them together'),
     ]
 
 CONF = cfg.CONF
@@ -97,6 +110,11 @@ CONF.import_opt('use_ipv6', 'nova.config')
 CONF.import_opt('my_ip', 'nova.config')
 CONF.import_opt('state_path', 'nova.config')
 
+# The dhcp files last written for each (device, kind), and the pending
+# coalesced update_dhcp of each device.
+_dhcp_files = {}
+_dhcp_updates = {}
+
 
 # NOTE(vish): Iptables supports chain names of up to 28 characters,  and we
 #             add up to 12 characters to binary_name which is used as a prefix,
@@ -150,6 +168,7 @@ class IptablesTable(object):
         self.chains = set()
         self.unwrapped_chains = set()
         self.remove_chains = set()
+        self.dirty = True
 
     def add_chain(self, name, wrap=True):
         """Adds a named chain to the table.
@@ -167,6 +186,7 @@ class IptablesTable(object):
             self.chains.add(name)
         else:
             self.unwrapped_chains.add(name)
+        self.dirty = True
 
     def remove_chain(self, name, wrap=True):
         """Remove named chain.
@@ -187,6 +207,8 @@ class IptablesTable(object):
                      name)
             return
 
+        self.dirty = True
+
         # non-wrapped chains and rules need to be dealt with specially,
         # so we keep a list of them to be iterated over in apply()
         if not wrap:
@@ -224,6 +246,7 @@ class IptablesTable(object):
             rule = ' '.join(map(self._wrap_target_chain, rule.split(' ')))
 
         self.rules.append(IptablesRule(chain, rule, wrap, top))
+        self.dirty = True
 
     def _wrap_target_chain(self, s):
         if s.startswith('$'):
@@ -242,6 +265,7 @@ class IptablesTable(object):
             self.rules.remove(IptablesRule(chain, rule, wrap, top))
             if not wrap:
                 self.remove_rules.append(IptablesRule(chain, rule, wrap, top))
+            self.dirty = True
         except ValueError:
             LOG.warn(_('Tried to remove rule that was not there:'
                        ' %(chain)r %(rule)r %(wrap)r %(top)r'),
@@ -254,6 +278,8 @@ class IptablesTable(object):
                               if rule.chain == chain and rule.wrap == wrap]
         for rule in chained_rules:
             self.rules.remove(rule)
+        if chained_rules:
+            self.dirty = True
 
 
 class IptablesManager(object):
@@ -290,6 +316,7 @@ class IptablesManager(object):
         self.ipv6 = {'filter': IptablesTable()}
 
         self.iptables_apply_deferred = False
+        self._apply_pending = None
 
         # Add a nova-filter-top chain. It's intended to be shared
         # among the various nova components. It sits at the very top
@@ -348,10 +375,33 @@ class IptablesManager(object):
         self._apply()
 
     def apply(self):
+        """Apply the changed tables, together with concurrent callers.
+
+        Changes made by callers arriving within iptables_apply_coalesce_seconds
+        of each other are applied by a single iptables-save/iptables-restore
+        cycle. Returns once the changes made before calling are in place,
+        raising any error from applying them.
+        """
         if self.iptables_apply_deferred:
             return
 
-        self._apply()
+        if self._apply_pending is None:
+            self._apply_pending = event.Event()
+            greenthread.spawn_n(self._apply_coalesced)
+        self._apply_pending.wait()
+
+    def _apply_coalesced(self):
+        done = self._apply_pending
+        greenthread.sleep(CONF.iptables_apply_coalesce_seconds)
+
+        # Changes made from here on are left for the next batch
+        self._apply_pending = None
+        try:
+            self._apply()
+        except Exception:
+            done.send_exception(*sys.exc_info())
+        else:
+            done.send()
 
     @lockutils.synchronized('iptables', 'nova-', external=True)
     def _apply(self):
@@ -359,7 +409,8 @@ class IptablesManager(object):
 
         This will blow away any rules left over from previous runs of the
         same component of Nova, and replace them with our current set of
-        rules. This happens atomically, thanks to iptables-restore.
+        rules. This happens atomically, thanks to iptables-restore. Only
+        tables changed since they were last applied are rewritten.
 
         """
         s = [('iptables', self.ipv4)]
@@ -368,16 +419,26 @@ class IptablesManager(object):
 
         for cmd, tables in s:
             for table in tables:
+                if not tables[table].dirty:
+                    continue
                 current_table, _err = self.execute('%s-save' % (cmd,), '-c',
                                                    '-t', '%s' % (table,),
                                                    run_as_root=True,
                                                    attempts=5)
                 current_lines = current_table.split('\n')
-                new_filter = self._modify_rules(current_lines,
-                                                tables[table])
-                self.execute('%s-restore' % (cmd,), '-c', run_as_root=True,
-                             process_input='\n'.join(new_filter),
-                             attempts=5)
+                # Changes made while the table is being restored mark it
+                # dirty again
+                tables[table].dirty = False
+                try:
+                    new_filter = self._modify_rules(current_lines,
+                                                    tables[table])
+                    self.execute('%s-restore' % (cmd,), '-c',
+                                 run_as_root=True,
+                                 process_input='\n'.join(new_filter),
+                                 attempts=5)
+                except Exception:
+                    with excutils.save_and_reraise_exception():
+                        tables[table].dirty = True
         LOG.debug(_("IPTablesManager.apply completed with success"))
 
     def _modify_rules(self, current_lines, table, binary=None):
@@ -388,8 +449,8 @@ class IptablesManager(object):
         remove_rules = table.remove_rules
 
         # Remove any trace of our rules
-        new_filter = filter(lambda line: binary_name not in line,
-                            current_lines)
+        new_filter = [line for line in current_lines
+                      if binary_name not in line]
 
         seen_chains = False
         rules_index = 0
@@ -401,8 +462,16 @@ class IptablesManager(object):
                 if not rule.startswith(':'):
                     break
 
+        # Lines are compared by their text without [packet:byte] counts, so
+        # index the current lines by that once rather than scanning them for
+        # every rule.
+        last_seen = {}
+        for line in new_filter:
+            last_seen[_iptables_line_key(line)] = line
+
         our_rules = []
         bot_rules = []
+        top_keys = set()
         for rule in rules:
             rule_str = str(rule)
             if rule.top:
@@ -414,95 +483,67 @@ class IptablesManager(object):
                 # [packet:byte] counts and replace it with [0:0], so let's
                 # go look for a duplicate, and over-ride our table rule if
                 # found.
-
-                # ignore [packet:byte] counts at beginning of line
-                if rule_str.startswith('['):
-                    rule_str = rule_str.split(']', 1)[1]
-                dup_filter = filter(lambda s: rule_str.strip() in s.strip(),
-                                    new_filter)
-
-                new_filter = filter(lambda s:
-                                    rule_str.strip() not in s.strip(),
-                                    new_filter)
-                # if no duplicates, use original rule
-                if dup_filter:
-                    # grab the last entry, if there is one
-                    dup = dup_filter[-1]
-                    rule_str = str(dup)
-                else:
-                    rule_str = str(rule)
-                rule_str.strip()
-
-                our_rules += [rule_str]
+                key = _iptables_line_key(rule_str)
+                top_keys.add(key)
+                our_rules += [last_seen.get(key, rule_str)]
             else:
                 bot_rules += [rule_str]
 
         our_rules += bot_rules
 
-        new_filter[rules_index:rules_index] = our_rules
-
-        new_filter[rules_index:rules_index] = [':%s - [0:0]' % (name,)
-                                               for name in unwrapped_chains]
-        new_filter[rules_index:rules_index] = [':%s-%s - [0:0]' %
-                                               (binary_name, name,)
-                                               for name in chains]
+        if top_keys:
+            head = [line for line in new_filter[:rules_index]
+                    if _iptables_line_key(line) not in top_keys]
+            tail = [line for line in new_filter[rules_index:]
+                    if _iptables_line_key(line) not in top_keys]
+            new_filter = head + tail
+            rules_index = len(head)
 
-        seen_lines = set()
+        new_filter[rules_index:rules_index] = (
+                [':%s-%s - [0:0]' % (binary_name, name,) for name in chains] +
+                [':%s - [0:0]' % (name,) for name in unwrapped_chains] +
+                our_rules)
 
-        def _weed_out_duplicates(line):
-            # ignore [packet:byte] counts at beginning of lines
-            if line.startswith('['):
-                line = line.split(']', 1)[1]
-            line = line.strip()
-            if line in seen_lines:
-                return False
-            else:
-                seen_lines.add(line)
-                return True
+        remove_rule_keys = set(_iptables_line_key(str(rule))
+                               for rule in remove_rules)
 
-        def _weed_out_removes(line):
-            # We need to find exact matches here
+        def _is_removed(line):
             if line.startswith(':'):
                 # it's a chain, for example, ":nova-billing - [0:0]"
                 # strip off everything except the chain name
-                line = line.split(':')[1]
-                line = line.split('- [')[0]
-                line = line.strip()
-                for chain in remove_chains:
-                    if chain == line:
-                        remove_chains.remove(chain)
-                        return False
+                name = line.split(':')[1].split('- [')[0].strip()
+                return name in remove_chains
             elif line.startswith('['):
                 # it's a rule
-                # ignore [packet:byte] counts at beginning of lines
-                line = line.split(']', 1)[1]
-                line = line.strip()
-                for rule in remove_rules:
-                    # ignore [packet:byte] counts at beginning of rules
-                    rule_str = str(rule)
-                    rule_str = rule_str.split(' ', 1)[1]
-                    rule_str = rule_str.strip()
-                    if rule_str == line:
-                        remove_rules.remove(rule)
-                        return False
-
-            # Leave it alone
-            return True
+                return _iptables_line_key(line) in remove_rule_keys
+            return False
 
         # We filter duplicates, letting the *last* occurrence take
         # precendence.  We also filter out anything in the "remove"
         # lists.
-        new_filter.reverse()
-        new_filter = filter(_weed_out_duplicates, new_filter)
-        new_filter = filter(_weed_out_removes, new_filter)
-        new_filter.reverse()
+        seen_lines = set()
+        kept = []
+        for line in reversed(new_filter):
+            key = _iptables_line_key(line)
+            if key in seen_lines:
+                continue
+            seen_lines.add(key)
+            if not _is_removed(line):
+                kept.append(line)
+        kept.reverse()
 
         # flush lists, just in case we didn't find something
         remove_chains.clear()
-        for rule in remove_rules:
-            remove_rules.remove(rule)
+        del remove_rules[:]
+
+        return kept
 
-        return new_filter
+
+def _iptables_line_key(line):
+    """Return the text of an iptables-save line without its counts."""
+    if line.startswith('['):
+        line = line.split(']', 1)[1]
+    return line.strip()
 
 
 # NOTE(jkoelker) This is just a nice little stub point since mocking
@@ -703,30 +744,31 @@ def initialize_gateway_device(dev, network_ref):
                  'dev', dev, run_as_root=True)
 
 
-def get_dhcp_leases(context, network_ref):
-    """Return a network's hosts config in dnsmasq leasefile format."""
-    hosts = []
+def _get_associated_fixed_ips(context, network_ref):
+    """Return the fixed ips of a network served by this host's dnsmasq."""
     host = None
     if network_ref['multi_host']:
         host = CONF.host
-    for data in db.network_get_associated_fixed_ips(context,
-                                                    network_ref['id'],
-                                                    host=host):
+    return db.network_get_associated_fixed_ips(context,
+                                               network_ref['id'],
+                                               host=host)
+
+
+def get_dhcp_leases(context, network_ref):
+    """Return a network's hosts config in dnsmasq leasefile format."""
+    hosts = []
+    for data in _get_associated_fixed_ips(context, network_ref):
         hosts.append(_host_lease(data))
     return '\n'.join(hosts)
 
 
 def get_dhcp_hosts(context, network_ref):
     """Get network's hosts config in dhcp-host format."""
-    hosts = []
-    host = None
-    if network_ref['multi_host']:
-        host = CONF.host
-    for data in db.network_get_associated_fixed_ips(context,
-                                                    network_ref['id'],
-                                                    host=host):
-        hosts.append(_host_dhcp(data))
-    return '\n'.join(hosts)
+    return _dhcp_hosts(_get_associated_fixed_ips(context, network_ref))
+
+
+def _dhcp_hosts(fixed_ips):
+    return '\n'.join([_host_dhcp(data) for data in fixed_ips])
 
 
 def get_dns_hosts(context, network_ref):
@@ -752,31 +794,13 @@ def _add_dnsmasq_accept_rules(dev):
 
 def get_dhcp_opts(context, network_ref):
     """Get network's hosts config in dhcp-opts format."""
-    hosts = []
-    host = None
-    if network_ref['multi_host']:
-        host = CONF.host
-    data = db.network_get_associated_fixed_ips(context,
-                                               network_ref['id'],
-                                               host=host)
+    return _dhcp_opts(_get_associated_fixed_ips(context, network_ref))
 
-    if data:
-        instance_set = set([datum['instance_uuid'] for datum in data])
-        default_gw_vif = {}
-        for instance_uuid in instance_set:
-            vifs = db.virtual_interface_get_by_instance(context,
-                                                        instance_uuid)
-            if vifs:
-                #offer a default gateway to the first virtual interface
-                default_gw_vif[instance_uuid] = vifs[0]['id']
-
-        for datum in data:
-            instance_uuid = datum['instance_uuid']
-            if instance_uuid in default_gw_vif:
-                # we don't want default gateway for this fixed ip
-                if default_gw_vif[instance_uuid] != datum['vif_id']:
-                    hosts.append(_host_dhcp_opts(datum))
-    return '\n'.join(hosts)
+
+def _dhcp_opts(fixed_ips):
+    # offer a default gateway only to the first virtual interface
+    return '\n'.join([_host_dhcp_opts(data) for data in fixed_ips
+                      if not data['default_route']])
 
 
 def release_dhcp(dev, address, mac_address):
@@ -784,9 +808,51 @@ def release_dhcp(dev, address, mac_address):
 
 
 def update_dhcp(context, dev, network_ref):
-    conffile = _dhcp_file(dev, 'conf')
-    write_to_file(conffile, get_dhcp_hosts(context, network_ref))
-    restart_dhcp(context, dev, network_ref)
+    """Update the dhcp hosts of a network and reload its dnsmasq.
+
+    Updates of the same device requested within
+    dhcp_update_coalesce_seconds of each other are served by one query,
+    one rewrite of the files that changed and one reload, using the
+    network_ref of the latest caller. Returns once the hosts as of
+    calling are in place, raising any error from updating them.
+    """
+    pending = _dhcp_updates.get(dev)
+    if pending is None:
+        pending = {'event': event.Event()}
+        _dhcp_updates[dev] = pending
+        greenthread.spawn_n(_update_dhcp_coalesced, dev, pending)
+    pending['context'] = context
+    pending['network_ref'] = network_ref
+    pending['event'].wait()
+
+
+def _update_dhcp_coalesced(dev, pending):
+    greenthread.sleep(CONF.dhcp_update_coalesce_seconds)
+
+    # Updates requested from here on are left for the next batch
+    del _dhcp_updates[dev]
+    try:
+        _update_dhcp(pending['context'], dev, pending['network_ref'])
+    except Exception:
+        pending['event'].send_exception(*sys.exc_info())
+    else:
+        pending['event'].send()
+
+
+@lockutils.synchronized('dnsmasq_update', 'nova-')
+def _update_dhcp(context, dev, network_ref):
+    """Rewrite the dhcp files of a device that changed and reload dnsmasq.
+
+    dnsmasq is left alone if neither file changed since it was last
+    written by this process and it is still running.
+    """
+    fixed_ips = _get_associated_fixed_ips(context, network_ref)
+    changed = _write_dhcp_file(dev, 'conf', _dhcp_hosts(fixed_ips))
+    if CONF.use_single_default_gateway:
+        changed |= _write_dhcp_file(dev, 'opts', _dhcp_opts(fixed_ips))
+
+    if changed or not _dnsmasq_running(dev):
+        restart_dhcp(context, dev, network_ref)
 
 
 def update_dns(context, dev, network_ref):
@@ -796,8 +862,25 @@ def update_dns(context, dev, network_ref):
 
 
 def update_dhcp_hostfile_with_text(dev, hosts_text):
-    conffile = _dhcp_file(dev, 'conf')
-    write_to_file(conffile, hosts_text)
+    _write_dhcp_file(dev, 'conf', hosts_text)
+
+
+def _write_dhcp_file(dev, kind, text):
+    """Replace a dhcp file of a device unless it already holds text.
+
+    The file is replaced atomically, so dnsmasq never reads a partly
+    written file. Returns whether the file was written.
+    """
+    if _dhcp_files.get((dev, kind)) == text:
+        return False
+    path = _dhcp_file(dev, kind)
+    tmp_path = '%s.tmp' % path
+    write_to_file(tmp_path, text)
+    # Make sure dnsmasq can actually read it (it setuid()s to "nobody")
+    os.chmod(tmp_path, 0644)
+    os.rename(tmp_path, path)
+    _dhcp_files[(dev, kind)] = text
+    return True
 
 
 def kill_dhcp(dev):
@@ -826,12 +909,9 @@ def restart_dhcp(context, dev, network_ref):
     """
     conffile = _dhcp_file(dev, 'conf')
 
-    if CONF.use_single_default_gateway:
-        # NOTE(vish): this will have serious performance implications if we
-        #             are not in multi_host mode.
-        optsfile = _dhcp_file(dev, 'opts')
-        write_to_file(optsfile, get_dhcp_opts(context, network_ref))
-        os.chmod(optsfile, 0644)
+    if CONF.use_single_default_gateway and (dev, 'opts') not in _dhcp_files:
+        # The opts file is kept up to date by update_dhcp once written.
+        _write_dhcp_file(dev, 'opts', get_dhcp_opts(context, network_ref))
 
     # Make sure dnsmasq can actually read it (it setuid()s to "nobody")
     os.chmod(conffile, 0644)
@@ -840,11 +920,7 @@ def restart_dhcp(context, dev, network_ref):
 
     # if dnsmasq is already running, then tell it to reload
     if pid:
-        out, _err = _execute('cat', '/proc/%d/cmdline' % pid,
-                             check_exit_code=False)
-        # Using symlinks can cause problems here so just compare the name
-        # of the file itself
-        if conffile.split('/')[-1] in out:
+        if _dnsmasq_running(dev, pid):
             try:
                 _execute('kill', '-HUP', pid, run_as_root=True)
                 _add_dnsmasq_accept_rules(dev)
@@ -1023,6 +1099,18 @@ def _dnsmasq_pid_for(dev):
             return None
 
 
+def _dnsmasq_running(dev, pid=None):
+    """Check whether the dnsmasq of a bridge/device is running."""
+    pid = pid or _dnsmasq_pid_for(dev)
+    if not pid:
+        return False
+    out, _err = _execute('cat', '/proc/%d/cmdline' % pid,
+                         check_exit_code=False)
+    # Using symlinks can cause problems here so just compare the name
+    # of the file itself
+    return _dhcp_file(dev, 'conf').split('/')[-1] in out
+
+
 def _ra_pid_for(dev):
     """Returns the pid for prior radvd instance for a bridge/device.
 
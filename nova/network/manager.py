@@ -43,6 +43,7 @@ topologies.  All of the network commands are issued to a subclass of
 
 """
 
+import copy
 import datetime
 import functools
 import itertools
@@ -61,6 +62,7 @@ from nova import ipv6
 from nova import manager
 from nova.network import api as network_api
 from nova.network import model as network_model
+from nova.network import nova_ipam_lib
 from nova.network import rpcapi as network_rpcapi
 from nova.openstack.common import cfg
 from nova.openstack.common import excutils
@@ -282,6 +284,63 @@ def check_policy(context, action):
     nova.policy.enforce(context, _action, target)
 
 
+def _like_escape(literal):
+    # '!' needs no quoting in SQL string literals on any backend, unlike
+    # a backslash.
+    for c in '!%_':
+        literal = literal.replace(c, '!' + c)
+    return literal
+
+
+def _ip_filter_to_like(ip_filter):
+    """Return a LIKE pattern for the strings ip_filter can match.
+
+    ip_filter is a regular expression matched from the start of a string.
+    The pattern returned may match more than ip_filter does, so that the
+    database can narrow down candidates which are then matched with the
+    regular expression itself.
+    """
+    if '|' in ip_filter:
+        return '%'
+
+    like = []
+    i = 0
+    if ip_filter.startswith('^'):
+        i = 1
+    while i < len(ip_filter):
+        c = ip_filter[i]
+        if (c == '\\' and ip_filter[i + 1:i + 2] and
+            not ip_filter[i + 1].isalnum()):
+            atom = _like_escape(ip_filter[i + 1])
+            i += 2
+        elif c == '.':
+            atom = '_'
+            i += 1
+        elif c == '$' and i == len(ip_filter) - 1:
+            return ''.join(like)
+        elif c in '\\$^[](){}*+?':
+            break
+        else:
+            atom = _like_escape(c)
+            i += 1
+
+        quantifier = ip_filter[i:i + 1]
+        if quantifier == '*' and atom == '_':
+            like.append('%')
+            i += 1
+        elif quantifier == '+':
+            like.extend([atom, '%'])
+            i += 1
+        elif quantifier and quantifier in '*?{':
+            break
+        else:
+            like.append(atom)
+
+    if not like or like[-1] != '%':
+        like.append('%')
+    return ''.join(like)
+
+
 class FloatingIP(object):
     """Mixin class for adding floating IP functionality to a manager."""
 
@@ -876,7 +935,7 @@ class NetworkManager(manager.SchedulerDependentManager):
         The one at a time part is to flatten the layout to help scale
     """
 
-    RPC_API_VERSION = '1.3'
+    RPC_API_VERSION = '1.4'
 
     # If True, this manager requires VIF to create a bridge.
     SHOULD_CREATE_BRIDGE = False
@@ -1018,53 +1077,75 @@ class NetworkManager(manager.SchedulerDependentManager):
     @wrap_check_policy
     def get_instance_uuids_by_ip_filter(self, context, filters):
         fixed_ip_filter = filters.get('fixed_ip')
-        ip_filter = re.compile(str(filters.get('ip')))
-        ipv6_filter = re.compile(str(filters.get('ip6')))
-
-        # NOTE(jkoelker) Should probably figure out a better way to do
-        #                this. But for now it "works", this could suck on
-        #                large installs.
-
-        vifs = self.db.virtual_interface_get_all(context)
         results = []
 
-        for vif in vifs:
-            if vif['instance_uuid'] is None:
-                continue
+        if 'ip6' in filters:
+            ipv6_filter = re.compile(str(filters['ip6']))
+            # IPv6 addresses are derived from the network and the MAC
+            # address rather than stored, so they can't be searched for in
+            # the database.
+            networks = {}
+            vifs = self.db.virtual_interface_get_all(context)
+            for vif in vifs:
+                if vif['instance_uuid'] is None:
+                    continue
+
+                network_id = vif['network_id']
+                if network_id not in networks:
+                    networks[network_id] = self._get_network_by_id(
+                            context, network_id)
+                network = networks[network_id]
+                if network['cidr_v6'] is None:
+                    continue
 
-            network = self._get_network_by_id(context, vif['network_id'])
-            fixed_ipv6 = None
-            if network['cidr_v6'] is not None:
                 fixed_ipv6 = ipv6.to_global(network['cidr_v6'],
                                             vif['address'],
                                             context.project_id)
-
-            if fixed_ipv6 and ipv6_filter.match(fixed_ipv6):
-                results.append({'instance_uuid': vif['instance_uuid'],
-                                'ip': fixed_ipv6})
-
-            vif_id = vif['id']
-            fixed_ips = self.db.fixed_ips_by_virtual_interface(context,
-                                                               vif_id)
-            for fixed_ip in fixed_ips:
-                if not fixed_ip or not fixed_ip['address']:
-                    continue
-                if fixed_ip['address'] == fixed_ip_filter:
+                if ipv6_filter.match(fixed_ipv6):
                     results.append({'instance_uuid': vif['instance_uuid'],
-                                    'ip': fixed_ip['address']})
+                                    'ip': fixed_ipv6,
+                                    'vif_id': vif['id']})
+
+        if 'ip' in filters or fixed_ip_filter is not None:
+            ip_filter = re.compile(str(filters.get('ip')))
+            address_like = None
+            if 'ip' in filters:
+                address_like = _ip_filter_to_like(str(filters['ip']))
+            fixed_ips = self.db.fixed_ips_get_by_address_filter(
+                    context, address_like=address_like,
+                    address=fixed_ip_filter)
+
+            # There is a row for each floating ip of a fixed ip. The fixed
+            # ip is reported if its own address matches, and otherwise
+            # each of its matching floating ips is.
+            fixed_ips.sort(key=lambda f: (f['virtual_interface_id'],
+                                          f['id'], f['floating_address']))
+            for fixed_ip_id, rows in itertools.groupby(fixed_ips,
+                                                       lambda f: f['id']):
+                rows = list(rows)
+                address = rows[0]['address']
+                if not address:
                     continue
-                if ip_filter.match(fixed_ip['address']):
-                    results.append({'instance_uuid': vif['instance_uuid'],
-                                    'ip': fixed_ip['address']})
-                    continue
-                for floating_ip in fixed_ip.get('floating_ips', []):
-                    if not floating_ip or not floating_ip['address']:
-                        continue
-                    if ip_filter.match(floating_ip['address']):
-                        results.append({'instance_uuid': vif['instance_uuid'],
-                                        'ip': floating_ip['address']})
-                        continue
-
+                if (address == fixed_ip_filter or
+                    'ip' in filters and ip_filter.match(address)):
+                    matches = [address]
+                elif 'ip' in filters:
+                    matches = [row['floating_address'] for row in rows
+                               if row['floating_address'] and
+                               ip_filter.match(row['floating_address'])]
+                else:
+                    matches = []
+                for match in matches:
+                    results.append({
+                        'instance_uuid': rows[0]['instance_uuid'],
+                        'ip': match,
+                        'vif_id': rows[0]['virtual_interface_id']})
+
+        # Results are reported in interface order, each interface's IPv6
+        # address first.
+        results.sort(key=lambda r: r['vif_id'])
+        for result in results:
+            del result['vif_id']
         return results
 
     def _get_networks_for_instance(self, context, instance_id, project_id,
@@ -1178,10 +1259,86 @@ class NetworkManager(manager.SchedulerDependentManager):
                                                          rxtx_factor, host)
         return nw_info
 
+    @wrap_check_policy
+    def get_instances_nw_info(self, context, instances, **kwargs):
+        """Creates network info lists for many instances at once.
+
+        :param instances: list of dicts holding the instance_uuid,
+                          rxtx_factor and host of each instance
+        :returns: dict of instance uuid to network info list
+
+        The interfaces, fixed ips and floating ips of all the instances
+        are read with one query each and every network and its subnets
+        are looked up once, rather than several queries per interface.
+        """
+        if not isinstance(self.ipam, nova_ipam_lib.QuantumNovaIPAMLib):
+            # Only the nova ipam keeps its addresses in these tables.
+            return dict((instance['instance_uuid'],
+                         self.get_instance_nw_info(context, None,
+                                                   instance['instance_uuid'],
+                                                   instance['rxtx_factor'],
+                                                   instance['host']))
+                        for instance in instances)
+
+        instance_uuids = [instance['instance_uuid'] for instance in instances]
+        vifs_by_instance = dict((instance_uuid, [])
+                                for instance_uuid in instance_uuids)
+        vifs = self.db.virtual_interface_get_by_instances(context,
+                                                          instance_uuids)
+        for vif in vifs:
+            vifs_by_instance[vif['instance_uuid']].append(vif)
+
+        # rows come ordered by fixed ip, one per floating ip
+        vif_ips = dict((vif['id'], []) for vif in vifs)
+        fixed_ips = {}
+        rows = self.db.fixed_ips_get_by_virtual_interfaces(
+                context, [vif['id'] for vif in vifs])
+        for row in rows:
+            fixed_ip = fixed_ips.get(row['id'])
+            if fixed_ip is None:
+                fixed_ip = network_model.FixedIP(address=row['address'])
+                fixed_ips[row['id']] = fixed_ip
+                vif_ips[row['virtual_interface_id']].append(fixed_ip)
+            if row['floating_address']:
+                fixed_ip.add_floating_ip(network_model.IP(
+                        address=row['floating_address'], type='floating'))
+
+        networks_by_id = {}
+        networks = {}
+        for vif in vifs:
+            network_id = vif.get('network_id')
+            if network_id is None:
+                continue
+            if network_id not in networks_by_id:
+                networks_by_id[network_id] = self._get_network_by_id(
+                        context, network_id)
+            network = networks_by_id[network_id]
+            networks[vif['uuid']] = network
+            if network['cidr_v6']:
+                ip = ipv6.to_global(network['cidr_v6'], vif['address'],
+                                    network['project_id'])
+                vif_ips[vif['id']].append(network_model.FixedIP(address=ip))
+
+        subnets_cache = {}
+        nw_infos = {}
+        for instance in instances:
+            instance_uuid = instance['instance_uuid']
+            nw_infos[instance_uuid] = self.build_network_info_model(context,
+                    vifs_by_instance[instance_uuid], networks,
+                    instance['rxtx_factor'], instance['host'],
+                    vif_ips=vif_ips, subnets_cache=subnets_cache)
+        return nw_infos
+
     def build_network_info_model(self, context, vifs, networks,
-                                 rxtx_factor, instance_host):
+                                 rxtx_factor, instance_host, vif_ips=None,
+                                 subnets_cache=None):
         """Builds a NetworkInfo object containing all network information
-        for an instance"""
+        for an instance
+
+        vif_ips optionally maps vif ids to their model FixedIPs, already
+        carrying their floating ips.  subnets_cache is a dict that can be
+        shared between calls to reuse the subnets built for a network.
+        """
         nw_info = network_model.NetworkInfo()
         for vif in vifs:
             vif_dict = {'id': vif['uuid'],
@@ -1195,8 +1352,15 @@ class NetworkManager(manager.SchedulerDependentManager):
 
             # get network dict for vif from args and build the subnets
             network = networks[vif['uuid']]
-            subnets = self._get_subnets_from_network(context, network, vif,
-                                                     instance_host)
+            if subnets_cache is None:
+                subnets = self._get_subnets_from_network(context, network,
+                                                         vif, instance_host)
+            else:
+                key = (network['id'], instance_host)
+                if key not in subnets_cache:
+                    subnets_cache[key] = self._get_subnets_from_network(
+                            context, network, vif, instance_host)
+                subnets = copy.deepcopy(subnets_cache[key])
 
             # if rxtx_cap data are not set everywhere, set to none
             try:
@@ -1204,32 +1368,10 @@ class NetworkManager(manager.SchedulerDependentManager):
             except (TypeError, KeyError):
                 rxtx_cap = None
 
-            # get fixed_ips
-            v4_IPs = self.ipam.get_v4_ips_by_interface(context,
-                                                       network['uuid'],
-                                                       vif['uuid'],
-                                                       network['project_id'])
-            v6_IPs = self.ipam.get_v6_ips_by_interface(context,
-                                                       network['uuid'],
-                                                       vif['uuid'],
-                                                       network['project_id'])
-
-            # create model FixedIPs from these fixed_ips
-            network_IPs = [network_model.FixedIP(address=ip_address)
-                           for ip_address in v4_IPs + v6_IPs]
-
-            # get floating_ips for each fixed_ip
-            # add them to the fixed ip
-            for fixed_ip in network_IPs:
-                if fixed_ip['version'] == 6:
-                    continue
-                gfipbfa = self.ipam.get_floating_ips_by_fixed_address
-                floating_ips = gfipbfa(context, fixed_ip['address'])
-                floating_ips = [network_model.IP(address=ip['address'],
-                                                 type='floating')
-                                for ip in floating_ips]
-                for ip in floating_ips:
-                    fixed_ip.add_floating_ip(ip)
+            if vif_ips is None:
+                network_IPs = self._get_ips_from_vif(context, network, vif)
+            else:
+                network_IPs = vif_ips.get(vif['id'], [])
 
             # add ips to subnets they belong to
             for subnet in subnets:
@@ -1253,6 +1395,37 @@ class NetworkManager(manager.SchedulerDependentManager):
 
         return nw_info
 
+    def _get_ips_from_vif(self, context, network, vif):
+        """Returns the model FixedIPs of a vif with their floating ips"""
+        # get fixed_ips
+        v4_IPs = self.ipam.get_v4_ips_by_interface(context,
+                                                   network['uuid'],
+                                                   vif['uuid'],
+                                                   network['project_id'])
+        v6_IPs = self.ipam.get_v6_ips_by_interface(context,
+                                                   network['uuid'],
+                                                   vif['uuid'],
+                                                   network['project_id'])
+
+        # create model FixedIPs from these fixed_ips
+        network_IPs = [network_model.FixedIP(address=ip_address)
+                       for ip_address in v4_IPs + v6_IPs]
+
+        # get floating_ips for each fixed_ip
+        # add them to the fixed ip
+        for fixed_ip in network_IPs:
+            if fixed_ip['version'] == 6:
+                continue
+            gfipbfa = self.ipam.get_floating_ips_by_fixed_address
+            floating_ips = gfipbfa(context, fixed_ip['address'])
+            floating_ips = [network_model.IP(address=ip['address'],
+                                             type='floating')
+                            for ip in floating_ips]
+            for ip in floating_ips:
+                fixed_ip.add_floating_ip(ip)
+
+        return network_IPs
+
     def _get_network_dict(self, network):
         """Returns the dict representing necessary and meta network fields"""
         # get generic network fields
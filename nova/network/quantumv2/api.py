@@ -185,6 +185,11 @@ class API(base.Base):
     def get_instance_nw_info(self, context, instance, networks=None):
         return self._get_instance_nw_info(context, instance, networks)
 
+    def get_instances_nw_info(self, context, instances):
+        return dict((instance['uuid'],
+                     self.get_instance_nw_info(context, instance))
+                    for instance in instances)
+
     def _get_instance_nw_info(self, context, instance, networks=None):
         LOG.debug(_('get_instance_nw_info() for %s'),
                   instance['display_name'])
@@ -36,6 +36,7 @@ class NetworkAPI(rpc_proxy.RpcProxy):
         1.1 - Adds migrate_instance_[start|finish]
         1.2 - Make migrate_instance_[start|finish] a little more flexible
         1.3 - Adds fanout cast update_dns for multi_host networks
+        1.4 - Adds get_instances_nw_info
     '''
 
     #
@@ -166,6 +167,10 @@ class NetworkAPI(rpc_proxy.RpcProxy):
                 instance_id=instance_id, instance_uuid=instance_uuid,
                 rxtx_factor=rxtx_factor, host=host, project_id=project_id))
 
+    def get_instances_nw_info(self, ctxt, instances):
+        return self.call(ctxt, self.make_msg('get_instances_nw_info',
+                instances=instances), version='1.4')
+
     def validate_networks(self, ctxt, networks):
         return self.call(ctxt, self.make_msg('validate_networks',
                 networks=networks))
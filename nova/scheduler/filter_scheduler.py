@@ -19,14 +19,28 @@ You can customize this scheduler by specifying your own Host Filters and
 Weighing Functions.
 """
 
+import heapq
+
 from nova import exception
+from nova import filters
 from nova.openstack.common import cfg
 from nova.openstack.common import log as logging
 from nova.openstack.common.notifier import api as notifier
 from nova.scheduler import driver
 from nova.scheduler import scheduler_options
 
+filter_scheduler_opts = [
+    cfg.BoolOpt('scheduler_batch_placement',
+                default=False,
+                help='Place all instances of a multi-instance request from '
+                     'a single filtering and weighing pass.  After each '
+                     'pick only the chosen host is filtered and weighed '
+                     'again.  Only valid when every filter and weigher '
+                     'judges a host on its own state alone.'),
+    ]
+
 CONF = cfg.CONF
+CONF.register_opts(filter_scheduler_opts)
 LOG = logging.getLogger(__name__)
 
 
@@ -255,11 +269,29 @@ class FilterScheduler(driver.Scheduler):
         # are being scanned in a filter or weighing function.
         hosts = self.host_manager.get_all_host_states(elevated)
 
-        selected_hosts = []
         if instance_uuids:
             num_instances = len(instance_uuids)
         else:
             num_instances = request_spec.get('num_instances', 1)
+
+        # Keep filter instances and the results of filters that only
+        # depend on the request for all instances of this request.
+        filter_properties['filter_cache'] = filters.FilterCache()
+        try:
+            if CONF.scheduler_batch_placement:
+                return self._select_hosts_batch(hosts, filter_properties,
+                        instance_properties, num_instances)
+            return self._select_hosts(hosts, filter_properties,
+                    instance_properties, num_instances)
+        finally:
+            filter_properties.pop('filter_cache', None)
+
+    def _select_hosts(self, hosts, filter_properties, instance_properties,
+                      num_instances):
+        """Select hosts for num_instances instances, filtering and weighing
+        all remaining hosts again for each instance.
+        """
+        selected_hosts = []
         for num in xrange(num_instances):
             # Filter local hosts based on requirements ...
             hosts = self.host_manager.get_filtered_hosts(hosts,
@@ -271,7 +303,7 @@ class FilterScheduler(driver.Scheduler):
             LOG.debug(_("Filtered %(hosts)s") % locals())
 
             weighed_hosts = self.host_manager.get_weighed_hosts(hosts,
-                    filter_properties)
+                    filter_properties, limit=1)
             best_host = weighed_hosts[0]
             LOG.debug(_("Choosing host %(best_host)s") % locals())
             selected_hosts.append(best_host)
@@ -279,3 +311,45 @@ class FilterScheduler(driver.Scheduler):
             # will change for the next instance.
             best_host.obj.consume_from_instance(instance_properties)
         return selected_hosts
+
+    def _select_hosts_batch(self, hosts, filter_properties,
+                            instance_properties, num_instances):
+        """Select hosts for num_instances instances from one filtering and
+        weighing pass over all hosts.
+
+        The weighed hosts are kept in a heap.  Consuming resources for an
+        instance only changes the chosen host, so only that host is
+        filtered and weighed again before it goes back into the heap.
+        """
+        hosts = self.host_manager.get_filtered_hosts(hosts,
+                filter_properties)
+        if not hosts:
+            return []
+
+        LOG.debug(_("Filtered %(hosts)s") % locals())
+
+        weighed_hosts = self.host_manager.get_weighed_hosts(hosts,
+                filter_properties)
+        # The index keeps ties in the order the weight handler returned.
+        heap = [(-weighed_host.weight, index, weighed_host)
+                for index, weighed_host in enumerate(weighed_hosts)]
+        heapq.heapify(heap)
+
+        selected_hosts = []
+        for num in xrange(num_instances):
+            if not heap:
+                # Can't get any more locally.
+                break
+            _weight, index, best_host = heapq.heappop(heap)
+            LOG.debug(_("Choosing host %(best_host)s") % locals())
+            selected_hosts.append(best_host)
+
+            host_state = best_host.obj
+            host_state.consume_from_instance(instance_properties)
+            if self.host_manager.get_filtered_hosts([host_state],
+                                                    filter_properties):
+                weighed_host = self.host_manager.get_weighed_hosts(
+                        [host_state], filter_properties, limit=1)[0]
+                heapq.heappush(heap, (-weighed_host.weight, index,
+                                      weighed_host))
+        return selected_hosts
@@ -22,14 +22,37 @@ from nova.scheduler import filters
 
 
 class AffinityFilter(filters.BaseHostFilter):
+    # The hosts of the hinted instances do not change within a request
+    run_filter_once_per_request = True
+
     def __init__(self):
         self.compute_api = compute.API()
+        # { (instance uuids) : set([hosts]) }
+        self._affinity_hosts_cache = {}
 
-    def _all_hosts(self, context):
-        all_hosts = {}
-        for instance in self.compute_api.get_all(context):
-            all_hosts[instance['uuid']] = instance['host']
-        return all_hosts
+    def _get_affinity_uuids(self, filter_properties, hint):
+        scheduler_hints = filter_properties.get('scheduler_hints') or {}
+        affinity_uuids = scheduler_hints.get(hint, [])
+        if isinstance(affinity_uuids, basestring):
+            affinity_uuids = [affinity_uuids]
+        return affinity_uuids
+
+    def _affinity_hosts(self, context, affinity_uuids):
+        """Return the set of hosts running the given instances.
+
+        The hosts are looked up by uuid once and then remembered, so that
+        checking many candidate hosts against the same hint is a set
+        membership test rather than a database query per host.
+        """
+        key = tuple(sorted(affinity_uuids))
+        hosts = self._affinity_hosts_cache.get(key)
+        if hosts is None:
+            instances = self.compute_api.get_all(context,
+                    search_opts={'uuid': list(key)})
+            hosts = set(instance['host'] for instance in instances
+                        if instance['host'])
+            self._affinity_hosts_cache[key] = hosts
+        return hosts
 
 
 class DifferentHostFilter(AffinityFilter):
@@ -37,16 +60,11 @@ class DifferentHostFilter(AffinityFilter):
 
     def host_passes(self, host_state, filter_properties):
         context = filter_properties['context']
-        scheduler_hints = filter_properties.get('scheduler_hints') or {}
-        me = host_state.host
-
-        affinity_uuids = scheduler_hints.get('different_host', [])
-        if isinstance(affinity_uuids, basestring):
-            affinity_uuids = [affinity_uuids]
+        affinity_uuids = self._get_affinity_uuids(filter_properties,
+                                                  'different_host')
         if affinity_uuids:
-            all_hosts = self._all_hosts(context)
-            return not any([i for i in affinity_uuids
-                              if all_hosts.get(i) == me])
+            return host_state.host not in self._affinity_hosts(
+                    context, affinity_uuids)
         # With no different_host key
         return True
 
@@ -58,17 +76,11 @@ class SameHostFilter(AffinityFilter):
 
     def host_passes(self, host_state, filter_properties):
         context = filter_properties['context']
-        scheduler_hints = filter_properties.get('scheduler_hints') or {}
-        me = host_state.host
-
-        affinity_uuids = scheduler_hints.get('same_host', [])
-        if isinstance(affinity_uuids, basestring):
-            affinity_uuids = [affinity_uuids]
+        affinity_uuids = self._get_affinity_uuids(filter_properties,
+                                                  'same_host')
         if affinity_uuids:
-            all_hosts = self._all_hosts(context)
-            return any([i for i
-                          in affinity_uuids
-                          if all_hosts.get(i) == me])
+            return host_state.host in self._affinity_hosts(context,
+                                                           affinity_uuids)
         # With no same_host key
         return True
 
@@ -26,6 +26,9 @@ LOG = logging.getLogger(__name__)
 class AggregateInstanceExtraSpecsFilter(filters.BaseHostFilter):
     """AggregateInstanceExtraSpecsFilter works with InstanceType records."""
 
+    # Aggregate data and instance type do not change within a request
+    run_filter_once_per_request = True
+
     def host_passes(self, host_state, filter_properties):
         """Return a list of hosts that can create instance_type
 
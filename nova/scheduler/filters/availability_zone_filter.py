@@ -20,6 +20,9 @@ from nova.scheduler import filters
 class AvailabilityZoneFilter(filters.BaseHostFilter):
     """Filters Hosts by availability zone."""
 
+    # Availability zones do not change within a request
+    run_filter_once_per_request = True
+
     def host_passes(self, host_state, filter_properties):
         spec = filter_properties.get('request_spec', {})
         props = spec.get('instance_properties', {})
@@ -27,6 +27,9 @@ LOG = logging.getLogger(__name__)
 class ComputeFilter(filters.BaseHostFilter):
     """Filter on active Compute nodes"""
 
+    # Service status and capabilities do not change within a request
+    run_filter_once_per_request = True
+
     def __init__(self):
         self.servicegroup_api = servicegroup.API()
 
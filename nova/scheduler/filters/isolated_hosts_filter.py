@@ -24,6 +24,9 @@ CONF.import_opt('isolated_images', 'nova.config')
 class IsolatedHostsFilter(filters.BaseHostFilter):
     """Returns host."""
 
+    # The configuration values do not change within a request
+    run_filter_once_per_request = True
+
     def host_passes(self, host_state, filter_properties):
         spec = filter_properties.get('request_spec', {})
         props = spec.get('instance_properties', {})
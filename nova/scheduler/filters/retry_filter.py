@@ -24,6 +24,9 @@ class RetryFilter(filters.BaseHostFilter):
     purposes
     """
 
+    # The list of tried hosts only changes between requests
+    run_filter_once_per_request = True
+
     def host_passes(self, host_state, filter_properties):
         """Skip nodes that have already been attempted"""
         retry = filter_properties.get('retry', None)
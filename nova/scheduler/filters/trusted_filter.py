@@ -51,6 +51,7 @@ import ssl
 from nova.openstack.common import cfg
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
 from nova.scheduler import filters
 
 
@@ -78,6 +79,11 @@ trusted_opts = [
                deprecated_name='auth_blob',
                default=None,
                help='attestation authorization blob - must change'),
+    cfg.IntOpt('attestation_auth_timeout',
+               default=60,
+               help='Attestation status cache valid period length, in '
+                    'seconds.  Set to 0 to ask the attestation server '
+                    'for every request'),
 ]
 
 CONF = cfg.CONF
@@ -131,81 +137,155 @@ class AttestationService(httplib.HTTPSConnection):
         self.cert_file = None
         self.ca_file = CONF.trusted_computing.attestation_server_ca_file
         self.request_count = 100
+        # Idle connections to the attestation server, kept open so that
+        # requests do not pay for a TLS handshake each time.
+        self._connections = []
+        # { host : (trust level, time of attestation) }
+        self._trust_levels = {}
+
+    def _new_connection(self):
+        return HTTPSClientAuthConnection(self.host, self.port,
+                                         key_file=self.key_file,
+                                         cert_file=self.cert_file,
+                                         ca_file=self.ca_file)
 
     def _do_request(self, method, action_url, body, headers):
         # Connects to the server and issues a request.
-        # :returns: result data
-        # :raises: IOError if the request fails
+        # :returns: status and result data
 
         action_url = "%s/%s" % (self.api_url, action_url)
-        try:
-            c = HTTPSClientAuthConnection(self.host, self.port,
-                                          key_file=self.key_file,
-                                          cert_file=self.cert_file,
-                                          ca_file=self.ca_file)
-            c.request(method, action_url, body, headers)
-            res = c.getresponse()
-            status_code = res.status
-            if status_code in (httplib.OK,
-                               httplib.CREATED,
-                               httplib.ACCEPTED,
-                               httplib.NO_CONTENT):
-                return httplib.OK, res
-            return status_code, None
-
-        except (socket.error, IOError) as e:
-            return IOError, None
-
-    def _request(self, cmd, subcmd, host):
+        reused = bool(self._connections)
+        if reused:
+            c = self._connections.pop()
+        else:
+            c = self._new_connection()
+        while True:
+            try:
+                c.request(method, action_url, body, headers)
+                res = c.getresponse()
+                # The response must be read completely before the
+                # connection can be used again.
+                data = res.read()
+                break
+            except (socket.error, IOError, httplib.HTTPException):
+                c.close()
+                if not reused:
+                    return IOError, None
+                # The server may have closed the connection while it
+                # was idle, so try once more on a new one.
+                reused = False
+                c = self._new_connection()
+
+        self._connections.append(c)
+        status_code = res.status
+        if status_code in (httplib.OK,
+                           httplib.CREATED,
+                           httplib.ACCEPTED,
+                           httplib.NO_CONTENT):
+            return httplib.OK, data
+        return status_code, None
+
+    def _request(self, cmd, subcmd, hosts):
         body = {}
-        body['count'] = 1
-        body['hosts'] = host
+        body['count'] = len(hosts)
+        body['hosts'] = hosts
         cooked = jsonutils.dumps(body)
         headers = {}
         headers['content-type'] = 'application/json'
         headers['Accept'] = 'application/json'
         if self.auth_blob:
             headers['x-auth-blob'] = self.auth_blob
-        status, res = self._do_request(cmd, subcmd, cooked, headers)
+        status, data = self._do_request(cmd, subcmd, cooked, headers)
         if status == httplib.OK:
-            data = res.read()
             return status, jsonutils.loads(data)
         else:
             return status, None
 
-    def _check_trust(self, data, host):
-        for item in data:
-            for state in item['hosts']:
-                if state['host_name'] == host:
-                    return state['trust_lvl']
-        return ""
+    def do_attestation(self, hosts):
+        """Return a dict of trust levels for the given hosts.
 
-    def do_attestation(self, host):
-        state = []
-        status, data = self._request("POST", "PollHosts", host)
+        Trust levels attested less than attestation_auth_timeout seconds
+        ago are reused; the rest are requested with a single PollHosts
+        call.  Hosts without a known trust level are left out.
+        """
+        timeout = CONF.trusted_computing.attestation_auth_timeout
+        now = timeutils.utcnow_ts()
+        levels = {}
+        unknown_hosts = []
+        for host in hosts:
+            cached = self._trust_levels.get(host)
+            if cached and now - cached[1] < timeout:
+                levels[host] = cached[0]
+            else:
+                unknown_hosts.append(host)
+
+        if not unknown_hosts:
+            return levels
+
+        status, data = self._request("POST", "PollHosts", unknown_hosts)
         if status != httplib.OK:
-            return {}
-        state.append(data)
-        return self._check_trust(state, host)
+            return levels
+        for state in data.get('hosts', []):
+            host = state['host_name']
+            levels[host] = state['trust_lvl']
+            self._trust_levels[host] = (state['trust_lvl'], now)
+        return levels
+
+
+_attestation_service = None
+
+
+def _get_attestation_service():
+    """Return the AttestationService shared by all TrustedFilters, so that
+    its connections and cached trust levels outlive a single request.
+    """
+    global _attestation_service
+    if _attestation_service is None:
+        _attestation_service = AttestationService()
+    return _attestation_service
 
 
 class TrustedFilter(filters.BaseHostFilter):
     """Trusted filter to support Trusted Compute Pools."""
 
+    # Trust levels are looked up once for each host within a request
+    run_filter_once_per_request = True
+
     def __init__(self):
-        self.attestation_service = AttestationService()
+        self.attestation_service = _get_attestation_service()
 
-    def _is_trusted(self, host, trust):
-        level = self.attestation_service.do_attestation(host)
+    def _get_trust(self, filter_properties):
+        instance = filter_properties.get('instance_type', {})
+        extra = instance.get('extra_specs', {})
+        return extra.get('trust:trusted_host')
+
+    def _is_trusted(self, host, trust, levels):
+        level = levels.get(host)
         LOG.debug(_("TCP: trust state of "
                     "%(host)s:%(level)s(%(trust)s)") % locals())
         return trust == level
 
+    def filter_all(self, filter_obj_list, filter_properties):
+        """Yield the hosts that match the requested trust, asking the
+        attestation service about all of them at once.
+        """
+        trust = self._get_trust(filter_properties)
+        if not trust:
+            for host_state in filter_obj_list:
+                yield host_state
+            return
+
+        host_states = list(filter_obj_list)
+        levels = self.attestation_service.do_attestation(
+                [host_state.host for host_state in host_states])
+        for host_state in host_states:
+            if self._is_trusted(host_state.host, trust, levels):
+                yield host_state
+
     def host_passes(self, host_state, filter_properties):
-        instance = filter_properties.get('instance_type', {})
-        extra = instance.get('extra_specs', {})
-        trust = extra.get('trust:trusted_host')
+        trust = self._get_trust(filter_properties)
         host = host_state.host
         if trust:
-            return self._is_trusted(host, trust)
+            levels = self.attestation_service.do_attestation([host])
+            return self._is_trusted(host, trust, levels)
         return True
@@ -25,6 +25,9 @@ class TypeAffinityFilter(filters.BaseHostFilter):
     (dispersion) set to 1 (-1 by default).
     """
 
+    # Instances on a host do not change within a request
+    run_filter_once_per_request = True
+
     def host_passes(self, host_state, filter_properties):
         """Dynamically limits hosts to one instance type
 
@@ -46,6 +49,9 @@ class AggregateTypeAffinityFilter(filters.BaseHostFilter):
     key 'instance_type' has the instance_type name as a value
     """
 
+    # Aggregate data does not change within a request
+    run_filter_once_per_request = True
+
     def host_passes(self, host_state, filter_properties):
         instance_type = filter_properties.get('instance_type')
         context = filter_properties['context'].elevated()
@@ -50,10 +50,24 @@ host_manager_opts = [
     cfg.ListOpt('scheduler_weight_classes',
                 default=['nova.scheduler.weights.all_weighers'],
                 help='Which weight class names to use for weighing hosts'),
+    cfg.IntOpt('scheduler_host_state_refresh_interval',
+               default=60,
+               help='Number of seconds between full reloads of the compute '
+                    'node table into the scheduler host state cache.  In '
+                    'between, only compute nodes created or updated since '
+                    'the previous load are read.  Set to 0 to reload all '
+                    'compute nodes on every request.'),
+    cfg.BoolOpt('scheduler_order_filters_by_cost',
+                default=False,
+                help='Run scheduler filters in order of their measured '
+                     'cost per rejected host instead of the configured '
+                     'order, so that cheap and selective filters reduce '
+                     'the hosts seen by expensive ones.'),
     ]
 
 CONF = cfg.CONF
 CONF.register_opts(host_manager_opts)
+CONF.import_opt('compute_topic', 'nova.config')
 
 LOG = logging.getLogger(__name__)
 
@@ -258,6 +272,8 @@ class HostManager(object):
         # { (host, hypervisor_hostname) : { <service> : { cap k : v }}}
         self.service_states = {}
         self.host_state_map = {}
+        self._last_full_refresh = None
+        self._last_refresh = None
         self.filter_handler = filters.HostFilterHandler()
         self.filter_classes = self.filter_handler.get_matching_classes(
                 CONF.scheduler_available_filters)
@@ -293,8 +309,14 @@ class HostManager(object):
 
     def get_filtered_hosts(self, hosts, filter_properties,
             filter_class_names=None):
-        """Filter hosts and return only ones passing all filters"""
+        """Filter hosts and return only ones passing all filters.
+
+        If filter_properties contains a 'filter_cache', it is used to keep
+        filter instances and per-request filter results between calls.
+        """
         filter_classes = self._choose_host_filters(filter_class_names)
+        if CONF.scheduler_order_filters_by_cost:
+            filter_classes = self.filter_handler.order_by_cost(filter_classes)
 
         hosts = set(hosts)
         ignore_hosts = set(filter_properties.get('ignore_hosts', []))
@@ -320,12 +342,15 @@ class HostManager(object):
             hosts = matching_force_hosts
 
         return self.filter_handler.get_filtered_objects(filter_classes,
-                hosts, filter_properties)
+                hosts, filter_properties,
+                filter_cache=filter_properties.get('filter_cache'))
 
-    def get_weighed_hosts(self, hosts, weight_properties):
-        """Weigh the hosts"""
+    def get_weighed_hosts(self, hosts, weight_properties, limit=None):
+        """Weigh the hosts.  If limit is given, only return the limit
+        best hosts.
+        """
         return self.weight_handler.get_weighed_objects(self.weight_classes,
-                hosts, weight_properties)
+                hosts, weight_properties, limit=limit)
 
     def update_service_capabilities(self, service_name, host, capabilities):
         """Update the per-service capabilities based on this notification."""
@@ -343,14 +368,37 @@ class HostManager(object):
         capab_copy["timestamp"] = timeutils.utcnow()  # Reported time
         self.service_states[state_key] = capab_copy
 
+    def _full_refresh_needed(self):
+        """Return True if the host state cache should be rebuilt from
+        every compute node rather than from recently changed ones.
+        """
+        interval = CONF.scheduler_host_state_refresh_interval
+        if interval <= 0 or self._last_full_refresh is None:
+            return True
+        return timeutils.is_older_than(self._last_full_refresh, interval)
+
     def get_all_host_states(self, context):
         """Returns a list of HostStates that represents all the hosts
         the HostManager knows about. Also, each of the consumable resources
         in HostState are pre-populated and adjusted based on data in the db.
+
+        The HostStates are kept between calls.  All compute nodes are read
+        from the db every scheduler_host_state_refresh_interval seconds;
+        in between only compute nodes that changed since the last call are
+        read, and service records and reported capabilities are refreshed
+        from cheaper sources.
         """
+        refresh_time = timeutils.utcnow()
+        full_refresh = self._full_refresh_needed()
 
         # Get resource usage across the available compute nodes:
-        compute_nodes = db.compute_node_get_all(context)
+        if full_refresh:
+            compute_nodes = db.compute_node_get_all(context)
+        else:
+            compute_nodes = db.compute_node_get_all(context,
+                    updated_since=self._last_refresh)
+
+        seen_keys = set()
         for compute in compute_nodes:
             service = compute['service']
             if not service:
@@ -359,6 +407,7 @@ class HostManager(object):
             host = service['host']
             node = compute.get('hypervisor_hostname')
             state_key = (host, node)
+            seen_keys.add(state_key)
             capabilities = self.service_states.get(state_key, None)
             host_state = self.host_state_map.get(state_key)
             if host_state:
@@ -371,4 +420,31 @@ class HostManager(object):
                 self.host_state_map[state_key] = host_state
             host_state.update_from_compute_node(compute)
 
+        if full_refresh:
+            # Forget about compute nodes that have gone away.
+            for state_key in set(self.host_state_map) - seen_keys:
+                del self.host_state_map[state_key]
+            self._last_full_refresh = refresh_time
+        else:
+            self._refresh_unchanged_host_states(context, seen_keys)
+        self._last_refresh = refresh_time
+
         return self.host_state_map.itervalues()
+
+    def _refresh_unchanged_host_states(self, context, updated_keys):
+        """Bring the service records and capabilities of cached HostStates
+        up to date without reloading their compute nodes.
+        """
+        services = dict((service['host'], service)
+                        for service in db.service_get_all(context)
+                        if service['topic'] == CONF.compute_topic)
+        for state_key, host_state in self.host_state_map.iteritems():
+            if state_key in updated_keys:
+                continue
+            service = services.get(host_state.host)
+            if service is not None:
+                service = dict(service.iteritems())
+            else:
+                service = host_state.service.data
+            host_state.update_capabilities(
+                    self.service_states.get(state_key, None), service)
@@ -43,3 +43,7 @@ class RAMWeigher(weights.BaseHostWeigher):
     def _weigh_object(self, host_state, weight_properties):
         """Higher weights win.  We want spreading to be the default."""
         return host_state.free_ram_mb
+
+    def _weigh_columns(self, columns, weight_properties):
+        """Weigh all hosts at once by their free RAM."""
+        return columns['free_ram_mb']
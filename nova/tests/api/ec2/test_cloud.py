@@ -99,6 +99,7 @@ def get_instances_with_cached_ips(orig_func, *args, **kwargs):
 class CloudTestCase(test.TestCase):
     def setUp(self):
         super(CloudTestCase, self).setUp()
+        self.addCleanup(ec2utils.reset_cache)
         self.flags(compute_driver='nova.virt.fake.FakeDriver',
                    volume_api_class='nova.tests.fake_volume.API')
 
@@ -839,6 +840,83 @@ class CloudTestCase(test.TestCase):
         db.service_destroy(self.context, comp1['id'])
         db.service_destroy(self.context, comp2['id'])
 
+    def test_describe_instances_bulk_lookups(self):
+        """Makes sure describe_instances looks up all instances at once."""
+        self._stub_instance_get_with_fixed_ips('get_all')
+
+        image_uuid = 'cedef40a-ed67-4d10-800e-17455edce175'
+        kernel_uuid = 'cedef40a-ed67-4d10-800e-17455edce176'
+        instances = []
+        for i, host in enumerate(['host1', 'host2', 'host1']):
+            instances.append(db.instance_create(self.context,
+                    {'reservation_id': 'a',
+                     'image_ref': image_uuid,
+                     'kernel_id': kernel_uuid,
+                     'instance_type_id': 1,
+                     'host': host,
+                     'hostname': 'server-%d' % i,
+                     'vm_state': 'active'}))
+        db.service_create(self.context, {'host': 'host1',
+                                         'availability_zone': 'zone1',
+                                         'topic': "compute"})
+        db.service_create(self.context, {'host': 'host2',
+                                         'availability_zone': 'zone2',
+                                         'topic': "compute"})
+        db.block_device_mapping_create(self.context,
+                {'instance_uuid': instances[1]['uuid'],
+                 'device_name': '/dev/vdb',
+                 'volume_id': '12345678-1234-1234-1234-123456789012'})
+        self.stubs.Set(self.cloud.volume_api, 'get',
+                       lambda context, volume_id: {'attach_time': '',
+                                                   'status': 'in-use'})
+
+        calls = []
+
+        def counted(name):
+            real = getattr(db, name)
+
+            def wrapped(*args, **kwargs):
+                calls.append(name)
+                return real(*args, **kwargs)
+            self.stubs.Set(db, name, wrapped)
+
+        for name in ['block_device_mapping_get_all_by_instance',
+                     'block_device_mapping_get_all_by_instances',
+                     'ec2_instance_get_by_uuids',
+                     's3_image_get_by_uuid',
+                     's3_image_get_by_uuids',
+                     'service_get_all_by_host',
+                     'service_get_all_by_hosts']:
+            counted(name)
+
+        result = self.cloud.describe_instances(self.context)
+        self.assertEqual(sorted(calls),
+                         ['block_device_mapping_get_all_by_instances',
+                          'ec2_instance_get_by_uuids',
+                          's3_image_get_by_uuids',
+                          'service_get_all_by_hosts'])
+        result = result['reservationSet'][0]['instancesSet']
+        self.assertEqual([i['placement']['availabilityZone'] for i in result],
+                         ['zone1', 'zone2', 'zone1'])
+        self.assertEqual([i['instanceId'] for i in result],
+                         [ec2utils.id_to_ec2_inst_id(instance['uuid'])
+                          for instance in instances])
+        kernel_id = ec2utils.glance_id_to_ec2_id(self.context, kernel_uuid,
+                                                 'aki')
+        self.assertEqual([i['kernelId'] for i in result], [kernel_id] * 3)
+        self.assertEqual([i['rootDeviceType'] for i in result],
+                         ['instance-store'] * 3)
+        self.assertEqual(result[1]['blockDeviceMapping'][0]['deviceName'],
+                         '/dev/vdb')
+        self.assertFalse('blockDeviceMapping' in result[0])
+
+        # The id mappings are now known, so only the rest is looked up
+        del calls[:]
+        self.cloud.describe_instances(self.context)
+        self.assertEqual(sorted(calls),
+                         ['block_device_mapping_get_all_by_instances',
+                          'service_get_all_by_hosts'])
+
     def test_describe_instance_state(self):
         """Makes sure describe_instances for instanceState works."""
 
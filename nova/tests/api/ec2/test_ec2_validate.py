@@ -40,6 +40,7 @@ LOG = logging.getLogger(__name__)
 class EC2ValidateTestCase(test.TestCase):
     def setUp(self):
         super(EC2ValidateTestCase, self).setUp()
+        self.addCleanup(ec2utils.reset_cache)
         self.flags(compute_driver='nova.virt.fake.FakeDriver')
 
         def dumb(*args, **kwargs):
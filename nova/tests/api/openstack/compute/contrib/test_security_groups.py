@@ -1366,6 +1366,34 @@ class SecurityGroupsOutputTest(test.TestCase):
                 name = 'fake-%s-%s' % (i, j)
                 self.assertEqual(group.get('name'), name)
 
+    def test_detail_looks_up_unjoined_groups_together(self):
+        calls = []
+
+        def fake_compute_get_all_unjoined(*args, **kwargs):
+            instances = fake_compute_get_all()
+            for instance in instances:
+                del instance['security_groups']
+            return instances
+
+        def fake_get_by_instances(context, instance_uuids):
+            calls.append(sorted(instance_uuids))
+            return {UUID1: [{'name': 'fake-0-0'}, {'name': 'fake-0-1'}],
+                    UUID2: [{'name': 'fake-1-0'}, {'name': 'fake-1-1'}]}
+
+        self.stubs.Set(compute.api.API, 'get_all',
+                       fake_compute_get_all_unjoined)
+        self.stubs.Set(nova.db, 'security_group_get_by_instances',
+                       fake_get_by_instances)
+        url = '/v2/fake/servers/detail'
+        res = self._make_request(url)
+
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(calls, [[UUID1, UUID2]])
+        for i, server in enumerate(self._get_servers(res.body)):
+            for j, group in enumerate(self._get_groups(server)):
+                name = 'fake-%s-%s' % (i, j)
+                self.assertEqual(group.get('name'), name)
+
     def test_no_instance_passthrough_404(self):
 
         def fake_compute_get(*args, **kwargs):
@@ -17,10 +17,16 @@
 Tests dealing with HTTP rate-limiting.
 """
 
+import copy
 import httplib
+import os
+import socket
 import StringIO
 from xml.dom import minidom
 
+import eventlet
+import eventlet.wsgi
+import fixtures
 from lxml import etree
 import webob
 
@@ -53,6 +59,7 @@ class BaseLimitTestSuite(test.TestCase):
         super(BaseLimitTestSuite, self).setUp()
         self.time = 0.0
         self.stubs.Set(limits.Limit, "_get_time", self._get_time)
+        self.stubs.Set(limits.Limiter, "_get_time", self._get_time)
         self.absolute_limits = {}
 
         def stub_get_project_quotas(context, project_id, usages=True):
@@ -396,6 +403,14 @@ class LimitTest(BaseLimitTestSuite):
         self.assertEqual(4, limit.next_request)
         self.assertEqual(4, limit.last_request)
 
+    def test_deepcopy(self):
+        limit = limits.Limit("GET", "*", "^/servers", 1, 1)
+        limit("GET", "/servers")
+        copied = copy.deepcopy(limit)
+        self.assertEqual(copied.water_level, limit.water_level)
+        self.assertEqual(1, copied("GET", "/servers"))
+        self.assertEqual(None, limit("GET", "/images"))
+
 
 class ParseLimitsTest(BaseLimitTestSuite):
     """
@@ -616,6 +631,43 @@ class LimiterTest(BaseLimitTestSuite):
         results = list(self._check(5, "PUT", "/anything", "user2"))
         self.assertEqual(expected, results)
 
+    def test_only_limits_for_verb_are_checked(self):
+        def fail(verb, url):
+            self.fail("%s limit checked for a PUT" % verb)
+
+        self.limiter.get_limits("user1")
+        levels = self.limiter.levels["user1"]
+        for position, limit in enumerate(levels):
+            if limit.verb != "PUT":
+                levels[position] = fail
+
+        expected = [None] * 10 + [6.0]
+        results = list(self._check(11, "PUT", "/anything", "user1"))
+        self.assertEqual(expected, results)
+
+    def test_idle_users_are_forgotten(self):
+        list(self._check(11, "PUT", "/anything", "user1"))
+        self.time += 30
+        list(self._check(1, "PUT", "/anything", "user2"))
+        self.assertEqual(sorted(self.limiter.levels),
+                         ['user1', 'user2', 'user3'])
+
+        self.time += 30
+        self.limiter.check_for_delay("PUT", "/anything", "user2")
+        self.assertEqual(self.limiter.levels.keys(), ['user2'])
+
+        # A forgotten user starts with a full allowance again, which is
+        # what it had drained to anyway.
+        expected = [None] * 10 + [6.0]
+        results = list(self._check(11, "PUT", "/anything", "user1"))
+        self.assertEqual(expected, results)
+        self.assertEqual(self.limiter.get_limits('user3'), [])
+
+    def test_seen_queue_stays_bounded(self):
+        for i in xrange(1000):
+            self.limiter.get_limits("user1")
+        self.assertTrue(len(self.limiter._seen) < 100)
+
 
 class WsgiLimiterTest(BaseLimitTestSuite):
     """
@@ -687,6 +739,18 @@ class WsgiLimiterTest(BaseLimitTestSuite):
         delay = self._request("GET", "/delayed", "user2")
         self.assertEqual(delay, '60.00')
 
+    def test_limits_returned_when_asked(self):
+        request = webob.Request.blank("/user1")
+        request.method = "POST"
+        request.body = jsonutils.dumps({"verb": "GET", "path": "/delayed",
+                                        "limits": True})
+        response = request.get_response(self.app)
+
+        self.assertEqual(response.status_int, 200)
+        limits = jsonutils.loads(response.body)["limits"]
+        self.assertEqual(len(limits), len(TEST_LIMITS))
+        self.assertEqual(limits[0]["remaining"], 0)
+
 
 class FakeHttplibSocket(object):
     """
@@ -739,6 +803,9 @@ class FakeHttplibConnection(object):
         """Return our generated response from the request."""
         return self.http_response
 
+    def close(self):
+        pass
+
 
 def wire_HTTPConnection_to_WSGI(host, app):
     """Monkeypatches HTTPConnection so that if you try to connect to host, you
@@ -817,6 +884,67 @@ class WsgiLimiterProxyTest(BaseLimitTestSuite):
         super(WsgiLimiterProxyTest, self).tearDown()
 
 
+class SharedLimiterTest(BaseLimitTestSuite):
+    """
+    Tests for the `limits.SharedLimiter` class.
+    """
+
+    def setUp(self):
+        super(SharedLimiterTest, self).setUp()
+        self.app = limits.WsgiLimiter(TEST_LIMITS)
+        oldHTTPConnection = (
+            wire_HTTPConnection_to_WSGI("169.254.0.1:80", self.app))
+        self.addCleanup(setattr, httplib, 'HTTPConnection', oldHTTPConnection)
+        self.limiter = limits.SharedLimiter(limits.DEFAULT_LIMITS,
+                                            limiter_address="169.254.0.1:80")
+
+    def test_delay(self):
+        self.assertEqual(self.limiter.check_for_delay("GET", "/delayed"),
+                         (None, None))
+        delay, error = self.limiter.check_for_delay("GET", "/delayed")
+        self.assertEqual(delay, 60.0)
+        self.assertTrue("Only 1 GET request(s)" in error)
+
+    def test_check_and_get_limits(self):
+        delay, error, limits = self.limiter.check_and_get_limits(
+                "GET", "/delayed", "user1")
+        self.assertEqual((delay, error), (None, None))
+        self.assertEqual(limits[0]["verb"], "GET")
+        self.assertEqual(limits[0]["remaining"], 0)
+
+        delay, error, limits = self.limiter.check_and_get_limits(
+                "GET", "/delayed", "user2")
+        self.assertEqual((delay, error), (None, None))
+        self.assertEqual(limits[0]["remaining"], 0)
+
+
+class SharedLimiterUnixSocketTest(BaseLimitTestSuite):
+    """
+    Tests for `limits.SharedLimiter` talking to a Unix socket.
+    """
+
+    def test_unavailable_limiter_lets_requests_through(self):
+        limiter = limits.SharedLimiter(limiter_address="unix:/nonexistent")
+        self.assertEqual(limiter.check_and_get_limits("GET", "/delayed"),
+                         (None, None, []))
+
+    def test_unix_socket(self):
+        socket_path = os.path.join(self.useFixture(
+                fixtures.TempDir()).path, 'ratelimit.sock')
+        self.flags(ratelimit_socket=socket_path)
+        sock = eventlet.listen(socket_path, family=socket.AF_UNIX)
+        server = eventlet.spawn(eventlet.wsgi.server, sock,
+                                limits.WsgiLimiter(TEST_LIMITS),
+                                log=StringIO.StringIO())
+        self.addCleanup(server.kill)
+
+        limiter = limits.SharedLimiter()
+        self.assertEqual(limiter.check_for_delay("GET", "/delayed"),
+                         (None, None))
+        delay, error = limiter.check_for_delay("GET", "/delayed")
+        self.assertEqual(delay, 60.0)
+
+
 class LimitsViewBuilderTest(test.TestCase):
     def setUp(self):
         super(LimitsViewBuilderTest, self).setUp()
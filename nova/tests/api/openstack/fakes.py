@@ -203,6 +203,9 @@ def stub_out_nw_api(stubs, cls=None, private=None, publics=None):
         def get_instance_nw_info(*args, **kwargs):
             pass
 
+        def get_instances_nw_info(*args, **kwargs):
+            return {}
+
         def get_floating_ips_by_fixed_address(*args, **kwargs):
             return publics
 
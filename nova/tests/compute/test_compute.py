@@ -2474,6 +2474,114 @@ class ComputeTestCase(BaseTestCase):
         self.assertEqual(len(instances), 1)
         self.assertEqual(task_states.POWERING_OFF, instances[0]['task_state'])
 
+    def test_poll_bandwidth_usage_batches_db_calls(self):
+        self.flags(bandwidth_poll_interval=1)
+        self.compute._last_bw_usage_poll = 0
+        ctxt = context.get_admin_context()
+        prev_time, start_time = utils.last_completed_audit_period()
+        bw_counters = [dict(uuid='fake_uuid1', mac_address='fake_mac1',
+                            bw_in=150, bw_out=250),
+                       dict(uuid='fake_uuid1', mac_address='fake_mac2',
+                            bw_in=10, bw_out=20),
+                       dict(uuid='fake_uuid2', mac_address='fake_mac3',
+                            bw_in=5, bw_out=6)]
+
+        self.mox.StubOutWithMock(self.compute.driver, 'get_all_bw_counters')
+        self.mox.StubOutWithMock(self.compute.db, 'bw_usage_get_by_uuids')
+        self.mox.StubOutWithMock(self.compute.db, 'bw_usage_bulk_update')
+        self.compute.driver.get_all_bw_counters(mox.IgnoreArg()).AndReturn(
+                bw_counters)
+        self.compute.db.bw_usage_get_by_uuids(ctxt,
+                mox.SameElementsAs(['fake_uuid1', 'fake_uuid2']),
+                start_time).AndReturn(
+                [dict(uuid='fake_uuid1', mac='fake_mac1', bw_in=1000,
+                      bw_out=2000, last_ctr_in=100, last_ctr_out=200)])
+        self.compute.db.bw_usage_get_by_uuids(ctxt,
+                mox.SameElementsAs(['fake_uuid1', 'fake_uuid2']),
+                prev_time).AndReturn(
+                [dict(uuid='fake_uuid1', mac='fake_mac2', bw_in=0,
+                      bw_out=0, last_ctr_in=4, last_ctr_out=8)])
+        self.compute.db.bw_usage_bulk_update(ctxt, start_time,
+                [dict(uuid='fake_uuid1', mac='fake_mac1', bw_in=1050,
+                      bw_out=2050, last_ctr_in=150, last_ctr_out=250),
+                 dict(uuid='fake_uuid1', mac='fake_mac2', bw_in=6,
+                      bw_out=12, last_ctr_in=10, last_ctr_out=20),
+                 dict(uuid='fake_uuid2', mac='fake_mac3', bw_in=0,
+                      bw_out=0, last_ctr_in=5, last_ctr_out=6)],
+                last_refreshed=mox.IgnoreArg())
+        self.mox.ReplayAll()
+
+        self.compute._poll_bandwidth_usage(ctxt)
+
+    def test_sync_power_states_rereads_only_changed_instances(self):
+        params = {'host': self.compute.host,
+                  'power_state': power_state.RUNNING}
+        in_sync = self._create_fake_instance(params)
+        changed = self._create_fake_instance(params)
+        ctxt = context.get_admin_context()
+
+        self.mox.StubOutWithMock(self.compute.driver, 'get_power_states')
+        self.mox.StubOutWithMock(self.compute.driver, 'get_info')
+        self.mox.StubOutWithMock(self.compute.conductor_api,
+                                 'instance_get_all_by_filters')
+        self.mox.StubOutWithMock(self.compute.compute_api, 'stop')
+        self.compute.driver.get_power_states().AndReturn(
+                {in_sync['name']: power_state.RUNNING,
+                 changed['name']: power_state.SHUTDOWN})
+        self.compute.conductor_api.instance_get_all_by_filters(
+                ctxt, {'uuid': [changed['uuid']]}).AndReturn(
+                [jsonutils.to_primitive(changed)])
+        self.compute.compute_api.stop(ctxt, mox.IgnoreArg())
+        self.mox.ReplayAll()
+
+        self.compute._sync_power_states(ctxt)
+
+        instance = db.instance_get_by_uuid(ctxt, changed['uuid'])
+        self.assertEqual(instance['power_state'], power_state.SHUTDOWN)
+
+    def test_sync_power_states_skips_instance_deleted_meanwhile(self):
+        instance = self._create_fake_instance(
+                {'host': self.compute.host,
+                 'power_state': power_state.RUNNING})
+        ctxt = context.get_admin_context()
+
+        def fake_get_power_states():
+            db.instance_destroy(ctxt, instance['uuid'])
+            return {instance['name']: power_state.SHUTDOWN}
+
+        self.stubs.Set(self.compute.driver, 'get_power_states',
+                       fake_get_power_states)
+        self.mox.StubOutWithMock(self.compute.compute_api, 'stop')
+        self.mox.ReplayAll()
+
+        self.compute._sync_power_states(ctxt)
+
+        instance = db.instance_get_by_uuid(ctxt.elevated(read_deleted='yes'),
+                                           instance['uuid'])
+        self.assertEqual(instance['power_state'], power_state.RUNNING)
+
+    def test_sync_power_states_checks_soft_deleted_instances(self):
+        instance = self._create_fake_instance(
+                {'host': self.compute.host,
+                 'vm_state': vm_states.SOFT_DELETED,
+                 'power_state': power_state.SHUTDOWN})
+        ctxt = context.get_admin_context()
+
+        self.stubs.Set(self.compute.driver, 'get_power_states',
+                       lambda: {instance['name']: power_state.RUNNING})
+        warnings = []
+
+        def fake_warn(msg, *args, **kwargs):
+            warnings.append(msg)
+
+        self.stubs.Set(compute_manager.LOG, 'warn', fake_warn)
+
+        self.compute._sync_power_states(ctxt)
+
+        self.assertTrue(_("Instance is not (soft-)deleted.") in warnings)
+        instance = db.instance_get_by_uuid(ctxt, instance['uuid'])
+        self.assertEqual(instance['power_state'], power_state.RUNNING)
+
     def test_add_instance_fault(self):
         exc_info = None
         instance_uuid = str(uuid.uuid4())
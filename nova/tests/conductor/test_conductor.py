@@ -113,6 +113,15 @@ class ConductorTestCase(BaseTestCase):
         self.assertEqual(orig_instance['name'],
                          all_instances[0]['name'])
 
+    def test_instance_get_all_by_filters(self):
+        orig_instance = jsonutils.to_primitive(self._create_fake_instance())
+        self._create_fake_instance()
+        all_instances = self.conductor.instance_get_all_by_filters(
+            self.context, {'uuid': [orig_instance['uuid']]}, 'created_at',
+            'desc')
+        self.assertEqual([orig_instance['uuid']],
+                         [instance['uuid'] for instance in all_instances])
+
     def _setup_aggregate_with_host(self):
         aggregate_ref = db.aggregate_create(self.context.elevated(),
                 {'name': 'foo', 'availability_zone': 'foo'})
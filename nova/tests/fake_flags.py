@@ -22,6 +22,8 @@ CONF = cfg.CONF
 CONF.import_opt('state_path', 'nova.config')
 CONF.import_opt('scheduler_driver', 'nova.scheduler.manager')
 CONF.import_opt('fake_network', 'nova.network.manager')
+CONF.import_opt('iptables_apply_coalesce_seconds', 'nova.network.linux_net')
+CONF.import_opt('dhcp_update_coalesce_seconds', 'nova.network.linux_net')
 CONF.import_opt('network_size', 'nova.network.manager')
 CONF.import_opt('num_networks', 'nova.network.manager')
 CONF.import_opt('policy_file', 'nova.policy')
@@ -34,6 +36,8 @@ def set_defaults(conf):
     conf.set_default('fake_network', True)
     conf.set_default('fake_rabbit', True)
     conf.set_default('flat_network_bridge', 'br100')
+    conf.set_default('iptables_apply_coalesce_seconds', 0)
+    conf.set_default('dhcp_update_coalesce_seconds', 0)
     conf.set_default('network_size', 8)
     conf.set_default('num_networks', 2)
     conf.set_default('vlan_interface', 'eth0')
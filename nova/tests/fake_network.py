@@ -143,6 +143,25 @@ class FakeNetworkManager(network_manager.NetworkManager):
             return [ip for ip in self.fixed_ips
                     if ip['virtual_interface_id'] == vif_id]
 
+        def fixed_ips_get_by_address_filter(self, context, address_like=None,
+                                            address=None):
+            # Every fixed ip is returned, the manager filters them further
+            vifs = dict((vif['id'], vif) for vif in self.vifs)
+            rows = []
+            for fixed_ip in self.fixed_ips:
+                vif = vifs[fixed_ip['virtual_interface_id']]
+                floating_addresses = [floating_ip['address']
+                                      for floating_ip in self.floating_ips
+                                      if floating_ip['fixed_ip_id'] ==
+                                      fixed_ip['id']]
+                for floating_address in floating_addresses or [None]:
+                    rows.append({'id': fixed_ip['id'],
+                                 'address': fixed_ip['address'],
+                                 'virtual_interface_id': vif['id'],
+                                 'instance_uuid': vif['instance_uuid'],
+                                 'floating_address': floating_address})
+            return rows
+
     def __init__(self):
         self.db = self.FakeDB()
         self.deallocate_called = None
@@ -375,7 +394,13 @@ def stub_out_nw_api_get_instance_nw_info(stubs, func=None,
 
     if func is None:
         func = get_instance_nw_info
+
+    def get_instances_nw_info(self, context, instances):
+        return dict((instance['uuid'], func(self, context, instance))
+                    for instance in instances)
+
     stubs.Set(network_api.API, 'get_instance_nw_info', func)
+    stubs.Set(network_api.API, 'get_instances_nw_info', get_instances_nw_info)
 
 
 _real_functions = {}
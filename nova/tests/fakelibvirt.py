@@ -103,6 +103,7 @@ VIR_FROM_DOMAIN = 200
 VIR_FROM_NWFILTER = 330
 VIR_FROM_REMOTE = 340
 VIR_FROM_RPC = 345
+VIR_ERR_NO_SUPPORT = 3
 VIR_ERR_XML_DETAIL = 350
 VIR_ERR_NO_DOMAIN = 420
 VIR_ERR_NO_NWFILTER = 620
@@ -540,6 +541,14 @@ class Connection(object):
     def listDomainsID(self):
         return self._running_vms.keys()
 
+    def listDefinedDomains(self):
+        running = self._running_vms.values()
+        return [dom.name() for dom in self._vms.values()
+                if dom not in running]
+
+    def listAllDomains(self, flags):
+        return self._vms.values()
+
     def lookupByID(self, id):
         if id in self._running_vms:
             return self._running_vms[id]
@@ -23,6 +23,7 @@ import os
 import pickle
 import sys
 
+from nova.api.ec2 import ec2utils
 from nova import test
 from nova.tests.hyperv import mockproxy
 
@@ -38,6 +39,7 @@ class BaseTestCase(test.TestCase):
 
     def setUp(self):
         super(BaseTestCase, self).setUp()
+        self.addCleanup(ec2utils.reset_cache)
         self._mps = {}
 
     def tearDown(self):
@@ -21,6 +21,7 @@ import mox
 import os
 import tempfile
 
+from nova.api.ec2 import ec2utils
 from nova import context
 import nova.db.api
 from nova import exception
@@ -82,6 +83,7 @@ file_manifest_xml = """<?xml version="1.0" ?>
 class TestS3ImageService(test.TestCase):
     def setUp(self):
         super(TestS3ImageService, self).setUp()
+        self.addCleanup(ec2utils.reset_cache)
         self.context = context.RequestContext(None, None)
 
         # set up one fixture to test shows, should have id '1'
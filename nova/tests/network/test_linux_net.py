@@ -17,6 +17,7 @@
 
 import os
 
+import eventlet
 import mox
 
 from nova import context
@@ -206,6 +207,9 @@ def get_associated(context, network_id, host=None):
             cleaned['instance_hostname'] = instance['hostname']
             cleaned['instance_updated'] = instance['updated_at']
             cleaned['instance_created'] = instance['created_at']
+            first_vif = [v for v in vifs
+                         if v['instance_uuid'] == datum['instance_uuid']][0]
+            cleaned['default_route'] = first_vif['id'] == vif['id']
             result.append(cleaned)
     return result
 
@@ -230,6 +234,7 @@ class LinuxNetworkTestCase(test.TestCase):
         self.stubs.Set(db, 'virtual_interface_get_by_instance', get_vifs)
         self.stubs.Set(db, 'instance_get', get_instance)
         self.stubs.Set(db, 'network_get_associated_fixed_ips', get_associated)
+        self.stubs.Set(linux_net, '_dhcp_files', {})
 
     def test_update_dhcp_for_nw00(self):
         self.flags(use_single_default_gateway=True)
@@ -237,6 +242,7 @@ class LinuxNetworkTestCase(test.TestCase):
         self.mox.StubOutWithMock(self.driver, 'write_to_file')
         self.mox.StubOutWithMock(fileutils, 'ensure_tree')
         self.mox.StubOutWithMock(os, 'chmod')
+        self.mox.StubOutWithMock(os, 'rename')
 
         self.driver.write_to_file(mox.IgnoreArg(), mox.IgnoreArg())
         self.driver.write_to_file(mox.IgnoreArg(), mox.IgnoreArg())
@@ -249,6 +255,9 @@ class LinuxNetworkTestCase(test.TestCase):
         fileutils.ensure_tree(mox.IgnoreArg())
         os.chmod(mox.IgnoreArg(), mox.IgnoreArg())
         os.chmod(mox.IgnoreArg(), mox.IgnoreArg())
+        os.chmod(mox.IgnoreArg(), mox.IgnoreArg())
+        os.rename(mox.IgnoreArg(), mox.IgnoreArg())
+        os.rename(mox.IgnoreArg(), mox.IgnoreArg())
 
         self.mox.ReplayAll()
 
@@ -260,6 +269,7 @@ class LinuxNetworkTestCase(test.TestCase):
         self.mox.StubOutWithMock(self.driver, 'write_to_file')
         self.mox.StubOutWithMock(fileutils, 'ensure_tree')
         self.mox.StubOutWithMock(os, 'chmod')
+        self.mox.StubOutWithMock(os, 'rename')
 
         self.driver.write_to_file(mox.IgnoreArg(), mox.IgnoreArg())
         self.driver.write_to_file(mox.IgnoreArg(), mox.IgnoreArg())
@@ -272,11 +282,91 @@ class LinuxNetworkTestCase(test.TestCase):
         fileutils.ensure_tree(mox.IgnoreArg())
         os.chmod(mox.IgnoreArg(), mox.IgnoreArg())
         os.chmod(mox.IgnoreArg(), mox.IgnoreArg())
+        os.chmod(mox.IgnoreArg(), mox.IgnoreArg())
+        os.rename(mox.IgnoreArg(), mox.IgnoreArg())
+        os.rename(mox.IgnoreArg(), mox.IgnoreArg())
 
         self.mox.ReplayAll()
 
         self.driver.update_dhcp(self.context, "eth0", networks[0])
 
+    def _stub_dnsmasq(self, networks_path):
+        self.flags(networks_path=networks_path)
+        self.executes = []
+
+        def fake_execute(*cmd, **kwargs):
+            self.executes.append(cmd)
+            return 'dnsmasq --dhcp-hostsfile=nova-eth0.conf', ''
+
+        self.stubs.Set(self.driver, '_execute', fake_execute)
+        self.stubs.Set(self.driver, '_dnsmasq_pid_for', lambda dev: 1234)
+        self.stubs.Set(self.driver, '_add_dnsmasq_accept_rules',
+                       lambda dev: None)
+
+    def test_update_dhcp_reloads_only_on_change(self):
+        self.flags(use_single_default_gateway=True)
+        with utils.tempdir() as tmpdir:
+            self._stub_dnsmasq(tmpdir)
+            hup = ('kill', '-HUP', 1234)
+
+            self.driver.update_dhcp(self.context, "eth0", networks[0])
+            self.assertTrue(hup in self.executes)
+            with open(os.path.join(tmpdir, 'nova-eth0.conf')) as f:
+                self.assertEqual(f.read(), self.driver.get_dhcp_hosts(
+                        self.context, networks[0]))
+            with open(os.path.join(tmpdir, 'nova-eth0.opts')) as f:
+                self.assertEqual(f.read(), 'NW-3,3\nNW-4,3')
+
+            # Nothing changed, so dnsmasq is only checked for
+            self.executes = []
+            self.driver.update_dhcp(self.context, "eth0", networks[0])
+            self.assertEqual(self.executes, [('cat', '/proc/1234/cmdline')])
+
+            def get_first_associated(context, network_id, host=None):
+                return get_associated(context, network_id, host)[:1]
+
+            self.stubs.Set(db, 'network_get_associated_fixed_ips',
+                           get_first_associated)
+            self.executes = []
+            self.driver.update_dhcp(self.context, "eth0", networks[0])
+            self.assertTrue(hup in self.executes)
+            with open(os.path.join(tmpdir, 'nova-eth0.conf')) as f:
+                self.assertEqual(f.read(),
+                                 "DE:AD:BE:EF:00:00,fake_instance00.novalocal,"
+                                 "192.168.0.100,net:NW-0")
+            self.assertEqual(sorted(os.listdir(tmpdir)),
+                             ['nova-eth0.conf', 'nova-eth0.opts'])
+
+    def test_update_dhcp_coalesces_concurrent_callers(self):
+        queries = []
+
+        def counting_get_associated(context, network_id, host=None):
+            queries.append(network_id)
+            return get_associated(context, network_id, host)
+
+        self.stubs.Set(db, 'network_get_associated_fixed_ips',
+                       counting_get_associated)
+        with utils.tempdir() as tmpdir:
+            self._stub_dnsmasq(tmpdir)
+            callers = [eventlet.spawn(self.driver.update_dhcp, self.context,
+                                      "eth0", networks[0])
+                       for i in xrange(5)]
+            for caller in callers:
+                caller.wait()
+        self.assertEqual(queries, [0])
+        self.assertEqual(self.executes.count(('kill', '-HUP', 1234)), 1)
+
+    def test_update_dhcp_error_reaches_callers(self):
+        def fail(context, network_id, host=None):
+            raise test.TestingException()
+
+        self.stubs.Set(db, 'network_get_associated_fixed_ips', fail)
+        callers = [eventlet.spawn(self.driver.update_dhcp, self.context,
+                                  "eth0", networks[0])
+                   for i in xrange(2)]
+        for caller in callers:
+            self.assertRaises(test.TestingException, caller.wait)
+
     def test_get_dhcp_hosts_for_nw00(self):
         self.flags(use_single_default_gateway=True)
 
@@ -613,6 +703,53 @@ class LinuxNetworkTestCase(test.TestCase):
         self.mox.ReplayAll()
         manager.apply()
 
+    def test_apply_coalesces_concurrent_callers(self):
+        manager = linux_net.IptablesManager()
+        self.mox.StubOutWithMock(manager, '_apply')
+        manager._apply()
+        manager._apply()
+        self.mox.ReplayAll()
+
+        callers = [eventlet.spawn(manager.apply) for i in xrange(5)]
+        for caller in callers:
+            caller.wait()
+        manager.apply()
+
+    def test_apply_error_reaches_callers(self):
+        manager = linux_net.IptablesManager()
+        self.mox.StubOutWithMock(manager, '_apply')
+        manager._apply().AndRaise(test.TestingException())
+        self.mox.ReplayAll()
+
+        callers = [eventlet.spawn(manager.apply) for i in xrange(2)]
+        for caller in callers:
+            self.assertRaises(test.TestingException, caller.wait)
+
+    def test_apply_only_changed_tables(self):
+        self.flags(use_ipv6=True)
+        manager = linux_net.IptablesManager()
+        executes = []
+
+        def fake_execute(*args, **kwargs):
+            executes.append(args[0] + ' ' + args[-1])
+            return '', ''
+
+        manager.execute = fake_execute
+        manager.apply()
+        self.assertEqual(sorted(executes),
+                         ['ip6tables-restore -c', 'ip6tables-save filter',
+                          'iptables-restore -c', 'iptables-restore -c',
+                          'iptables-save filter', 'iptables-save nat'])
+
+        executes = []
+        manager.apply()
+        self.assertEqual(executes, [])
+
+        manager.ipv4['nat'].add_rule('snat', '-j ACCEPT')
+        manager.apply()
+        self.assertEqual(executes,
+                         ['iptables-save nat', 'iptables-restore -c'])
+
     def test_deferred_unset_apply_ran(self):
         manager = linux_net.IptablesManager()
         manager.iptables_apply_deferred = True
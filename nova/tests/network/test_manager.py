@@ -1365,6 +1365,34 @@ class CommonNetworkTestCase(test.TestCase):
         self.assertEqual(res[0]['instance_uuid'], _vifs[1]['instance_uuid'])
         self.assertEqual(res[1]['instance_uuid'], _vifs[2]['instance_uuid'])
 
+    def test_get_instance_uuids_by_floating_ip_regex(self):
+        manager = fake_network.FakeNetworkManager()
+        _vifs = manager.db.virtual_interface_get_all(None)
+        fake_context = context.RequestContext('user', 'project')
+
+        res = manager.get_instance_uuids_by_ip_filter(fake_context,
+                                                      {'ip': '17..16.1.2'})
+        self.assertEqual(res, [{'instance_uuid': _vifs[1]['instance_uuid'],
+                                'ip': '172.16.1.2'},
+                               {'instance_uuid': _vifs[2]['instance_uuid'],
+                                'ip': '173.16.1.2'}])
+
+    def test_ip_filter_to_like(self):
+        for ip_filter, like in [('10.0.0.1', '10_0_0_1%'),
+                                ('^10\\.0\\.0\\.1$', '10.0.0.1'),
+                                ('.*\\.1$', '%.1'),
+                                ('172.16.0.*', '172_16_0%'),
+                                ('17..16.0.2', '17__16_0_2%'),
+                                ('10.0.0.1+', '10_0_0_1%'),
+                                ('10.0.0.1?', '10_0_0_%'),
+                                ('10.0.[0-9]', '10_0_%'),
+                                ('10.0.0.1|172.16.0.1', '%'),
+                                ('10\\d', '10%'),
+                                ('10_%', '10!_!%%'),
+                                ('10!', '10!!%')]:
+            self.assertEqual(network_manager._ip_filter_to_like(ip_filter),
+                             like)
+
     def test_get_instance_uuids_by_ipv6_regex(self):
         manager = fake_network.FakeNetworkManager()
         _vifs = manager.db.virtual_interface_get_all(None)
@@ -1555,8 +1583,8 @@ class TestFloatingIPManager(network_manager.FloatingIP,
 
 
 class AllocateTestCase(test.TestCase):
-    def test_allocate_for_instance(self):
-        address = "10.10.10.10"
+    def setUp(self):
+        super(AllocateTestCase, self).setUp()
         self.flags(auto_assign_floating_ip=True)
         self.compute = self.start_service('compute')
         self.network = self.start_service('network')
@@ -1566,17 +1594,19 @@ class AllocateTestCase(test.TestCase):
         self.context = context.RequestContext(self.user_id,
                                               self.project_id,
                                               is_admin=True)
+        networks = db.network_get_all(self.context)
+        for network in networks:
+            db.network_update(self.context, network['id'],
+                              {'host': self.network.host})
 
+    def test_allocate_for_instance(self):
+        address = "10.10.10.10"
         db.floating_ip_create(self.context,
                               {'address': address,
                                'pool': 'nova'})
         inst = db.instance_create(self.context, {'host': self.compute.host,
                                                  'display_name': HOST,
                                                  'instance_type_id': 1})
-        networks = db.network_get_all(self.context)
-        for network in networks:
-            db.network_update(self.context, network['id'],
-                              {'host': self.network.host})
         project_id = self.context.project_id
         nw_info = self.network.allocate_for_instance(self.context,
             instance_id=inst['id'], instance_uuid=inst['uuid'],
@@ -1591,6 +1621,42 @@ class AllocateTestCase(test.TestCase):
                                              host=self.network.host,
                                              project_id=project_id)
 
+    def test_get_instances_nw_info(self):
+        for address in ['10.10.10.10', '10.10.10.11']:
+            db.floating_ip_create(self.context, {'address': address,
+                                                 'pool': 'nova'})
+        instances = []
+        for i in range(3):
+            inst = db.instance_create(self.context,
+                                      {'host': self.compute.host,
+                                       'display_name': 'host%d' % i,
+                                       'instance_type_id': 1})
+            instances.append({'instance_uuid': inst['uuid'],
+                              'rxtx_factor': 3,
+                              'host': inst['host']})
+            # The last instance gets no network
+            if i < 2:
+                self.network.allocate_for_instance(self.context,
+                        instance_id=inst['id'], instance_uuid=inst['uuid'],
+                        host=inst['host'], vpn=None, rxtx_factor=3,
+                        project_id=self.context.project_id)
+
+        nw_infos = self.network.get_instances_nw_info(self.context,
+                                                      instances)
+        self.assertEqual(len(nw_infos), 3)
+        for instance in instances:
+            expected = self.network.get_instance_nw_info(self.context,
+                    None, instance['instance_uuid'],
+                    instance['rxtx_factor'], instance['host'])
+            self.assertEqual(nw_infos[instance['instance_uuid']], expected)
+
+        floating_ips = [ip['address']
+                        for uuid in nw_infos
+                        for fixed_ip in nw_infos[uuid].fixed_ips()
+                        for ip in fixed_ip['floating_ips']]
+        self.assertEqual(sorted(floating_ips), ['10.10.10.10', '10.10.10.11'])
+        self.assertEqual(nw_infos[instances[2]['instance_uuid']], [])
+
 
 class FloatingIPTestCase(test.TestCase):
     """Tests nova.network.manager.FloatingIP"""
@@ -145,7 +145,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.next_weight = 1.0
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options,
+                                limit=None):
             self.next_weight += 2.0
             host_state = hosts[0]
             return [weights.WeighedHost(host_state, self.next_weight)]
@@ -176,6 +177,44 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         for weighed_host in weighed_hosts:
             self.assertTrue(weighed_host.obj is not None)
 
+    def test_schedule_batch_placement(self):
+        """Make sure batch placement filters all hosts once and then only
+        the host chosen for each instance."""
+        self.flags(scheduler_batch_placement=True)
+        filtered = []
+
+        def _fake_get_filtered_hosts(hosts, filter_properties):
+            hosts = list(hosts)
+            filtered.append(sorted(h.host for h in hosts))
+            return hosts
+
+        sched = fakes.FakeFilterScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                is_admin=True)
+
+        self.stubs.Set(sched.host_manager, 'get_filtered_hosts',
+                _fake_get_filtered_hosts)
+        fakes.mox_host_manager_db_calls(self.mox, fake_context)
+
+        request_spec = {'num_instances': 4,
+                        'instance_type': {'memory_mb': 2048, 'root_gb': 1,
+                                          'ephemeral_gb': 0,
+                                          'vcpus': 1},
+                        'instance_properties': {'project_id': 1,
+                                                'root_gb': 1,
+                                                'memory_mb': 2048,
+                                                'ephemeral_gb': 0,
+                                                'vcpus': 1,
+                                                'os_type': 'Linux'}}
+        self.mox.ReplayAll()
+        weighed_hosts = sched._schedule(fake_context, request_spec, {})
+        self.assertEqual(['host4', 'host4', 'host4', 'host3'],
+                         [weighed_host.obj.host
+                          for weighed_host in weighed_hosts])
+        self.assertEqual([['host1', 'host2', 'host3', 'host4'],
+                          ['host4'], ['host4'], ['host4'], ['host3']],
+                         filtered)
+
     def test_schedule_prep_resize_doesnt_update_host(self):
         fake_context = context.RequestContext('user', 'project',
                 is_admin=True)
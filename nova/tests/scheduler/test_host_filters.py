@@ -15,7 +15,9 @@
 Tests For Scheduler Host Filters.
 """
 
+import errno
 import httplib
+import socket
 import stubout
 
 from nova import context
@@ -23,8 +25,10 @@ from nova import db
 from nova import exception
 from nova.openstack.common import cfg
 from nova.openstack.common import jsonutils
+from nova.openstack.common import timeutils
 from nova.scheduler import filters
 from nova.scheduler.filters import extra_specs_ops
+from nova.scheduler.filters import trusted_filter
 from nova.scheduler.filters.trusted_filter import AttestationService
 from nova import servicegroup
 from nova import test
@@ -37,24 +41,18 @@ DATA = ''
 
 def stub_out_https_backend(stubs):
     """
-    Stubs out the httplib.HTTPRequest.getresponse to return
-    faked-out data instead of grabbing actual contents of a resource
-
-    The stubbed getresponse() returns an iterator over
-    the data "I am a teapot, short and stout\n"
+    Stubs out AttestationService._do_request to return the faked-out
+    data in DATA instead of talking to an attestation server, and makes
+    sure that no trust levels are cached from earlier tests.
 
     :param stubs: Set of stubout stubs
     """
 
-    class FakeHTTPResponse(object):
-
-        def read(self):
-            return DATA
-
     def fake_do_request(self, *args, **kwargs):
-        return httplib.OK, FakeHTTPResponse()
+        return httplib.OK, DATA
 
     stubs.Set(AttestationService, '_do_request', fake_do_request)
+    stubs.Set(trusted_filter, '_attestation_service', None)
 
 
 class TestFilter(filters.BaseHostFilter):
@@ -252,6 +250,71 @@ class ExtraSpecsOpsTestCase(test.TestCase):
             matches=False)
 
 
+class FakeAttestationConnection(object):
+    """Connection to the attestation server, failing if told to."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.closed = False
+
+    def request(self, method, url, body, headers):
+        if self.fail:
+            raise socket.error(errno.EPIPE, 'Broken pipe')
+
+    def getresponse(self):
+        return self
+
+    @property
+    def status(self):
+        return httplib.OK
+
+    def read(self):
+        return DATA
+
+    def close(self):
+        self.closed = True
+
+
+class AttestationServiceTestCase(test.TestCase):
+    """Test case for connections to the attestation server."""
+
+    def setUp(self):
+        super(AttestationServiceTestCase, self).setUp()
+        self.new_connections = []
+
+        def fake_new_connection(service):
+            conn = FakeAttestationConnection()
+            self.new_connections.append(conn)
+            return conn
+
+        self.stubs.Set(AttestationService, '_new_connection',
+                       fake_new_connection)
+        self.service = AttestationService()
+
+    def test_connection_reused(self):
+        self.assertEqual(self.service._do_request('POST', 'PollHosts', '',
+                                                  {}), (httplib.OK, DATA))
+        self.service._do_request('POST', 'PollHosts', '', {})
+        self.assertEqual(len(self.new_connections), 1)
+        self.assertEqual(self.service._connections, self.new_connections)
+
+    def test_closed_idle_connection_retried_on_new_one(self):
+        idle = FakeAttestationConnection(fail=True)
+        self.service._connections.append(idle)
+        self.assertEqual(self.service._do_request('POST', 'PollHosts', '',
+                                                  {}), (httplib.OK, DATA))
+        self.assertTrue(idle.closed)
+        self.assertEqual(len(self.new_connections), 1)
+        self.assertEqual(self.service._connections, self.new_connections)
+
+    def test_new_connection_failure_not_retried(self):
+        self.stubs.Set(AttestationService, '_new_connection',
+                       lambda service: FakeAttestationConnection(fail=True))
+        self.assertEqual(self.service._do_request('POST', 'PollHosts', '',
+                                                  {}), (IOError, None))
+        self.assertEqual(self.service._connections, [])
+
+
 class HostFiltersTestCase(test.TestCase):
     """Test case for host filters."""
 
@@ -352,6 +415,28 @@ class HostFiltersTestCase(test.TestCase):
 
         self.assertTrue(filt_cls.host_passes(host, filter_properties))
 
+    def test_affinity_different_filter_looks_up_hosts_once(self):
+        filt_cls = self.class_map['DifferentHostFilter']()
+        hosts = [fakes.FakeHostState('host%d' % i, 'node%d' % i, {})
+                 for i in xrange(1, 4)]
+        instance = fakes.FakeInstance(context=self.context,
+                                         params={'host': 'host2'})
+        instance_uuid = instance.uuid
+
+        context = self.context.elevated()
+        filter_properties = {'context': context,
+                             'scheduler_hints': {
+                                'different_host': [instance_uuid], }}
+
+        self.mox.StubOutWithMock(filt_cls.compute_api, 'get_all')
+        filt_cls.compute_api.get_all(context,
+                search_opts={'uuid': [instance_uuid]}).AndReturn(
+                        [{'uuid': instance_uuid, 'host': 'host2'}])
+        self.mox.ReplayAll()
+
+        result = list(filt_cls.filter_all(hosts, filter_properties))
+        self.assertEqual(['host1', 'host3'], [h.host for h in result])
+
     def test_affinity_same_filter_no_list_passes(self):
         filt_cls = self.class_map['SameHostFilter']()
         host = fakes.FakeHostState('host1', 'node1', {})
@@ -1211,6 +1296,52 @@ class HostFiltersTestCase(test.TestCase):
         host = fakes.FakeHostState('host1', 'node1', {})
         self.assertTrue(filt_cls.host_passes(host, filter_properties))
 
+    def test_trusted_filter_batches_hosts(self):
+        global DATA
+        DATA = ('{"hosts":[{"host_name":"host1","trust_lvl":"trusted"},'
+                '{"host_name":"host2","trust_lvl":"untrusted"}]}')
+        requests = []
+
+        def fake_do_request(self, method, action_url, body, headers):
+            requests.append(jsonutils.loads(body))
+            return httplib.OK, DATA
+
+        self.stubs.Set(AttestationService, '_do_request', fake_do_request)
+        filt_cls = self.class_map['TrustedFilter']()
+        extra_specs = {'trust:trusted_host': 'trusted'}
+        filter_properties = {'instance_type': {'memory_mb': 1024,
+                                               'extra_specs': extra_specs}}
+        hosts = [fakes.FakeHostState('host1', 'node1', {}),
+                 fakes.FakeHostState('host2', 'node2', {})]
+        result = list(filt_cls.filter_all(hosts, filter_properties))
+        self.assertEqual(['host1'], [h.host for h in result])
+        self.assertEqual([{'count': 2, 'hosts': ['host1', 'host2']}],
+                         requests)
+
+        # Trust levels are cached, also for new filter instances.
+        filt_cls = self.class_map['TrustedFilter']()
+        self.assertTrue(filt_cls.host_passes(hosts[0], filter_properties))
+        self.assertEqual(1, len(requests))
+
+    def test_trusted_filter_cache_expires(self):
+        global DATA
+        DATA = '{"hosts":[{"host_name":"host1","trust_lvl":"trusted"}]}'
+        self.flags(attestation_auth_timeout=60, group='trusted_computing')
+        filt_cls = self.class_map['TrustedFilter']()
+        extra_specs = {'trust:trusted_host': 'trusted'}
+        filter_properties = {'instance_type': {'memory_mb': 1024,
+                                               'extra_specs': extra_specs}}
+        host = fakes.FakeHostState('host1', 'node1', {})
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.assertTrue(filt_cls.host_passes(host, filter_properties))
+
+        DATA = '{"hosts":[{"host_name":"host1","trust_lvl":"untrusted"}]}'
+        timeutils.advance_time_seconds(59)
+        self.assertTrue(filt_cls.host_passes(host, filter_properties))
+        timeutils.advance_time_seconds(2)
+        self.assertFalse(filt_cls.host_passes(host, filter_properties))
+
     def test_core_filter_passes(self):
         filt_cls = self.class_map['CoreFilter']()
         filter_properties = {'instance_type': {'vcpus': 1}}
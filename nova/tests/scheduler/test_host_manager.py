@@ -16,6 +16,7 @@
 Tests For HostManager
 """
 
+import datetime
 
 from nova.compute import task_states
 from nova.compute import vm_states
@@ -80,7 +81,8 @@ class HostManagerTestCase(test.TestCase):
 
         self.host_manager._choose_host_filters(None).AndReturn(fake_classes)
         self.host_manager.filter_handler.get_filtered_objects(fake_classes,
-                expected_hosts, fake_properties).AndReturn(fake_result)
+                expected_hosts, fake_properties,
+                filter_cache=None).AndReturn(fake_result)
 
         self.mox.ReplayAll()
 
@@ -104,7 +106,8 @@ class HostManagerTestCase(test.TestCase):
         self.host_manager._choose_host_filters(fake_filters).AndReturn(
                 fake_classes)
         self.host_manager.filter_handler.get_filtered_objects(fake_classes,
-                expected_hosts, fake_properties).AndReturn(fake_result)
+                expected_hosts, fake_properties,
+                filter_cache=None).AndReturn(fake_result)
 
         self.mox.ReplayAll()
 
@@ -127,7 +130,8 @@ class HostManagerTestCase(test.TestCase):
 
         self.host_manager._choose_host_filters(None).AndReturn(fake_classes)
         self.host_manager.filter_handler.get_filtered_objects(fake_classes,
-                expected_hosts, fake_properties).AndReturn(fake_result)
+                expected_hosts, fake_properties,
+                filter_cache=None).AndReturn(fake_result)
 
         self.mox.ReplayAll()
 
@@ -150,7 +154,8 @@ class HostManagerTestCase(test.TestCase):
 
         self.host_manager._choose_host_filters(None).AndReturn(fake_classes)
         self.host_manager.filter_handler.get_filtered_objects(fake_classes,
-                expected_hosts, fake_properties).AndReturn(fake_result)
+                expected_hosts, fake_properties,
+                filter_cache=None).AndReturn(fake_result)
 
         self.mox.ReplayAll()
 
@@ -193,7 +198,8 @@ class HostManagerTestCase(test.TestCase):
         self.mox.StubOutWithMock(self.host_manager.filter_handler,
                 'get_filtered_objects')
         self.host_manager.filter_handler.get_filtered_objects(fake_classes,
-                expected_hosts, fake_properties).AndReturn(fake_result)
+                expected_hosts, fake_properties,
+                filter_cache=None).AndReturn(fake_result)
 
         self.host_manager._choose_host_filters(None).AndReturn(fake_classes)
 
@@ -295,6 +301,61 @@ class HostManagerTestCase(test.TestCase):
         self.assertEqual(host_states_map[('host4', 'node4')].free_disk_mb,
                          8388608)
 
+    def test_get_all_host_states_reads_only_changed_nodes(self):
+        context = 'fake_context'
+        self.flags(scheduler_host_state_refresh_interval=60)
+        self.host_manager.service_states = {
+                ('host1', 'node1'): {'enabled': False}}
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'service_get_all')
+        self.mox.StubOutWithMock(host_manager.LOG, 'warn')
+
+        timeutils.set_time_override(datetime.datetime(2012, 1, 1))
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        host_manager.LOG.warn("No service for compute ID 5")
+
+        updated_node = dict(fakes.COMPUTE_NODES[1], free_ram_mb=256)
+        db.compute_node_get_all(context,
+                updated_since=timeutils.utcnow()).AndReturn([updated_node])
+        db.service_get_all(context).AndReturn([
+                dict(host='host1', topic='compute', disabled=True),
+                dict(host='host1', topic='network', disabled=False)])
+
+        self.mox.ReplayAll()
+        self.host_manager.get_all_host_states(context)
+        timeutils.advance_time_seconds(10)
+        self.host_manager.get_all_host_states(context)
+        host_states_map = self.host_manager.host_state_map
+
+        self.assertEqual(len(host_states_map), 4)
+        self.assertEqual(host_states_map[('host2', 'node2')].free_ram_mb,
+                         256)
+        host1_state = host_states_map[('host1', 'node1')]
+        self.assertTrue(host1_state.service['disabled'])
+        self.assertEqual(host1_state.capabilities, {'enabled': False})
+        self.assertEqual(host1_state.free_ram_mb, 512)
+
+    def test_get_all_host_states_full_refresh_drops_old_nodes(self):
+        context = 'fake_context'
+        self.flags(scheduler_host_state_refresh_interval=60)
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(host_manager.LOG, 'warn')
+
+        timeutils.set_time_override(datetime.datetime(2012, 1, 1))
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        host_manager.LOG.warn("No service for compute ID 5")
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES[:2])
+
+        self.mox.ReplayAll()
+        self.host_manager.get_all_host_states(context)
+        timeutils.advance_time_seconds(61)
+        self.host_manager.get_all_host_states(context)
+
+        self.assertEqual(sorted(self.host_manager.host_state_map.keys()),
+                         [('host1', 'node1'), ('host2', 'node2')])
+
 
 class HostStateTestCase(test.TestCase):
     """Test case for HostState class"""
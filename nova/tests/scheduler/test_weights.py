@@ -21,6 +21,7 @@ from nova.scheduler import weights
 from nova import test
 from nova.tests import matchers
 from nova.tests.scheduler import fakes
+from nova import weights as nova_weights
 
 
 class TestWeighedHost(test.TestCase):
@@ -115,3 +116,28 @@ class RamWeigherTestCase(test.TestCase):
         weighed_host = self._get_weighed_host(hostinfo_list)
         self.assertEqual(weighed_host.weight, 8192 * 2)
         self.assertEqual(weighed_host.obj.host, 'host4')
+
+    def test_ram_weigher_without_numpy(self):
+        hostinfo_list = list(self._get_all_hosts())
+        weighed_hosts = self.weight_handler.get_weighed_objects(
+                self.weight_classes, hostinfo_list, {})
+
+        self.stubs.Set(nova_weights, 'numpy', None)
+        expected = self.weight_handler.get_weighed_objects(
+                self.weight_classes, hostinfo_list, {})
+        self.assertEqual([(h.obj.host, h.weight) for h in expected],
+                         [(h.obj.host, h.weight) for h in weighed_hosts])
+        self.assertEqual(['host4', 'host3', 'host2', 'host1'],
+                         [h.obj.host for h in weighed_hosts])
+
+    def test_ram_weigher_limit(self):
+        hostinfo_list = list(self._get_all_hosts())
+        weighed_hosts = self.weight_handler.get_weighed_objects(
+                self.weight_classes, hostinfo_list, {}, limit=2)
+        self.assertEqual(['host4', 'host3'],
+                         [h.obj.host for h in weighed_hosts])
+
+        weighed_hosts = self.weight_handler.get_weighed_objects(
+                self.weight_classes, hostinfo_list, {}, limit=1)
+        self.assertEqual(['host4'], [h.obj.host for h in weighed_hosts])
+        self.assertEqual(8192, weighed_hosts[0].weight)
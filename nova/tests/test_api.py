@@ -214,6 +214,7 @@ class ApiEc2TestCase(test.TestCase):
     """Unit test for the cloud controller on an EC2 API"""
     def setUp(self):
         super(ApiEc2TestCase, self).setUp()
+        self.addCleanup(ec2utils.reset_cache)
         self.host = '127.0.0.1'
         # NOTE(vish): skipping the Authorizer
         roles = ['sysadmin', 'netadmin']
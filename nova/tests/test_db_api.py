@@ -552,9 +552,92 @@ class DbApiTestCase(test.TestCase):
         self.assertEqual(record['instance_hostname'], instance['hostname'])
         self.assertEqual(record['vif_id'], vif['id'])
         self.assertEqual(record['vif_address'], vif['address'])
+        self.assertTrue(record['default_route'])
         data = db.network_get_associated_fixed_ips(ctxt, 1, 'nothing')
         self.assertEqual(len(data), 0)
 
+        values = {'address': 'qux', 'instance_uuid': instance['uuid']}
+        second_vif = db.virtual_interface_create(ctxt, values)
+        values = {'address': 'quux',
+                  'network_id': 1,
+                  'allocated': True,
+                  'instance_uuid': instance['uuid'],
+                  'virtual_interface_id': second_vif['id']}
+        db.fixed_ip_create(ctxt, values)
+        data = db.network_get_associated_fixed_ips(ctxt, 1)
+        self.assertEqual(sorted((record['address'], record['default_route'])
+                                for record in data),
+                         [('baz', True), ('quux', False)])
+
+    def test_fixed_ips_get_by_address_filter(self):
+        ctxt = context.get_admin_context()
+        instance = db.instance_create(ctxt, {})
+        vif = db.virtual_interface_create(ctxt,
+                {'address': 'bar', 'instance_uuid': instance['uuid']})
+        for address in ['10.0.0.2', '10.0.0.21', '10.0.1.2']:
+            db.fixed_ip_create(ctxt, {'address': address,
+                                      'virtual_interface_id': vif['id']})
+        # Not on an interface
+        db.fixed_ip_create(ctxt, {'address': '10.0.0.3'})
+        fixed_ip = db.fixed_ip_get_by_address(ctxt, '10.0.1.2')
+        db.floating_ip_create(ctxt, {'address': '172.16.0.2',
+                                     'fixed_ip_id': fixed_ip['id']})
+
+        def addresses(**kwargs):
+            return sorted((row['address'], row['floating_address'])
+                          for row in db.fixed_ips_get_by_address_filter(
+                                  ctxt, **kwargs))
+
+        self.assertEqual(addresses(address_like='10_0_0_2%'),
+                         [('10.0.0.2', None), ('10.0.0.21', None)])
+        self.assertEqual(addresses(address_like='10.0.0.2'),
+                         [('10.0.0.2', None)])
+        self.assertEqual(addresses(address='10.0.0.2'),
+                         [('10.0.0.2', None)])
+        self.assertEqual(addresses(address_like='172.16%'),
+                         [('10.0.1.2', '172.16.0.2')])
+        self.assertEqual(addresses(address_like='10.0.0.3'), [])
+        self.assertEqual(addresses(address_like='10!_0%'), [])
+        rows = db.fixed_ips_get_by_address_filter(ctxt, address='10.0.1.2')
+        self.assertEqual(rows, [{'id': fixed_ip['id'],
+                                 'address': '10.0.1.2',
+                                 'virtual_interface_id': vif['id'],
+                                 'instance_uuid': instance['uuid'],
+                                 'floating_address': '172.16.0.2'}])
+
+    def test_fixed_ips_get_by_virtual_interfaces(self):
+        ctxt = context.get_admin_context()
+        instances = [db.instance_create(ctxt, {}) for i in range(3)]
+        vifs = [db.virtual_interface_create(ctxt,
+                        {'address': 'mac%d' % i,
+                         'instance_uuid': instance['uuid']})
+                for i, instance in enumerate(instances)]
+        db.fixed_ip_create(ctxt, {'address': '10.0.9.2',
+                                  'virtual_interface_id': vifs[0]['id']})
+        db.fixed_ip_create(ctxt, {'address': '10.0.9.3',
+                                  'virtual_interface_id': vifs[1]['id']})
+        db.fixed_ip_create(ctxt, {'address': '10.0.9.4',
+                                  'virtual_interface_id': vifs[2]['id']})
+        fixed_ip = db.fixed_ip_get_by_address(ctxt, '10.0.9.3')
+        for address in ['172.16.0.2', '172.16.0.3']:
+            db.floating_ip_create(ctxt, {'address': address,
+                                         'fixed_ip_id': fixed_ip['id']})
+
+        uuids = [instances[0]['uuid'], instances[1]['uuid']]
+        found = db.virtual_interface_get_by_instances(ctxt, uuids)
+        self.assertEqual([vif['id'] for vif in found],
+                         [vifs[0]['id'], vifs[1]['id']])
+
+        rows = db.fixed_ips_get_by_virtual_interfaces(
+                ctxt, [vif['id'] for vif in found])
+        self.assertEqual(sorted((row['address'], row['floating_address'],
+                                 row['instance_uuid']) for row in rows),
+                         [('10.0.9.2', None, instances[0]['uuid']),
+                          ('10.0.9.3', '172.16.0.2', instances[1]['uuid']),
+                          ('10.0.9.3', '172.16.0.3', instances[1]['uuid'])])
+        self.assertEqual(db.virtual_interface_get_by_instances(ctxt, []), [])
+        self.assertEqual(db.fixed_ips_get_by_virtual_interfaces(ctxt, []), [])
+
     def test_network_get_all_by_host(self):
         ctxt = context.get_admin_context()
         data = db.network_get_all_by_host(ctxt, 'foo')
@@ -708,6 +791,36 @@ class DbApiTestCase(test.TestCase):
         _compare(bw_usages[2], expected_bw_usages[2])
         timeutils.clear_time_override()
 
+    def test_bw_usage_bulk_update(self):
+        ctxt = context.get_admin_context()
+        start_period = timeutils.utcnow()
+        refreshed = start_period + datetime.timedelta(seconds=10)
+
+        db.bw_usage_update(ctxt, 'fake_uuid1', 'fake_mac1', start_period,
+                           100, 200, 12345, 67890)
+        db.bw_usage_bulk_update(ctxt, start_period,
+                [{'uuid': 'fake_uuid1', 'mac': 'fake_mac1',
+                  'bw_in': 200, 'bw_out': 300,
+                  'last_ctr_in': 22345, 'last_ctr_out': 77890},
+                 {'uuid': 'fake_uuid2', 'mac': 'fake_mac2',
+                  'bw_in': 0, 'bw_out': 0,
+                  'last_ctr_in': 42, 'last_ctr_out': 43}],
+                last_refreshed=refreshed)
+
+        bw_usages = db.bw_usage_get_by_uuids(ctxt,
+                ['fake_uuid1', 'fake_uuid2'], start_period)
+        self.assertEqual(len(bw_usages), 2)
+        bw_usages = dict((bw_usage['uuid'], bw_usage)
+                         for bw_usage in bw_usages)
+        self.assertEqual(bw_usages['fake_uuid1']['bw_in'], 200)
+        self.assertEqual(bw_usages['fake_uuid1']['last_ctr_out'], 77890)
+        self.assertEqual(bw_usages['fake_uuid1']['last_refreshed'],
+                         refreshed)
+        self.assertEqual(bw_usages['fake_uuid2']['mac'], 'fake_mac2')
+        self.assertEqual(bw_usages['fake_uuid2']['last_ctr_in'], 42)
+        self.assertEqual(bw_usages['fake_uuid2']['start_period'],
+                         start_period)
+
 
 def _get_fake_aggr_values():
     return {'name': 'fake_aggregate',
@@ -1140,6 +1253,29 @@ class CapacityTestCase(test.TestCase):
         self.assertEqual(2, int(stats['num_proj_12345']))
         self.assertEqual(3, int(stats['num_vm_building']))
 
+    def test_compute_node_get_all_updated_since(self):
+        def _create(host):
+            values = dict(self.compute_node_dict, host=host, stats={})
+            return db.compute_node_create(self.ctxt, values)
+
+        start = datetime.datetime(2012, 1, 1, 0, 0, 0)
+        timeutils.set_time_override(start)
+        _create('host1')
+        item2 = _create('host2')
+
+        timeutils.advance_time_seconds(10)
+        since = timeutils.utcnow()
+        nodes = db.compute_node_get_all(self.ctxt, updated_since=since)
+        self.assertEqual([], nodes)
+
+        timeutils.advance_time_seconds(10)
+        db.compute_node_update(self.ctxt, item2['id'], {'vcpus': 4})
+        item3 = _create('host3')
+        nodes = db.compute_node_get_all(self.ctxt, updated_since=since)
+        self.assertEqual(set([item2['id'], item3['id']]),
+                         set([node['id'] for node in nodes]))
+        timeutils.clear_time_override()
+
     def test_compute_node_update(self):
         item = self._create_helper('host1')
 
@@ -1279,6 +1415,36 @@ class TestIpAllocation(test.TestCase):
         self.assertEqual(fixed_ip['instance_uuid'], self.instance['uuid'])
         self.assertEqual(fixed_ip['network_id'], self.network['id'])
 
+    def test_fixed_ip_associate_pool_uses_each_free_ip(self):
+        network_id = self.network['id']
+        free = set()
+        for i in xrange(2, 7):
+            free.add(self.create_fixed_ip(address='192.168.0.%d' % i,
+                                          network_id=network_id))
+        self.create_fixed_ip(address='192.168.0.7', network_id=network_id,
+                             reserved=True)
+        self.create_fixed_ip(address='192.168.0.8', network_id=network_id,
+                             host='foo')
+        free.add(self.create_fixed_ip(address='192.168.0.9'))
+
+        allocated = set()
+        for ip in free:
+            allocated.add(db.fixed_ip_associate_pool(self.ctxt, network_id,
+                                                     self.instance['uuid']))
+        self.assertEqual(allocated, free)
+        self.assertRaises(exception.NoMoreFixedIps,
+                          db.fixed_ip_associate_pool,
+                          self.ctxt, network_id, self.instance['uuid'])
+
+        fixed_ip = db.fixed_ip_get_by_address(self.ctxt, '192.168.0.9')
+        self.assertEqual(fixed_ip['network_id'], network_id)
+        self.assertEqual(fixed_ip['instance_uuid'], self.instance['uuid'])
+
+    def test_fixed_ip_associate_pool_no_ips(self):
+        self.assertRaises(exception.NoMoreFixedIps,
+                          db.fixed_ip_associate_pool,
+                          self.ctxt, self.network['id'])
+
 
 class InstanceDestroyConstraints(test.TestCase):
 
@@ -123,3 +123,72 @@ class FiltersTestCase(test.TestCase):
                                                      filter_objs_initial,
                                                      filter_properties)
         self.assertEqual(result, filter_objs_last)
+
+    def _get_filter_handler(self):
+        def _fake_base_loader_init(*args, **kwargs):
+            pass
+
+        self.stubs.Set(loadables.BaseLoader, '__init__',
+                       _fake_base_loader_init)
+        return filters.BaseFilterHandler(filters.BaseFilter)
+
+    def test_get_filtered_objects_with_filter_cache(self):
+        calls = []
+
+        class OncePerRequestFilter(filters.BaseFilter):
+            run_filter_once_per_request = True
+
+            def _filter_one(self, obj, filter_properties):
+                calls.append(('once', obj))
+                return obj != 'obj2'
+
+        class EveryTimeFilter(filters.BaseFilter):
+            def _filter_one(self, obj, filter_properties):
+                calls.append(('every', obj))
+                return True
+
+        filter_handler = self._get_filter_handler()
+        filter_classes = [OncePerRequestFilter, EveryTimeFilter]
+        filter_cache = filters.FilterCache()
+        for x in xrange(2):
+            result = filter_handler.get_filtered_objects(filter_classes,
+                    ['obj1', 'obj2', 'obj3'], 'fake_filter_properties',
+                    filter_cache=filter_cache)
+            self.assertEqual(result, ['obj1', 'obj3'])
+
+        self.assertEqual(calls, [('once', 'obj1'), ('once', 'obj2'),
+                                 ('once', 'obj3'),
+                                 ('every', 'obj1'), ('every', 'obj3'),
+                                 ('every', 'obj1'), ('every', 'obj3')])
+        self.assertTrue(filter_cache.get_filter(EveryTimeFilter) is
+                        filter_cache.get_filter(EveryTimeFilter))
+
+    def test_order_by_cost(self):
+        filter_handler = self._get_filter_handler()
+
+        class Unmeasured(filters.BaseFilter):
+            pass
+
+        # Expensive and unselective.
+        filter_handler._record_filter_stats(Filter1, 10.0, 100, 90)
+        # Cheap and selective.
+        filter_handler._record_filter_stats(Filter2, 1.0, 100, 10)
+
+        self.assertEqual(
+                filter_handler.order_by_cost([Filter1, Filter2, Unmeasured]),
+                [Unmeasured, Filter2, Filter1])
+
+    def test_get_filtered_objects_records_stats(self):
+        filter_handler = self._get_filter_handler()
+        self.mox.StubOutWithMock(Filter1, '_filter_one')
+        Filter1._filter_one('obj1', 'fake_filter_properties').AndReturn(True)
+        Filter1._filter_one('obj2', 'fake_filter_properties').AndReturn(
+                False)
+        self.mox.ReplayAll()
+
+        filter_handler.get_filtered_objects([Filter1, Filter2],
+                ['obj1', 'obj2'], 'fake_filter_properties')
+        self.assertEqual(filter_handler.filter_stats[Filter1]['objects'], 2)
+        self.assertEqual(filter_handler.filter_stats[Filter1]['passed'], 1)
+        self.assertEqual(filter_handler.filter_stats[Filter2]['objects'], 1)
+        self.assertEqual(filter_handler.filter_stats[Filter2]['passed'], 1)
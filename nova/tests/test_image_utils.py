@@ -14,9 +14,18 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
+import os
+import struct
+
+import fixtures
+
+from nova import exception
+from nova.image import glance
 from nova import test
 from nova import utils
 
+from nova.virt.disk import api as disk_api
 from nova.virt import images
 from nova.virt.libvirt import utils as libvirt_utils
 
@@ -216,3 +225,210 @@ ID        TAG                 VM SIZE                DATE       VM CLOCK
         self.assertEquals(67108864, image_info.virtual_size)
         self.assertEquals(98304, image_info.disk_size)
         self.assertEquals(3, len(image_info.snapshots))
+
+
+class ImageInfoTestCase(test.TestCase):
+    def setUp(self):
+        super(ImageInfoTestCase, self).setUp()
+        self.tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.stubs.Set(images, '_image_info_cache', None)
+
+    def _write(self, name, data):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def _write_qcow2(self, name, size, backing_file=''):
+        header = struct.pack('>4sIQIIQ', 'QFI\xfb', 2,
+                             512 if backing_file else 0,
+                             len(backing_file), 16, size)
+        return self._write(name, header.ljust(512, '\0') + backing_file)
+
+    def test_qcow2_header(self):
+        path = self._write_qcow2('disk', 20 * 1024 ** 3, 'base/abcdef')
+        self.mox.StubOutWithMock(utils, 'execute')
+        self.mox.ReplayAll()
+
+        info = images.image_info(path)
+        self.assertEquals('qcow2', info.file_format)
+        self.assertEquals(20 * 1024 ** 3, info.virtual_size)
+        self.assertEquals(65536, info.cluster_size)
+        self.assertEquals(os.path.join(self.tmpdir, 'base/abcdef'),
+                          info.backing_file)
+        self.assertEquals('abcdef',
+                          libvirt_utils.get_disk_backing_file(path))
+
+    def test_qcow2_without_backing_file(self):
+        path = self._write_qcow2('disk', 1024)
+        info = images.image_info(path)
+        self.assertEquals('qcow2', info.file_format)
+        self.assertEquals(None, info.backing_file)
+
+    def test_raw_uses_qemu_img_once(self):
+        path = self._write('disk', '\0' * 4096)
+        output = """image: %s
+file format: raw
+virtual size: 4.0K (4096 bytes)
+disk size: 4.0K
+""" % path
+        self.mox.StubOutWithMock(utils, 'execute')
+        utils.execute('env', 'LC_ALL=C', 'LANG=C',
+                      'qemu-img', 'info', path).AndReturn((output, ''))
+        self.mox.ReplayAll()
+
+        self.assertEquals('raw', libvirt_utils.get_disk_type(path))
+        self.assertEquals(4096, libvirt_utils.get_disk_size(path))
+        self.assertEquals(None, libvirt_utils.get_disk_backing_file(path))
+
+    def test_raw_format_known_uses_file_size(self):
+        # A header qemu-img would probe as another format does not matter
+        # when the caller uses the file as raw.
+        path = self._write('disk', 'KDMV'.ljust(4096, '\0'))
+        self.mox.StubOutWithMock(utils, 'execute')
+        self.mox.ReplayAll()
+
+        info = images.image_info(path, file_format='raw')
+        self.assertEquals('raw', info.file_format)
+        self.assertEquals(4096, info.virtual_size)
+        self.assertEquals(None, info.backing_file)
+        self.assertEquals(4096, disk_api.get_disk_size(path, 'raw'))
+
+    def test_only_qcow2_headers_are_recognised(self):
+        for header in ('\0' * 512, 'COWD', 'WithouFreSpacExt', 'KDMV',
+                       'QFI'):
+            path = self._write('disk', header.ljust(512, '\0'))
+            self.assertEquals(None, images.ImageHeaderInfo.read(path))
+
+    def test_other_formats_use_qemu_img(self):
+        path = self._write('disk.vmdk', 'KDMV' + '\0' * 508)
+        output = """image: %s
+file format: vmdk
+virtual size: 2K (2048 bytes)
+disk size: 96K
+""" % path
+        self.mox.StubOutWithMock(utils, 'execute')
+        utils.execute('env', 'LC_ALL=C', 'LANG=C',
+                      'qemu-img', 'info', path).AndReturn((output, ''))
+        self.mox.ReplayAll()
+
+        self.assertEquals('vmdk', libvirt_utils.get_disk_type(path))
+        self.assertEquals(2048, libvirt_utils.get_disk_size(path))
+
+    def test_cached_until_file_changes(self):
+        path = self._write_qcow2('disk', 1024)
+        reads = []
+        real_read = images.ImageHeaderInfo.read
+
+        def fake_read(path):
+            reads.append(path)
+            return real_read(path)
+
+        self.stubs.Set(images.ImageHeaderInfo, 'read', staticmethod(fake_read))
+        images.image_info(path)
+        images.image_info(path)
+        self.assertEquals(1, len(reads))
+
+        self._write_qcow2('disk', 2048, 'base')
+        self.assertEquals(2048, images.image_info(path).virtual_size)
+        self.assertEquals(2, len(reads))
+
+
+class FakeImageService(object):
+    def __init__(self, data):
+        self.data = data
+        self.downloads = 0
+
+    def show(self, context, image_id):
+        return {'id': image_id, 'size': len(self.data),
+                'checksum': hashlib.md5(self.data).hexdigest()}
+
+    def download(self, context, image_id, data):
+        self.downloads += 1
+        for i in xrange(0, len(self.data), 1024):
+            data.write(self.data[i:i + 1024])
+
+
+class FetchToRawTestCase(test.TestCase):
+    def setUp(self):
+        super(FetchToRawTestCase, self).setUp()
+        self.tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.path = os.path.join(self.tmpdir, 'base')
+        self.image_service = FakeImageService('\1' * 10000)
+        self.stubs.Set(glance, 'get_remote_image_service',
+                       lambda context, href: (self.image_service, href))
+
+    def _stub_qemu_img_info(self):
+        def fake_qemu_img_info(path):
+            return (images.ImageHeaderInfo.read(path) or
+                    images.ImageHeaderInfo(path, 'raw',
+                                           os.path.getsize(path)))
+
+        self.stubs.Set(images, 'qemu_img_info', fake_qemu_img_info)
+
+    def test_raw_image_checksummed_while_streaming(self):
+        part = self.path + '.part'
+        output = """image: %s
+file format: raw
+virtual size: 9.8K (10000 bytes)
+""" % part
+        self.mox.StubOutWithMock(utils, 'execute')
+        utils.execute('env', 'LC_ALL=C', 'LANG=C',
+                      'qemu-img', 'info', part).AndReturn((output, ''))
+        self.mox.ReplayAll()
+
+        checksum = images.fetch_to_raw(None, 'image', self.path, None, None)
+
+        self.assertEqual(checksum,
+                         hashlib.sha1(self.image_service.data).hexdigest())
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), self.image_service.data)
+        self.assertFalse(os.path.exists(self.path + '.part'))
+
+    def test_qcow2_image_converted(self):
+        header = struct.pack('>4sIQIIQ', 'QFI\xfb', 2, 0, 0, 16, 10000)
+        self.image_service.data = header.ljust(512, '\0')
+
+        def fake_convert(source, dest, out_format):
+            with open(dest, 'wb') as f:
+                f.write('\0' * 10000)
+
+        self.stubs.Set(images, 'convert_image', fake_convert)
+        self._stub_qemu_img_info()
+
+        checksum = images.fetch_to_raw(None, 'image', self.path, None, None)
+
+        self.assertEqual(checksum, None)
+        self.assertEqual(os.path.getsize(self.path), 10000)
+        self.assertFalse(os.path.exists(self.path + '.part'))
+
+    def test_backing_file_rejected(self):
+        self._stub_qemu_img_info()
+        header = struct.pack('>4sIQIIQ', 'QFI\xfb', 2, 512, 9, 16, 10000)
+        self.image_service.data = header.ljust(512, '\0') + '/etc/shadow'
+
+        self.assertRaises(exception.ImageUnacceptable, images.fetch_to_raw,
+                          None, 'image', self.path, None, None)
+        self.assertFalse(os.path.exists(self.path + '.part'))
+
+    def test_completed_download_reused(self):
+        self._stub_qemu_img_info()
+        with open(self.path + '.part', 'wb') as f:
+            f.write(self.image_service.data)
+
+        checksum = images.fetch_to_raw(None, 'image', self.path, None, None)
+
+        self.assertEqual(self.image_service.downloads, 0)
+        self.assertEqual(checksum,
+                         hashlib.sha1(self.image_service.data).hexdigest())
+
+    def test_truncated_download_fetched_again(self):
+        self._stub_qemu_img_info()
+        with open(self.path + '.part', 'wb') as f:
+            f.write(self.image_service.data[:5000])
+
+        images.fetch_to_raw(None, 'image', self.path, None, None)
+
+        self.assertEqual(self.image_service.downloads, 1)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), self.image_service.data)
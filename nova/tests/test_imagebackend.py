@@ -15,6 +15,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import eventlet
+from eventlet import event
 import fixtures
 import os
 
@@ -111,6 +113,69 @@ class _ImageTestCase(test.TestCase):
         self.mox.VerifyAll()
 
 
+class FetchOnceTestCase(test.TestCase):
+    def setUp(self):
+        super(FetchOnceTestCase, self).setUp()
+        self.flags(disable_process_locking=True,
+                   instances_path=self.useFixture(fixtures.TempDir()).path)
+        self.template_path = os.path.join(CONF.instances_path, '_base',
+                                          'template')
+        self.release = event.Event()
+        self.fetches = []
+
+    def _fetch(self, target, fail=False):
+        self.fetches.append(target)
+        self.release.wait()
+        if fail:
+            raise test.TestingException()
+        with open(target, 'w') as f:
+            f.write('image')
+
+    def _cache(self, instance, fn):
+        image = imagebackend.Raw(instance, 'disk')
+
+        def create_image(prepare_template, base, size, *args, **kwargs):
+            prepare_template(target=base, *args, **kwargs)
+        image.create_image = create_image
+        image.cache(fn, 'template')
+
+    def test_concurrent_requests_share_one_fetch(self):
+        threads = [eventlet.spawn(self._cache, 'instance%d' % i, self._fetch)
+                   for i in xrange(5)]
+        eventlet.sleep(0)
+        self.assertEqual(imagebackend._fetches.keys(),
+                         [('template', self.template_path)])
+
+        self.release.send()
+        for thread in threads:
+            thread.wait()
+        self.assertEqual(self.fetches, [self.template_path])
+        self.assertEqual(imagebackend._fetches, {})
+
+    def test_waiters_fetch_again_after_failure(self):
+        def failing_fetch(target):
+            self._fetch(target, fail=True)
+
+        leader = eventlet.spawn(self._cache, 'instance0', failing_fetch)
+        eventlet.sleep(0)
+        waiter = eventlet.spawn(self._cache, 'instance1', self._fetch)
+        eventlet.sleep(0)
+
+        self.release.send()
+        self.assertRaises(test.TestingException, leader.wait)
+        waiter.wait()
+        self.assertEqual(self.fetches, [self.template_path] * 2)
+        self.assertTrue(os.path.exists(self.template_path))
+
+    def test_progress(self):
+        fetch = imagebackend._Fetch(self.template_path)
+        self.assertEqual(fetch.progress(), 0)
+        fileutils.ensure_tree(os.path.dirname(self.template_path))
+        with open(self.template_path + '.part', 'w') as f:
+            f.write('12345')
+        self.assertEqual(fetch.progress(), 5)
+
+
 class RawTestCase(_ImageTestCase):
 
     SIZE = 1024
@@ -152,7 +217,7 @@ class RawTestCase(_ImageTestCase):
         fn = self.prepare_mocks()
         fn(target=self.TEMPLATE_PATH, image_id=None)
         imagebackend.libvirt_utils.copy_image(self.TEMPLATE_PATH, self.PATH)
-        imagebackend.disk.extend(self.PATH, self.SIZE)
+        imagebackend.disk.extend(self.PATH, self.SIZE, file_format='raw')
         self.mox.ReplayAll()
 
         image = self.image_class(self.INSTANCE, self.NAME)
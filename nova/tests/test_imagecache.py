@@ -596,6 +596,146 @@ class ImageCacheManagerTestCase(test.TestCase):
                 self.assertNotEqual(stream.getvalue().find('Failed to remove'),
                                     -1)
 
+    def _make_index_fixture(self, tmpdir):
+        """Make a base image and an instance disk backed by it."""
+        self.flags(instances_path=tmpdir)
+        fingerprint = '17d1b00b81642842e514494a78e804e9a511637c'
+        base_dir = os.path.join(tmpdir, CONF.base_dir_name)
+        os.mkdir(base_dir)
+        base_file = os.path.join(base_dir, fingerprint)
+        with open(base_file, 'w') as f:
+            f.write('data')
+
+        os.mkdir(os.path.join(tmpdir, 'instance-00000001'))
+        disk_path = os.path.join(tmpdir, 'instance-00000001', 'disk')
+        with open(disk_path, 'w') as f:
+            f.write('disk')
+
+        return base_file, disk_path
+
+    def _list_backing_images(self, image_cache_manager):
+        base_dir = os.path.join(CONF.instances_path, CONF.base_dir_name)
+        image_cache_manager._reset_state()
+        image_cache_manager.instance_names = set(['instance-00000001'])
+        image_cache_manager._list_base_images(base_dir)
+        return image_cache_manager._list_backing_images()
+
+    def test_register_instance_disk(self):
+        with utils.tempdir() as tmpdir:
+            base_file, disk_path = self._make_index_fixture(tmpdir)
+            self.stubs.Set(virtutils, 'get_disk_backing_file',
+                           lambda path: os.path.basename(base_file))
+
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.register_instance_disk('instance-00000001',
+                                                       disk_path)
+
+            info = imagecache.read_stored_info(base_file)
+            self.assertEqual({'instance-00000001': os.stat(disk_path).st_ino},
+                             info['references'])
+            self.assertEqual(os.path.basename(base_file),
+                             info['fingerprint'])
+            self.assertEqual(4, info['size'])
+            self.assertTrue(info['last-used'] > time.time() - 60)
+
+            image_cache_manager.unregister_instance_disk('instance-00000001',
+                                                         disk_path)
+            info = imagecache.read_stored_info(base_file)
+            self.assertEqual({}, info['references'])
+
+    def test_list_backing_images_uses_index(self):
+        with utils.tempdir() as tmpdir:
+            base_file, disk_path = self._make_index_fixture(tmpdir)
+            self.stubs.Set(virtutils, 'get_disk_backing_file',
+                           lambda path: os.path.basename(base_file))
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.register_instance_disk('instance-00000001',
+                                                       disk_path)
+
+            def fail_get_disk_backing_file(path):
+                self.fail('%s is in the index' % path)
+
+            self.stubs.Set(virtutils, 'get_disk_backing_file',
+                           fail_get_disk_backing_file)
+            inuse_images = self._list_backing_images(image_cache_manager)
+            self.assertEqual([base_file], inuse_images)
+
+    def test_list_backing_images_replaced_disk(self):
+        with utils.tempdir() as tmpdir:
+            base_file, disk_path = self._make_index_fixture(tmpdir)
+            self.stubs.Set(virtutils, 'get_disk_backing_file',
+                           lambda path: os.path.basename(base_file))
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.register_instance_disk('instance-00000001',
+                                                       disk_path)
+
+            # A disk written elsewhere and moved in place, as a migration
+            # does, is a new inode which is no longer backed by anything
+            new_disk_path = disk_path + '.new'
+            with open(new_disk_path, 'w') as f:
+                f.write('disk')
+            os.rename(new_disk_path, disk_path)
+            self.stubs.Set(virtutils, 'get_disk_backing_file',
+                           lambda path: None)
+
+            inuse_images = self._list_backing_images(image_cache_manager)
+            self.assertEqual([], inuse_images)
+            info = imagecache.read_stored_info(base_file)
+            self.assertEqual({}, info['references'])
+
+            # It is only inspected once though
+            def fail_get_disk_backing_file(path):
+                self.fail('%s was already inspected' % path)
+
+            self.stubs.Set(virtutils, 'get_disk_backing_file',
+                           fail_get_disk_backing_file)
+            inuse_images = self._list_backing_images(image_cache_manager)
+            self.assertEqual([], inuse_images)
+
+    def test_list_backing_images_prunes_deleted_instances(self):
+        with utils.tempdir() as tmpdir:
+            base_file, disk_path = self._make_index_fixture(tmpdir)
+            imagecache._update_references(base_file,
+                                          added={'instance-00000002': 1})
+
+            self.stubs.Set(virtutils, 'get_disk_backing_file',
+                           lambda path: os.path.basename(base_file))
+            image_cache_manager = imagecache.ImageCacheManager()
+            inuse_images = self._list_backing_images(image_cache_manager)
+
+            self.assertEqual([base_file], inuse_images)
+            info = imagecache.read_stored_info(base_file)
+            self.assertEqual({'instance-00000001': os.stat(disk_path).st_ino},
+                             info['references'])
+
+    def test_verify_checksum_size_changed(self):
+        img = {'container_format': 'ami', 'id': '42'}
+
+        self.flags(checksum_base_images=True)
+
+        with utils.tempdir() as tmpdir:
+            base_file, disk_path = self._make_index_fixture(tmpdir)
+            imagecache._update_references(base_file)
+
+            # The checksum still matches, only the recorded size does not
+            with open(base_file, 'a') as f:
+                f.write('more data')
+            imagecache.write_stored_checksum(base_file)
+
+            image_cache_manager = imagecache.ImageCacheManager()
+            res = image_cache_manager._verify_checksum(img, base_file)
+            self.assertFalse(res)
+
+    def test_remove_base_file_recently_used(self):
+        with self._make_base_file() as fname:
+            os.utime(fname, (-1, time.time() - 3601))
+            imagecache.write_stored_info(fname, field='last-used',
+                                         value=time.time())
+
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager._remove_base_file(fname)
+            self.assertTrue(os.path.exists(fname))
+
     def test_handle_base_image_unused(self):
         img = '123'
 
@@ -820,6 +960,9 @@ class ImageCacheManagerTestCase(test.TestCase):
         # Fake out verifying checksums, as that is tested elsewhere
         self.stubs.Set(image_cache_manager, '_verify_checksum',
                        lambda x, y: y == hashed_42)
+        self.stubs.Set(imagecache, 'read_stored_info',
+                       lambda target, field=None, timestamped=False:
+                           None if field else {})
 
         # Fake getmtime as well
         orig_getmtime = os.path.getmtime
@@ -170,3 +170,41 @@ class IptablesManagerTestCase(test.TestCase):
             self.assertTrue('[0:0] -A %s -j %s-%s' %
                             (chain, self.binary_name, chain) in new_lines,
                             "Built-in chain %s not wrapped" % (chain,))
+
+    def test_top_rules_keep_counters(self):
+        top_rule = '-A FORWARD -j nova-filter-top'
+        current_lines = [line.replace('[0:0] ' + top_rule,
+                                      '[42:4242] ' + top_rule)
+                         for line in self.sample_filter]
+        new_lines = self.manager._modify_rules(current_lines,
+                                               self.manager.ipv4['filter'])
+
+        forward_rules = [line for line in new_lines
+                         if '-A FORWARD ' in line]
+        self.assertEqual(forward_rules[0],
+                         '[42:4242] -A FORWARD -j nova-filter-top ')
+        self.assertEqual(len([line for line in forward_rules
+                              if '-j nova-filter-top' in line]), 1)
+
+    def test_unwrapped_chain_removal(self):
+        current_lines = self.sample_filter[:-2] + [
+                ':nova-shared - [0:0]',
+                '[7:700] -A nova-shared -j DROP ',
+                '[3:300] -A FORWARD -j nova-shared ',
+                'COMMIT']
+        table = self.manager.ipv4['filter']
+        table.add_chain('nova-shared', wrap=False)
+        table.add_rule('nova-shared', '-j DROP', wrap=False)
+        table.add_rule('FORWARD', '-j nova-shared', wrap=False)
+
+        new_lines = self.manager._modify_rules(current_lines, table)
+        self.assertTrue('[7:700] -A nova-shared -j DROP ' in new_lines)
+        self.assertTrue('[3:300] -A FORWARD -j nova-shared ' in new_lines)
+        self.assertFalse('[0:0] -A nova-shared -j DROP' in new_lines)
+
+        table.remove_chain('nova-shared', wrap=False)
+        new_lines = self.manager._modify_rules(new_lines, table)
+        for line in new_lines:
+            self.assertFalse('nova-shared' in line, line)
+        self.assertEqual(table.remove_chains, set())
+        self.assertEqual(table.remove_rules, [])
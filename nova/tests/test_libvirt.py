@@ -57,6 +57,7 @@ from nova.virt.libvirt import config as vconfig
 from nova.virt.libvirt import driver as libvirt_driver
 from nova.virt.libvirt import firewall
 from nova.virt.libvirt import imagebackend
+from nova.virt.libvirt import imagecache
 from nova.virt.libvirt import snapshots
 from nova.virt.libvirt import utils as libvirt_utils
 from nova.virt.libvirt import volume
@@ -469,7 +470,7 @@ class CacheConcurrencyTestCase(test.TestCase):
         def fake_execute(*args, **kwargs):
             pass
 
-        def fake_extend(image, size):
+        def fake_extend(image, size, file_format=None):
             pass
 
         self.stubs.Set(os.path, 'exists', fake_exists)
@@ -567,7 +568,7 @@ class LibvirtConnTestCase(test.TestCase):
             'nova.virt.libvirt.snapshots.libvirt_utils',
             fake_libvirt_utils))
 
-        def fake_extend(image, size):
+        def fake_extend(image, size, file_format=None):
             pass
 
         self.stubs.Set(libvirt_driver.disk, 'extend', fake_extend)
@@ -1072,6 +1073,35 @@ class LibvirtConnTestCase(test.TestCase):
         # None should be listed, since we fake deleted the last one
         self.assertEquals(len(instances), 0)
 
+    def _test_get_power_states_list_all_fails(self, error_code):
+        def fake_list_all(flags):
+            raise libvirt.libvirtError("listAllDomains failed",
+                                       error_code=error_code)
+
+        def fake_lookup(instance_id):
+            return FakeVirtDomain()
+
+        self.mox.StubOutWithMock(libvirt_driver.LibvirtDriver, '_conn')
+        libvirt_driver.LibvirtDriver._conn.listAllDomains = fake_list_all
+        libvirt_driver.LibvirtDriver._conn.numOfDomains = lambda: 2
+        libvirt_driver.LibvirtDriver._conn.listDomainsID = lambda: [0, 1]
+        libvirt_driver.LibvirtDriver._conn.listDefinedDomains = lambda: []
+        libvirt_driver.LibvirtDriver._conn.lookupByID = fake_lookup
+
+        self.mox.ReplayAll()
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        return conn.get_power_states()
+
+    def test_get_power_states_list_all_not_supported(self):
+        power_states = self._test_get_power_states_list_all_fails(
+                libvirt.VIR_ERR_NO_SUPPORT)
+        self.assertEqual(power_states.values(), [power_state.RUNNING])
+
+    def test_get_power_states_list_all_error(self):
+        self.assertRaises(libvirt.libvirtError,
+                          self._test_get_power_states_list_all_fails,
+                          libvirt.VIR_ERR_INTERNAL_ERROR)
+
     def test_get_all_block_devices(self):
         xml = [
             # NOTE(vish): id 0 is skipped
@@ -3878,6 +3908,20 @@ disk size: 4.4M''', ''))
         libvirt_utils.fetch_image(context, target, image_id,
                                   user_id, project_id)
 
+    def test_fetch_image_stores_checksum(self):
+        self.flags(checksum_base_images=True)
+        self.mox.StubOutWithMock(images, 'fetch_to_raw')
+        self.mox.StubOutWithMock(imagecache, 'write_stored_checksum')
+
+        context = 'opaque context'
+        target = '/tmp/targetfile'
+        images.fetch_to_raw(context, '4', target, 'fake',
+                            'fake').AndReturn('fake-sha1')
+        imagecache.write_stored_checksum(target, 'fake-sha1')
+
+        self.mox.ReplayAll()
+        libvirt_utils.fetch_image(context, target, '4', 'fake', 'fake')
+
     def test_get_disk_backing_file(self):
         with_actual_path = False
 
@@ -4055,7 +4099,7 @@ class LibvirtDriverTestCase(test.TestCase):
         def fake_can_resize_fs(path, size, use_cow=False):
             return False
 
-        def fake_extend(path, size):
+        def fake_extend(path, size, file_format=None):
             pass
 
         def fake_to_xml(instance, network_info, image_meta=None, rescue=None,
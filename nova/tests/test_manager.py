@@ -0,0 +1,133 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the periodic tasks of nova.manager.Manager.
+"""
+
+import datetime
+
+from eventlet import event
+
+from nova import context
+from nova import manager
+from nova.openstack.common import timeutils
+from nova import test
+
+
+class FakeManager(manager.Manager):
+    def __init__(self, *args, **kwargs):
+        self.runs = []
+        super(FakeManager, self).__init__(*args, **kwargs)
+
+    @manager.periodic_task
+    def every_tick(self, context):
+        self.runs.append('every_tick')
+
+    @manager.periodic_task(spacing=120)
+    def every_two_minutes(self, context):
+        self.runs.append('every_two_minutes')
+
+    @manager.periodic_task(ticks_between_runs=3)
+    def every_three_ticks(self, context):
+        self.runs.append('every_three_ticks')
+
+
+class SlowManager(manager.Manager):
+    def __init__(self, *args, **kwargs):
+        self.runs = []
+        self.slow_event = event.Event()
+        super(SlowManager, self).__init__(*args, **kwargs)
+
+    @manager.periodic_task(budget=0.01)
+    def slow(self, context):
+        self.runs.append('slow')
+        timeutils.advance_time_seconds(10)
+        self.slow_event.wait()
+
+    @manager.periodic_task
+    def fast(self, context):
+        self.runs.append('fast')
+
+
+class ManagerPeriodicTasksTestCase(test.TestCase):
+    def setUp(self):
+        super(ManagerPeriodicTasksTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        timeutils.set_time_override(datetime.datetime(2013, 1, 1))
+        self.addCleanup(timeutils.clear_time_override)
+        self.flags(periodic_interval=60)
+
+    def test_tasks_run_by_wall_clock(self):
+        fake_manager = FakeManager()
+
+        fake_manager.periodic_tasks(self.context)
+        self.assertEqual(fake_manager.runs, ['every_tick'])
+
+        fake_manager.runs = []
+        timeutils.advance_time_seconds(120)
+        fake_manager.periodic_tasks(self.context)
+        self.assertEqual(sorted(fake_manager.runs),
+                         ['every_tick', 'every_two_minutes'])
+
+        fake_manager.runs = []
+        timeutils.advance_time_seconds(60)
+        fake_manager.periodic_tasks(self.context)
+        self.assertEqual(sorted(fake_manager.runs),
+                         ['every_three_ticks', 'every_tick'])
+
+        fake_manager.runs = []
+        fake_manager.periodic_tasks(self.context)
+        self.assertEqual(fake_manager.runs, ['every_tick'])
+
+    def test_serial_overrun_is_counted(self):
+        self.flags(periodic_task_concurrency=1)
+        slow_manager = SlowManager()
+        slow_manager.slow_event.send()
+
+        slow_manager.periodic_tasks(self.context)
+        self.assertEqual(sorted(slow_manager.runs), ['fast', 'slow'])
+        self.assertEqual(slow_manager._periodic_overruns, {'slow': 1})
+
+    def test_concurrent_tasks_do_not_wait_for_overrun(self):
+        self.flags(periodic_task_concurrency=2)
+        slow_manager = SlowManager()
+
+        slow_manager.periodic_tasks(self.context)
+        self.assertEqual(sorted(slow_manager.runs), ['fast', 'slow'])
+        self.assertTrue('slow' in slow_manager._periodic_running)
+
+        # The slow task is still running, so only the fast one runs again.
+        slow_manager.runs = []
+        slow_manager.periodic_tasks(self.context)
+        self.assertEqual(slow_manager.runs, ['fast'])
+
+        slow_manager.slow_event.send()
+        slow_manager._periodic_pool.waitall()
+        self.assertEqual(slow_manager._periodic_running, {})
+        self.assertEqual(slow_manager._periodic_overruns, {'slow': 1})
+
+    def test_raise_on_error(self):
+        class FailingManager(manager.Manager):
+            @manager.periodic_task
+            def failing(self, context):
+                raise test.TestingException()
+
+        failing_manager = FailingManager()
+        failing_manager.periodic_tasks(self.context)
+        self.assertRaises(test.TestingException,
+                          failing_manager.periodic_tasks, self.context,
+                          raise_on_error=True)
@@ -0,0 +1,95 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from nova.common import memorycache
+from nova.openstack.common import timeutils
+from nova import test
+
+
+class MemoryCacheTestCase(test.TestCase):
+    def setUp(self):
+        super(MemoryCacheTestCase, self).setUp()
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.client = memorycache.Client()
+
+    def test_get_set(self):
+        self.assertTrue(self.client.set('foo', 'bar'))
+        self.assertEqual(self.client.get('foo'), 'bar')
+        self.assertEqual(self.client.get('baz'), None)
+
+    def test_set_with_timeout_expires(self):
+        self.client.set('foo', 'bar', time=10)
+        self.client.set('forever', 'value')
+        timeutils.advance_time_seconds(9)
+        self.assertEqual(self.client.get('foo'), 'bar')
+        timeutils.advance_time_seconds(1)
+        self.assertEqual(self.client.get('foo'), None)
+        self.assertEqual(self.client.get('forever'), 'value')
+
+    def test_reset_key_keeps_new_timeout(self):
+        self.client.set('foo', 'bar', time=10)
+        self.client.set('foo', 'baz', time=30)
+        timeutils.advance_time_seconds(20)
+        self.assertEqual(self.client.get('foo'), 'baz')
+
+    def test_add(self):
+        self.assertTrue(self.client.add('foo', 'bar', time=10))
+        self.assertFalse(self.client.add('foo', 'baz'))
+        timeutils.advance_time_seconds(10)
+        self.assertTrue(self.client.add('foo', 'baz'))
+        self.assertEqual(self.client.get('foo'), 'baz')
+
+    def test_incr(self):
+        self.assertEqual(self.client.incr('foo'), None)
+        self.client.set('foo', '1')
+        self.assertEqual(self.client.incr('foo', 2), 3)
+        self.assertEqual(self.client.get('foo'), '3')
+
+    def test_delete(self):
+        self.client.set('foo', 'bar')
+        self.client.delete('foo')
+        self.assertEqual(self.client.get('foo'), None)
+
+    def test_least_recently_used_keys_are_evicted(self):
+        self.client.max_items = 2
+        self.client.set('a', 1)
+        self.client.set('b', 2)
+        self.client.get('a')
+        self.client.set('c', 3)
+        self.assertEqual(self.client.get('b'), None)
+        self.assertEqual(self.client.get('a'), 1)
+        self.assertEqual(self.client.get('c'), 3)
+
+        stats = self.client.get_stats()[0][1]
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['get_hits'], 3)
+        self.assertEqual(stats['get_misses'], 1)
+        self.assertEqual(stats['curr_items'], 2)
+
+    def test_expiry_heap_stays_bounded(self):
+        for i in xrange(1000):
+            self.client.set('foo', i, time=60)
+        self.assertTrue(len(self.client._expiry) < 100)
+        self.assertEqual(self.client.get('foo'), 999)
+
+    def test_recency_queue_stays_bounded(self):
+        self.client.set('foo', 'bar')
+        for i in xrange(1000):
+            self.client.get('foo')
+        self.assertTrue(len(self.client._recent) < 100)
+        self.assertEqual(self.client.get('foo'), 'bar')
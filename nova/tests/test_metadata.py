@@ -23,11 +23,16 @@ from copy import copy
 import json
 import re
 
+from eventlet import greenthread
 import webob
 
+from nova.api.ec2 import ec2utils
 from nova.api.metadata import base
+from nova.api.metadata import cache
 from nova.api.metadata import handler
 from nova import block_device
+from nova.compute import api as compute_api
+from nova import context
 from nova import db
 from nova.db.sqlalchemy import api
 from nova import exception
@@ -35,6 +40,7 @@ from nova.network import api as network_api
 from nova.openstack.common import cfg
 from nova import test
 from nova.tests import fake_network
+from nova.tests import fake_network_cache_model
 
 CONF = cfg.CONF
 
@@ -114,6 +120,7 @@ def fake_request(stubs, mdinst, relpath, address="127.0.0.1",
 class MetadataTestCase(test.TestCase):
     def setUp(self):
         super(MetadataTestCase, self).setUp()
+        self.addCleanup(ec2utils.reset_cache)
         self.instance = INSTANCES[0]
         fake_network.stub_out_nw_api_get_instance_nw_info(self.stubs,
                                                           spectacular=True)
@@ -227,6 +234,40 @@ class MetadataTestCase(test.TestCase):
         self.assertRaises(base.InvalidMetadataPath,
             md.lookup, "/2009-04-04/meta-data/kernel-id")
 
+    def test_uses_joined_security_groups_and_info_cache(self):
+        def fail(*args, **kwargs):
+            self.fail('should not be called')
+
+        inst = copy(self.instance)
+        inst['security_groups'] = [{'name': 'joined'}]
+        inst['info_cache'] = {'network_info':
+                [fake_network_cache_model.new_vif()]}
+        self.stubs.Set(db, 'security_group_get_by_instance', fail)
+        self.stubs.Set(network_api.API, 'get_instance_nw_info', fail)
+
+        md = base.InstanceMetadata(inst)
+        self.assertEqual(md.lookup('/2009-04-04/meta-data/security-groups'),
+                         ['joined'])
+
+    def test_image_ids_looked_up_together(self):
+        calls = []
+        real_get = db.s3_image_get_by_uuids
+
+        def fake_get(context, image_uuids):
+            calls.append(set(image_uuids))
+            return real_get(context, image_uuids)
+
+        self.stubs.Set(db, 's3_image_get_by_uuids', fake_get)
+        inst = copy(self.instance)
+        inst['kernel_id'] = 'aki-c2e26ff2'
+        inst['ramdisk_id'] = 'ari-853667c0'
+        md = fake_InstanceMetadata(self.stubs, inst)
+        self.assertEqual(calls, [set([7, 'aki-c2e26ff2', 'ari-853667c0'])])
+
+        # The s3 images created above are found on the next build.
+        md2 = fake_InstanceMetadata(self.stubs, inst)
+        self.assertEqual(md.ec2_ids, md2.ec2_ids)
+
     def test_check_version(self):
         inst = copy(self.instance)
         md = fake_InstanceMetadata(self.stubs, inst)
@@ -243,6 +284,7 @@ class MetadataTestCase(test.TestCase):
 class OpenStackMetadataTestCase(test.TestCase):
     def setUp(self):
         super(OpenStackMetadataTestCase, self).setUp()
+        self.addCleanup(ec2utils.reset_cache)
         self.instance = INSTANCES[0]
         fake_network.stub_out_nw_api_get_instance_nw_info(self.stubs,
                                                           spectacular=True)
@@ -344,6 +386,8 @@ class MetadataHandlerTestCase(test.TestCase):
 
     def setUp(self):
         super(MetadataHandlerTestCase, self).setUp()
+        self.addCleanup(ec2utils.reset_cache)
+        self.addCleanup(cache.reset_cache)
 
         fake_network.stub_out_nw_api_get_instance_nw_info(self.stubs,
                                                           spectacular=True)
@@ -366,6 +410,52 @@ class MetadataHandlerTestCase(test.TestCase):
         response = fake_request(self.stubs, self.mdinst, "/9999-99-99")
         self.assertEqual(response.status_int, 404)
 
+    def test_concurrent_requests_share_one_build(self):
+        builds = []
+
+        def fake_get_metadata(instance_id, address):
+            builds.append(instance_id)
+            greenthread.sleep(0)
+            return self.mdinst
+
+        self.stubs.Set(base, 'get_metadata_by_instance_id', fake_get_metadata)
+        self.stubs.Set(base, 'get_instance_uuid_by_address',
+                       lambda address: self.instance['uuid'])
+        app = handler.MetadataRequestHandler()
+
+        threads = [greenthread.spawn(app.get_metadata_by_remote_address,
+                                     '192.168.1.1') for i in xrange(5)]
+        results = [thread.wait() for thread in threads]
+        self.assertEqual(builds, [self.instance['uuid']])
+        self.assertEqual(results, [self.mdinst] * 5)
+
+        # The instance id lookup shares the same snapshot.
+        self.assertEqual(
+            app.get_metadata_by_instance_id(self.instance['uuid'],
+                                            '192.168.1.1'),
+            self.mdinst)
+        self.assertEqual(len(builds), 1)
+
+    def test_instance_update_invalidates_snapshot(self):
+        ctxt = context.get_admin_context()
+        instance = db.instance_create(ctxt, {})
+        builds = []
+
+        def fake_get_metadata(instance_id, address):
+            builds.append(instance_id)
+            return self.mdinst
+
+        self.stubs.Set(base, 'get_metadata_by_instance_id', fake_get_metadata)
+        app = handler.MetadataRequestHandler()
+
+        app.get_metadata_by_instance_id(instance['uuid'], '192.168.1.1')
+        app.get_metadata_by_instance_id(instance['uuid'], '192.168.1.1')
+        self.assertEqual(builds, [instance['uuid']])
+
+        compute_api.API().update(ctxt, instance, display_name='renamed')
+        app.get_metadata_by_instance_id(instance['uuid'], '192.168.1.1')
+        self.assertEqual(builds, [instance['uuid']] * 2)
+
     def test_user_data_non_existing_fixed_address(self):
         self.stubs.Set(network_api.API, 'get_fixed_ip_by_address',
                        return_non_existing_address)
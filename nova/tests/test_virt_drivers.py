@@ -99,7 +99,7 @@ class _FakeDriverBackendTestCase(test.TestCase):
                    rescue_ramdisk_id=None,
                    libvirt_snapshots_directory='./')
 
-        def fake_extend(image, size):
+        def fake_extend(image, size, file_format=None):
             pass
 
         def fake_migrateToURI(*a):
@@ -413,6 +413,13 @@ class _VirtDriverTestCase(_FakeDriverBackendTestCase):
         self.assertIn('num_cpu', info)
         self.assertIn('cpu_time', info)
 
+    @catch_notimplementederror
+    def test_get_power_states(self):
+        instance_ref, network_info = self._get_running_instance()
+        power_states = self.connection.get_power_states()
+        self.assertEqual(power_states[instance_ref['name']],
+                         self.connection.get_info(instance_ref)['state'])
+
     @catch_notimplementederror
     def test_get_info_for_unknown_instance(self):
         self.assertRaises(exception.NotFound,
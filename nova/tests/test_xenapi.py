@@ -337,6 +337,11 @@ class XenAPIVMTestCase(stubs.XenAPITestBase):
         instances = self.conn.list_instances()
         self.assertEquals(instances, [])
 
+    def test_get_power_states(self):
+        instance = self._create_instance()
+        power_states = self.conn.get_power_states()
+        self.assertEqual(power_states, {instance['name']: power_state.RUNNING})
+
     def test_get_rrd_server(self):
         self.flags(xenapi_connection_url='myscheme://myaddress/')
         server_info = vm_utils._get_rrd_server()
@@ -101,19 +101,20 @@ def resize2fs(image, check_exit_code=False):
     utils.execute('resize2fs', image, check_exit_code=check_exit_code)
 
 
-def get_disk_size(path):
+def get_disk_size(path, file_format=None):
     """Get the (virtual) size of a disk image
 
     :param path: Path to the disk image
+    :param file_format: Format the disk image is used in, if known
     :returns: Size (in bytes) of the given disk image as it would be seen
               by a virtual machine.
     """
-    return images.qemu_img_info(path).virtual_size
+    return images.image_info(path, file_format).virtual_size
 
 
-def extend(image, size):
+def extend(image, size, file_format=None):
     """Increase image to size"""
-    virt_size = get_disk_size(image)
+    virt_size = get_disk_size(image, file_format)
     if virt_size >= size:
         return
     utils.execute('qemu-img', 'resize', image, size)
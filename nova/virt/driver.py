@@ -127,6 +127,16 @@ class ComputeDriver(object):
         # TODO(Vek): Need to pass context in for access to auth_token
         raise NotImplementedError()
 
+    def get_power_states(self):
+        """Get the running state of every instance on the host at once.
+
+        Returns a dict mapping instance names (as given to get_info) to
+        power_state codes.  Instances unknown to the hypervisor are left
+        out.  Drivers that cannot do better than one get_info call per
+        instance should not implement this.
+        """
+        raise NotImplementedError()
+
     def get_num_instances(self):
         """Return the total number of virtual machines.
 
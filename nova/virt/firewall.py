@@ -398,9 +398,11 @@ class IptablesFirewallDriver(FirewallDriver):
                         #                 and should be the only one making
                         #                 making rpc calls.
                         nw_api = network.API()
-                        for instance in rule['grantee_group']['instances']:
-                            nw_info = nw_api.get_instance_nw_info(ctxt,
-                                                                  instance)
+                        grantees = rule['grantee_group']['instances']
+                        nw_infos = nw_api.get_instances_nw_info(ctxt,
+                                                                grantees)
+                        for instance in grantees:
+                            nw_info = nw_infos[instance['uuid']]
 
                             ips = [ip['address']
                                 for ip in nw_info.fixed_ips()
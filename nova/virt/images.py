@@ -21,9 +21,12 @@
 Handling of VM disk images.
 """
 
+import hashlib
 import os
 import re
+import struct
 
+from nova.common import memorycache
 from nova import exception
 from nova.image import glance
 from nova.openstack.common import cfg
@@ -181,13 +184,118 @@ def qemu_img_info(path):
     return QemuImgInfo(out)
 
 
+class ImageHeaderInfo(object):
+    """Format, virtual size and backing file read from an image header."""
+
+    QCOW2_MAGIC = 'QFI\xfb'
+    QCOW2_HEADER = struct.Struct('>4sIQIIQ')
+
+    def __init__(self, path, file_format, virtual_size, backing_file=None,
+                 cluster_size=None):
+        self.image = path
+        self.file_format = file_format
+        self.virtual_size = virtual_size
+        self.backing_file = backing_file
+        self.cluster_size = cluster_size
+
+    @classmethod
+    def read(cls, path):
+        """Parse the header of a qcow2 image.
+
+        Returns None for anything else, which qemu-img has to look at.
+        Raw is never assumed, as a header this does not recognise may
+        still be one qemu-img would follow a backing file from.
+        """
+        with open(path, 'rb') as f:
+            header = f.read(512)
+            if header.startswith(cls.QCOW2_MAGIC):
+                return cls._read_qcow2(path, f, header)
+        return None
+
+    @classmethod
+    def _read_qcow2(cls, path, f, header):
+        if len(header) < cls.QCOW2_HEADER.size:
+            return None
+        (magic, version, backing_offset, backing_length, cluster_bits,
+         size) = cls.QCOW2_HEADER.unpack_from(header)
+        if version not in (2, 3):
+            return None
+
+        backing_file = None
+        if backing_offset:
+            f.seek(backing_offset)
+            backing_file = f.read(backing_length)
+            # qemu-img reports the actual path, which is relative to the
+            # directory of the image.
+            backing_file = os.path.join(os.path.dirname(path), backing_file)
+        return cls(path, 'qcow2', size, backing_file, 1 << cluster_bits)
+
+
+_image_info_cache = None
+_IMAGE_INFO_CACHE_SIZE = 4096
+
+
+def _get_image_info_cache():
+    global _image_info_cache
+    if _image_info_cache is None:
+        # Image headers describe local files, so they are never shared
+        # through memcached.
+        _image_info_cache = memorycache.Client()
+        _image_info_cache.max_items = _IMAGE_INFO_CACHE_SIZE
+    return _image_info_cache
+
+
+def image_info(path, file_format=None):
+    """Return the format, virtual size and backing file of an image.
+
+    qcow2 headers are read directly instead of running qemu-img info,
+    and the result is kept until the file changes.  Callers which use a
+    file as raw pass file_format, and its size is then the size of the
+    file, whatever its header looks like.
+    """
+    if file_format == 'raw' and os.path.isfile(path):
+        return ImageHeaderInfo(path, 'raw', os.path.getsize(path))
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        return qemu_img_info(path)
+
+    cache = _get_image_info_cache()
+    key = (st.st_ino, st.st_mtime, st.st_size)
+    cached = cache.get(path)
+    if cached is None or cached[0] != key:
+        cached = (key, ImageHeaderInfo.read(path) or qemu_img_info(path))
+        cache.set(path, cached)
+    return cached[1]
+
+
 def convert_image(source, dest, out_format):
     """Convert image to other format"""
     cmd = ('qemu-img', 'convert', '-O', out_format, source, dest)
     utils.execute(*cmd)
 
 
+class _ChecksummingWriter(object):
+    """File wrapper hashing the data written through it."""
+
+    def __init__(self, f):
+        self._file = f
+        self._checksum = hashlib.sha1()
+
+    def write(self, data):
+        self._checksum.update(data)
+        self._file.write(data)
+
+    def hexdigest(self):
+        return self._checksum.hexdigest()
+
+
 def fetch(context, image_href, path, _user_id, _project_id):
+    """Download an image to path.
+
+    Returns the sha1 of the image data, computed while it is written.
+    """
     # TODO(vish): Improve context handling and add owner and auth data
     #             when it is added to glance.  Right now there is no
     #             auth checking in glance, so we assume that access was
@@ -196,14 +304,53 @@ def fetch(context, image_href, path, _user_id, _project_id):
                                                                 image_href)
     with utils.remove_path_on_error(path):
         with open(path, "wb") as image_file:
-            image_service.download(context, image_id, image_file)
+            writer = _ChecksummingWriter(image_file)
+            image_service.download(context, image_id, writer)
+    return writer.hexdigest()
+
+
+def _completed_fetch_checksum(context, image_href, path):
+    """Check a download left behind by an interrupted fetch_to_raw.
+
+    Returns the sha1 of path if it holds the whole image, as shown by the
+    size and md5 checksum glance has for it, or removes it and returns None.
+    """
+    if not os.path.exists(path):
+        return None
+
+    (image_service, image_id) = glance.get_remote_image_service(context,
+                                                                image_href)
+    image_meta = image_service.show(context, image_id)
+    if (image_meta.get('checksum') and
+        image_meta.get('size') == os.path.getsize(path)):
+        md5 = hashlib.md5()
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), ''):
+                md5.update(chunk)
+                sha1.update(chunk)
+        if md5.hexdigest() == image_meta['checksum']:
+            LOG.info(_("Reusing completed download %s"), path)
+            return sha1.hexdigest()
+
+    os.unlink(path)
+    return None
 
 
 def fetch_to_raw(context, image_href, path, user_id, project_id):
+    """Download an image to path, converting it to raw if needed.
+
+    Returns the sha1 of path if the image was stored as downloaded, or
+    None if it was converted.
+    """
     path_tmp = "%s.part" % path
-    fetch(context, image_href, path_tmp, user_id, project_id)
+    checksum = _completed_fetch_checksum(context, image_href, path_tmp)
+    if checksum is None:
+        checksum = fetch(context, image_href, path_tmp, user_id, project_id)
 
     with utils.remove_path_on_error(path_tmp):
+        # Downloaded images are untrusted, so let qemu-img decide what
+        # they are.
         data = qemu_img_info(path_tmp)
 
         fmt = data.file_format
@@ -230,6 +377,10 @@ def fetch_to_raw(context, image_href, path, user_id, project_id):
                         data.file_format)
 
                 os.rename(staged, path)
+                os.unlink(path_tmp)
+            checksum = None
 
         else:
             os.rename(path_tmp, path)
+
+    return checksum
@@ -563,6 +563,8 @@ class LibvirtDriver(driver.ComputeDriver):
                                          'rootfs')
             disk.destroy_container(container_dir=container_dir)
         if os.path.exists(target):
+            self.image_cache_manager.unregister_instance_disk(
+                    instance['name'], os.path.join(target, 'disk'))
             # If we fail to get rid of the directory
             # tree, this shouldn't block deletion of
             # the instance as whole.
@@ -1093,6 +1095,8 @@ class LibvirtDriver(driver.ComputeDriver):
                            block_device_info=block_device_info,
                            files=injected_files,
                            admin_pass=admin_password)
+        self.image_cache_manager.register_instance_disk(instance['name'],
+                os.path.join(CONF.instances_path, instance['name'], 'disk'))
         self._create_domain_and_network(xml, instance, network_info,
                                         block_device_info)
         LOG.debug(_("Instance is running"), instance=instance)
@@ -1892,6 +1896,43 @@ class LibvirtDriver(driver.ComputeDriver):
                 'num_cpu': num_cpu,
                 'cpu_time': cpu_time}
 
+    def _list_all_domains(self):
+        """Return every domain, running or only defined."""
+        try:
+            return self._conn.listAllDomains(0)
+        except (AttributeError, libvirt.libvirtError) as e:
+            # listAllDomains was added in libvirt 0.9.13, and the python
+            # binding can be newer than the daemon it talks to.
+            if (isinstance(e, libvirt.libvirtError) and
+                e.get_error_code() != libvirt.VIR_ERR_NO_SUPPORT):
+                raise
+            domains = []
+            for domain_id in self.list_instance_ids():
+                if domain_id == 0:
+                    continue
+                try:
+                    domains.append(self._conn.lookupByID(domain_id))
+                except libvirt.libvirtError:
+                    pass
+            for name in self._conn.listDefinedDomains():
+                try:
+                    domains.append(self._conn.lookupByName(name))
+                except libvirt.libvirtError:
+                    pass
+            return domains
+
+    def get_power_states(self):
+        """Efficient override of base get_power_states method."""
+        power_states = {}
+        for virt_dom in self._list_all_domains():
+            try:
+                state = virt_dom.info()[0]
+                power_states[virt_dom.name()] = LIBVIRT_POWER_STATE[state]
+            except libvirt.libvirtError:
+                # Domain was deleted while listing... ignore it
+                pass
+        return power_states
+
     def _create_domain(self, xml=None, domain=None, launch_flags=0):
         """Create a domain.
 
@@ -2898,7 +2939,7 @@ class LibvirtDriver(driver.ComputeDriver):
                 fmt = 'raw'
 
             if size:
-                disk.extend(info['path'], size)
+                disk.extend(info['path'], size, file_format=fmt)
 
             if fmt == 'raw' and CONF.use_cow_images:
                 # back to qcow2 (no backing_file though) so that snapshot
@@ -19,10 +19,14 @@ import abc
 import contextlib
 import os
 
+import eventlet
+from eventlet import event
+
 from nova.openstack.common import cfg
 from nova.openstack.common import excutils
 from nova.openstack.common import fileutils
 from nova.openstack.common import lockutils
+from nova.openstack.common import log as logging
 from nova import utils
 from nova.virt.disk import api as disk
 from nova.virt.libvirt import config as vconfig
@@ -49,6 +53,45 @@ CONF = cfg.CONF
 CONF.register_opts(__imagebackend_opts)
 CONF.import_opt('base_dir_name', 'nova.virt.libvirt.imagecache')
 
+LOG = logging.getLogger(__name__)
+
+# How often, in seconds, requesters waiting for a base image log how much
+# of it has been downloaded.
+FETCH_PROGRESS_INTERVAL = 10
+
+
+class _Fetch(object):
+    """A base image being fetched, which other requesters can wait for."""
+
+    def __init__(self, target):
+        self.target = target
+        self.done = event.Event()
+
+    def progress(self):
+        """Return the number of bytes of the image fetched so far."""
+        for path in ('%s.part' % self.target, self.target):
+            try:
+                return os.path.getsize(path)
+            except OSError:
+                pass
+        return 0
+
+    def wait(self):
+        """Wait for the fetch to finish, and return whether it succeeded."""
+        while not self.done.ready():
+            with eventlet.Timeout(FETCH_PROGRESS_INTERVAL, False):
+                self.done.wait()
+            if not self.done.ready():
+                LOG.info(_('Waiting for %(target)s to be fetched, '
+                           '%(progress)d bytes so far'),
+                         {'target': self.target,
+                          'progress': self.progress()})
+        return self.done.wait()
+
+
+# Base images being fetched by this process, by file name and path.
+_fetches = {}
+
 
 class Image(object):
     __metaclass__ = abc.ABCMeta
@@ -120,14 +163,36 @@ class Image(object):
             if not os.path.exists(target):
                 fetch_func(target=target, *args, **kwargs)
 
+        def fetch_once(target, *args, **kwargs):
+            # Requesters for a base image this process is already fetching
+            # wait for that fetch instead of queueing on the lock, and all
+            # carry on as soon as it is done.  Other hosts sharing the
+            # instances path still wait on the external lock.
+            key = (filename, target)
+            fetch = _fetches.get(key)
+            if fetch is not None:
+                # If the fetch failed, possibly for reasons specific to the
+                # request that started it, try again with ours.
+                if not fetch.wait() or not os.path.exists(target):
+                    call_if_not_exists(target, *args, **kwargs)
+                return
+
+            fetch = _fetches[key] = _Fetch(target)
+            succeeded = False
+            try:
+                call_if_not_exists(target, *args, **kwargs)
+                succeeded = True
+            finally:
+                del _fetches[key]
+                fetch.done.send(succeeded)
+
         if not os.path.exists(self.path):
             base_dir = os.path.join(CONF.instances_path, CONF.base_dir_name)
             if not os.path.exists(base_dir):
                 fileutils.ensure_tree(base_dir)
             base = os.path.join(base_dir, filename)
 
-            self.create_image(call_if_not_exists, base, size,
-                              *args, **kwargs)
+            self.create_image(fetch_once, base, size, *args, **kwargs)
 
     @abc.abstractmethod
     def snapshot(self, name):
@@ -151,7 +216,7 @@ class Raw(Image):
         def copy_raw_image(base, target, size):
             libvirt_utils.copy_image(base, target)
             if size:
-                disk.extend(target, size)
+                disk.extend(target, size, file_format='raw')
 
         generating = 'image_id' not in kwargs
         if generating:
@@ -20,6 +20,14 @@
 The cache manager implements the specification at
 http://wiki.openstack.org/nova-image-cache-management.
 
+The info file next to each base image doubles as its index entry: besides
+the checksum and when it was taken, it records the fingerprint and size of
+the base image, when it was last used, and which instance disks are backed
+by it, along with the inode of each disk.  Entries are updated as instances
+are spawned and deleted, and each one has its own lock, so no update waits
+on updates for other base images.  The periodic pass only reads the header
+of an instance disk if no entry references it, or if the disk was replaced
+since it was recorded.
 """
 
 import hashlib
@@ -163,11 +171,12 @@ def read_stored_info(target, field=None, timestamped=False):
     return d
 
 
-def write_stored_info(target, field=None, value=None):
-    """Write information about an image."""
+def update_stored_info(target, update):
+    """Change the information about an image.
 
-    if not field:
-        return
+    update is called with the stored information as a dictionary, which it
+    changes in place, while the info file is locked.
+    """
 
     info_file = get_info_filename(target)
     LOG.info(_('Writing stored info to %s'), info_file)
@@ -178,20 +187,32 @@ def write_stored_info(target, field=None, value=None):
 
     @lockutils.synchronized(lock_name, 'nova-', external=True,
                             lock_path=lock_path)
-    def write_file(info_file, field, value):
+    def write_file(info_file):
         d = {}
 
         if os.path.exists(info_file):
             with open(info_file, 'r') as f:
                 d = _read_possible_json(f.read(), info_file)
 
-        d[field] = value
-        d['%s-timestamp' % field] = time.time()
+        update(d)
 
         with open(info_file, 'w') as f:
             f.write(json.dumps(d))
 
-    write_file(info_file, field, value)
+    write_file(info_file)
+
+
+def write_stored_info(target, field=None, value=None):
+    """Write information about an image."""
+
+    if not field:
+        return
+
+    def update(d):
+        d[field] = value
+        d['%s-timestamp' % field] = time.time()
+
+    update_stored_info(target, update)
 
 
 def read_stored_checksum(target, timestamped=True):
@@ -202,17 +223,74 @@ def read_stored_checksum(target, timestamped=True):
     return read_stored_info(target, field='sha1', timestamped=timestamped)
 
 
-def write_stored_checksum(target):
-    """Write a checksum to disk for a file in _base."""
+def write_stored_checksum(target, checksum=None):
+    """Write a checksum to disk for a file in _base.
 
-    with open(target, 'r') as img_file:
-        checksum = utils.hash_file(img_file)
+    The file is hashed unless its checksum is given.
+    """
+
+    if checksum is None:
+        with open(target, 'r') as img_file:
+            checksum = utils.hash_file(img_file)
     write_stored_info(target, field='sha1', value=checksum)
 
 
+def _get_base_file(disk_path):
+    """Return the base image an instance disk is backed by, or None.
+
+    Failing to inspect the disk is logged rather than raised, as the index
+    is only an optimization for the periodic pass.
+    """
+
+    try:
+        backing_file = virtutils.get_disk_backing_file(disk_path)
+    except (IOError, OSError), e:
+        LOG.warning(_('Failed to find the backing file of %(disk)s: '
+                      '%(error)s'),
+                    {'disk': disk_path,
+                     'error': e})
+        return None
+
+    if backing_file:
+        return os.path.join(CONF.instances_path, CONF.base_dir_name,
+                            backing_file)
+    return None
+
+
+def _update_references(base_file, added=None, removed=()):
+    """Record instance disks starting or stopping to use a base image.
+
+    added maps instance names to the inode of their disk.
+    """
+
+    if not os.path.exists(base_file):
+        return
+
+    def update(d):
+        references = d.setdefault('references', {})
+        references.update(added or {})
+        for instance_name in removed:
+            references.pop(instance_name, None)
+
+        d['fingerprint'] = os.path.basename(base_file)[:40]
+        d['size'] = os.path.getsize(base_file)
+        d['last-used'] = time.time()
+
+    try:
+        update_stored_info(base_file, update)
+    except (IOError, OSError), e:
+        LOG.warning(_('Failed to update references to %(base_file)s: '
+                      '%(error)s'),
+                    {'base_file': base_file,
+                     'error': e})
+
+
 class ImageCacheManager(object):
     def __init__(self):
         self.lock_path = os.path.join(CONF.instances_path, 'locks')
+        # Inodes of instance disks without a backing file, which have no
+        # index entry to be recorded in.  Kept across passes.
+        self.unbacked_disks = {}
         self._reset_state()
 
     def _reset_state(self):
@@ -222,6 +300,7 @@ class ImageCacheManager(object):
         self.image_popularity = {}
         self.instance_names = {}
 
+        self.base_files = []
         self.active_base_files = []
         self.corrupt_base_files = []
         self.originals = []
@@ -232,6 +311,7 @@ class ImageCacheManager(object):
         """Store a base image for later examination."""
         entpath = os.path.join(base_dir, ent)
         if os.path.isfile(entpath):
+            self.base_files.append(entpath)
             self.unexplained_images.append(entpath)
             if original:
                 self.originals.append(entpath)
@@ -286,25 +366,102 @@ class ImageCacheManager(object):
             self.image_popularity.setdefault(image_ref_str, 0)
             self.image_popularity[image_ref_str] += 1
 
+    def register_instance_disk(self, instance_name, disk_path):
+        """Record the base image a newly created instance disk uses."""
+        try:
+            inode = os.stat(disk_path).st_ino
+        except OSError:
+            return
+
+        base_file = _get_base_file(disk_path)
+        if base_file:
+            _update_references(base_file, added={instance_name: inode})
+
+    def unregister_instance_disk(self, instance_name, disk_path):
+        """Forget an instance disk which is about to be deleted."""
+        self.unbacked_disks.pop(instance_name, None)
+        if not os.path.exists(disk_path):
+            return
+
+        base_file = _get_base_file(disk_path)
+        if base_file:
+            _update_references(base_file, removed=[instance_name])
+
+    def _read_references(self):
+        """Map instance names to the base image and inode recorded for
+        their disk in the index entries of the base images.
+        """
+        references = {}
+        for base_file in self.base_files:
+            info = read_stored_info(base_file)
+            for instance_name, inode in info.get('references', {}).items():
+                references[instance_name] = (base_file, inode)
+        return references
+
+    def _get_backing_path(self, instance_name, disk_path, references,
+                          added, removed):
+        """Return the base image an instance disk is backed by, or None.
+
+        The disk is only inspected when it is not the one recorded in the
+        index, in which case the index changes are added to added and
+        removed, which are keyed by base image.
+        """
+        try:
+            inode = os.stat(disk_path).st_ino
+        except OSError:
+            inode = None
+
+        recorded_path, recorded_inode = references.get(instance_name,
+                                                       (None, None))
+        if inode is not None:
+            if recorded_inode == inode:
+                return recorded_path
+            if self.unbacked_disks.get(instance_name) == inode:
+                return None
+
+        backing_file = virtutils.get_disk_backing_file(disk_path)
+        backing_path = None
+        if backing_file:
+            backing_path = os.path.join(CONF.instances_path,
+                                        CONF.base_dir_name, backing_file)
+        if inode is None:
+            # Without an inode to recognise the disk by, there is nothing
+            # to record.
+            return backing_path
+
+        if backing_path:
+            added.setdefault(backing_path, {})[instance_name] = inode
+            self.unbacked_disks.pop(instance_name, None)
+        else:
+            self.unbacked_disks[instance_name] = inode
+
+        if recorded_path and recorded_path != backing_path:
+            removed.setdefault(recorded_path, []).append(instance_name)
+        return backing_path
+
     def _list_backing_images(self):
         """List the backing images currently in use."""
         inuse_images = []
+        references = self._read_references()
+        added = {}
+        removed = {}
         for ent in os.listdir(CONF.instances_path):
             if ent in self.instance_names:
                 LOG.debug(_('%s is a valid instance name'), ent)
                 disk_path = os.path.join(CONF.instances_path, ent, 'disk')
                 if os.path.exists(disk_path):
                     LOG.debug(_('%s has a disk file'), ent)
-                    backing_file = virtutils.get_disk_backing_file(disk_path)
+                    backing_path = self._get_backing_path(
+                            ent, disk_path, references, added, removed)
+                    backing_file = None
+                    if backing_path:
+                        backing_file = os.path.basename(backing_path)
                     LOG.debug(_('Instance %(instance)s is backed by '
                                 '%(backing)s'),
                               {'instance': ent,
                                'backing': backing_file})
 
                     if backing_file:
-                        backing_path = os.path.join(CONF.instances_path,
-                                                    CONF.base_dir_name,
-                                                    backing_file)
                         if not backing_path in inuse_images:
                             inuse_images.append(backing_path)
 
@@ -317,6 +474,19 @@ class ImageCacheManager(object):
                                          'backing': backing_file})
                             self.unexplained_images.remove(backing_path)
 
+        # References from instances which no longer exist are dropped, in
+        # case they were deleted somewhere we did not hear about it
+        for instance_name, (base_file, _inode) in references.items():
+            if instance_name not in self.instance_names:
+                removed.setdefault(base_file, []).append(instance_name)
+        for name in self.unbacked_disks.keys():
+            if name not in self.instance_names:
+                del self.unbacked_disks[name]
+
+        for base_file in set(added) | set(removed):
+            _update_references(base_file, added=added.get(base_file),
+                               removed=removed.get(base_file, ()))
+
         return inuse_images
 
     def _find_base_file(self, base_dir, fingerprint):
@@ -366,6 +536,15 @@ class ImageCacheManager(object):
         def inner_verify_checksum():
             (stored_checksum, stored_timestamp) = read_stored_checksum(
                 base_file, timestamped=True)
+            stored_size = read_stored_info(base_file, field='size')
+            if stored_size is not None and (stored_size !=
+                                            os.path.getsize(base_file)):
+                LOG.error(_('image %(id)s at (%(base_file)s): image '
+                            'verification failed, its size changed'),
+                          {'id': img_id,
+                           'base_file': base_file})
+                return False
+
             if stored_checksum:
                 # NOTE(mikal): Checksums are timestamped. If we have recently
                 # checksummed (possibly on another compute node if we are using
@@ -401,8 +580,9 @@ class ImageCacheManager(object):
                           'base_file': base_file})
 
                 # NOTE(mikal): If the checksum file is missing, then we should
-                # create one. We don't create checksums when we download images
-                # from glance because that would delay VM startup.
+                # create one. Downloads from glance store the checksum they
+                # compute while streaming, so this is only needed for images
+                # that were converted or fetched by older code.
                 if CONF.checksum_base_images and create_if_missing:
                     LOG.info(_('%(id)s (%(base_file)s): generating checksum'),
                              {'id': img_id,
@@ -423,8 +603,9 @@ class ImageCacheManager(object):
                       base_file)
             return
 
-        mtime = os.path.getmtime(base_file)
-        age = time.time() - mtime
+        last_used = max(os.path.getmtime(base_file),
+                        read_stored_info(base_file, field='last-used') or 0)
+        age = time.time() - last_used
 
         maxage = CONF.remove_unused_resized_minimum_age_seconds
         if base_file in self.originals:
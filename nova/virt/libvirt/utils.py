@@ -211,7 +211,7 @@ def get_disk_size(path):
     :returns: Size (in bytes) of the given disk image as it would be seen
               by a virtual machine.
     """
-    size = images.qemu_img_info(path).virtual_size
+    size = images.image_info(path).virtual_size
     return int(size)
 
 
@@ -221,7 +221,7 @@ def get_disk_backing_file(path):
     :param path: Path to the disk image
     :returns: a path to the image's backing store
     """
-    backing_file = images.qemu_img_info(path).backing_file
+    backing_file = images.image_info(path).backing_file
     if backing_file:
         backing_file = os.path.basename(backing_file)
 
@@ -397,7 +397,7 @@ def get_disk_type(path):
     if path.startswith('/dev'):
         return 'lvm'
 
-    return images.qemu_img_info(path).file_format
+    return images.image_info(path).file_format
 
 
 def get_fs_info(path):
@@ -421,4 +421,11 @@ def get_fs_info(path):
 
 def fetch_image(context, target, image_id, user_id, project_id):
     """Grab image"""
-    images.fetch_to_raw(context, image_id, target, user_id, project_id)
+    checksum = images.fetch_to_raw(context, image_id, target, user_id,
+                                   project_id)
+    if checksum:
+        # imagecache imports this module, so it can not be imported at the
+        # top of it.
+        from nova.virt.libvirt import imagecache
+        if CONF.checksum_base_images:
+            imagecache.write_stored_checksum(target, checksum)
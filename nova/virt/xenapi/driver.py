@@ -314,6 +314,10 @@ class XenAPIDriver(driver.ComputeDriver):
         """Return data about VM instance"""
         return self._vmops.get_info(instance)
 
+    def get_power_states(self):
+        """Return the power state of every VM in one call"""
+        return self._vmops.get_power_states()
+
     def get_diagnostics(self, instance):
         """Return data about VM diagnostics"""
         return self._vmops.get_diagnostics(instance)
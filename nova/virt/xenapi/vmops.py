@@ -1262,6 +1262,16 @@ class VMOps(object):
         vm_rec = self._session.call_xenapi("VM.get_record", vm_ref)
         return vm_utils.compile_info(vm_rec)
 
+    def get_power_states(self):
+        """Return the power state of every VM, keyed by name label."""
+        power_states = {}
+        for vm_ref, vm_rec in self._session.get_all_refs_and_recs('VM'):
+            if vm_rec["is_a_template"] or vm_rec["is_control_domain"]:
+                continue
+            power_states[vm_rec["name_label"]] = \
+                    vm_utils.XENAPI_POWER_STATE[vm_rec["power_state"]]
+        return power_states
+
     def get_diagnostics(self, instance):
         """Return data about VM diagnostics."""
         vm_ref = self._get_vm_opaque_ref(instance)
@@ -17,6 +17,11 @@
 Pluggable Weighing support
 """
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from nova import loadables
 
 
@@ -30,6 +35,25 @@ class WeighedObject(object):
         return "<WeighedObject '%s': %s>" % (self.obj, self.weight)
 
 
+class ObjectColumns(object):
+    """Attribute values of a list of objects as numpy arrays.
+
+    columns['free_ram_mb'] is an array with the free_ram_mb of every
+    object, in the order of the list.  Each column is only built once.
+    """
+    def __init__(self, obj_list):
+        self.obj_list = obj_list
+        self._columns = {}
+
+    def __getitem__(self, attr):
+        column = self._columns.get(attr)
+        if column is None:
+            column = numpy.array([getattr(obj, attr)
+                                  for obj in self.obj_list], dtype=float)
+            self._columns[attr] = column
+        return column
+
+
 class BaseWeigher(object):
     """Base class for pluggable weighers."""
     def _weight_multiplier(self):
@@ -44,6 +68,15 @@ class BaseWeigher(object):
         """
         return 0.0
 
+    def _weigh_columns(self, columns, weight_properties):
+        """Override in a subclass to return a numpy array with the
+        weights of all objects at once, computed from an ObjectColumns.
+
+        Returning None means the weigher can only weigh objects one at a
+        time through weigh_objects().
+        """
+        return None
+
     def weigh_objects(self, weighed_obj_list, weight_properties):
         """Weigh multiple objects.  Override in a subclass if you need
         need access to all objects in order to manipulate weights.
@@ -56,16 +89,52 @@ class BaseWeigher(object):
 class BaseWeightHandler(loadables.BaseLoader):
     object_class = WeighedObject
 
+    def _get_weighed_objects_array(self, weighers, obj_list,
+            weighing_properties, limit):
+        """Weigh all objects with numpy arrays.
+
+        Returns None if one of the weighers can't weigh all objects at
+        once.
+        """
+        columns = ObjectColumns(obj_list)
+        weights = numpy.zeros(len(obj_list))
+        for weigher in weighers:
+            column = weigher._weigh_columns(columns, weighing_properties)
+            if column is None:
+                return None
+            weights += weigher._weight_multiplier() * column
+
+        if limit == 1:
+            # argmax returns the first of equal weights, like the stable
+            # sort below.
+            order = [numpy.argmax(weights)]
+        else:
+            order = numpy.argsort(-weights, kind='mergesort')[:limit]
+        return [self.object_class(obj_list[index], float(weights[index]))
+                for index in order]
+
     def get_weighed_objects(self, weigher_classes, obj_list,
-            weighing_properties):
-        """Return a sorted (highest score first) list of WeighedObjects."""
+            weighing_properties, limit=None):
+        """Return a sorted (highest score first) list of WeighedObjects.
+
+        If limit is given, only the limit highest scoring objects are
+        returned.
+        """
 
         if not obj_list:
             return []
 
+        obj_list = list(obj_list)
+        weighers = [weigher_cls() for weigher_cls in weigher_classes]
+        if numpy is not None:
+            weighed_objs = self._get_weighed_objects_array(weighers,
+                    obj_list, weighing_properties, limit)
+            if weighed_objs is not None:
+                return weighed_objs
+
         weighed_objs = [self.object_class(obj, 0.0) for obj in obj_list]
-        for weigher_cls in weigher_classes:
-            weigher = weigher_cls()
+        for weigher in weighers:
             weigher.weigh_objects(weighed_objs, weighing_properties)
 
-        return sorted(weighed_objs, key=lambda x: x.weight, reverse=True)
+        return sorted(weighed_objs, key=lambda x: x.weight,
+                      reverse=True)[:limit]
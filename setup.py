@@ -61,6 +61,7 @@ setuptools.setup(name='nova',
                'bin/nova-network',
                'bin/nova-novncproxy',
                'bin/nova-objectstore',
+               'bin/nova-ratelimit',
                'bin/nova-rootwrap',
                'bin/nova-scheduler',
                'bin/nova-xvpvncproxy',
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark for IptablesManager._modify_rules on a large filter table.
+
+Generates iptables-save output for a host with many instances, each with
+its own security group chain, and an IptablesManager holding the rules
+nova-compute would have for them.  Unwrapped rules shared with other
+nova services, some of them at the top of FORWARD, are added as well.
+Times _modify_rules merging the two after removing the chains of a share
+of the instances and a share of the shared rules.
+
+Run like:
+
+    ./tools/benchmarks/iptables_modify_rules.py --lines 50000
+"""
+
+import argparse
+import gettext
+import os
+import sys
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(__file__),
+                                   os.pardir, os.pardir, os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+from nova.network import linux_net
+
+RULES_PER_INSTANCE = 10
+
+
+def instance_rules(i):
+    """The rules of the security group chain of instance i."""
+    ip = '10.%d.%d.%d' % (i >> 16, (i >> 8) & 255, i & 255)
+    rules = ['-m state --state INVALID -j DROP',
+             '-m state --state ESTABLISHED,RELATED -j ACCEPT',
+             '-s 10.0.0.1/32 -p udp -m udp --sport 67 --dport 68 -j ACCEPT']
+    for port in xrange(RULES_PER_INSTANCE - len(rules) - 1):
+        rules.append('-p tcp -m tcp --dport %d -j ACCEPT' % (8000 + port))
+    rules.append('-d %s -j $sg-fallback' % ip)
+    return rules
+
+
+def shared_rule(i):
+    """An unwrapped rule, the first ones of which go at the top."""
+    return '-s 192.168.%d.%d/32 -j ACCEPT' % (i >> 8 & 255, i & 255)
+
+
+def build_manager(num_instances, num_shared, num_top):
+    """An IptablesManager with a chain per instance."""
+    manager = linux_net.IptablesManager(execute=lambda *a, **kw: ('', ''))
+    table = manager.ipv4['filter']
+    for i in xrange(num_shared):
+        table.add_rule('FORWARD', shared_rule(i), wrap=False,
+                       top=i < num_top)
+    table.add_chain('sg-fallback')
+    table.add_rule('sg-fallback', '-j DROP')
+    for i in xrange(num_instances):
+        chain = 'inst-%d' % i
+        table.add_chain(chain)
+        table.add_rule('local', '-d 10.0.%d.%d -j $%s' %
+                       (i >> 8 & 255, i & 255, chain))
+        for rule in instance_rules(i):
+            table.add_rule(chain, rule)
+    return manager
+
+
+def iptables_save(manager):
+    """iptables-save -c output as the manager would have left it."""
+    table = manager.ipv4['filter']
+    lines = ['# Generated by iptables-save',
+             '*filter',
+             ':INPUT ACCEPT [2223527:305688874]',
+             ':FORWARD ACCEPT [0:0]',
+             ':OUTPUT ACCEPT [2172501:140856656]',
+             ':nova-filter-top - [0:0]']
+    lines += [':%s-%s - [0:0]' % (linux_net.binary_name, chain)
+              for chain in table.chains]
+    lines += ['[%d:%d] %s' % (i, i * 60, str(rule).split(' ', 1)[1])
+              for i, rule in enumerate(table.rules)]
+    lines += ['COMMIT', '# Completed']
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--lines', type=int, default=50000,
+                        help='approximate number of iptables-save lines')
+    parser.add_argument('--shared', type=int, default=5000,
+                        help='number of unwrapped rules')
+    parser.add_argument('--top', type=int, default=500,
+                        help='number of unwrapped rules kept at the top')
+    parser.add_argument('--remove', type=float, default=0.1,
+                        help='fraction of chains and unwrapped rules to '
+                             'remove')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='number of times to run _modify_rules')
+    args = parser.parse_args()
+
+    # Each instance has a chain declaration, a jump and its rules
+    num_instances = max(1, (args.lines - args.shared) //
+                           (RULES_PER_INSTANCE + 2))
+    manager = build_manager(num_instances, args.shared, args.top)
+    current_lines = iptables_save(manager)
+    table = manager.ipv4['filter']
+    print "iptables-save lines: %d, instances: %d" % (len(current_lines),
+                                                      num_instances)
+
+    start = time.time()
+    for i in xrange(int(num_instances * args.remove)):
+        table.remove_chain('inst-%d' % i)
+    for i in xrange(int(args.shared * args.remove)):
+        table.remove_rule('FORWARD', shared_rule(i), wrap=False,
+                          top=i < args.top)
+    print "remove:          %9.3fs" % (time.time() - start)
+
+    # _modify_rules flushes the removals, so each run starts from a copy
+    remove_rules = list(table.remove_rules)
+    remove_chains = set(table.remove_chains)
+    times = []
+    for i in xrange(args.runs):
+        table.remove_rules = list(remove_rules)
+        table.remove_chains = set(remove_chains)
+        start = time.time()
+        new_lines = manager._modify_rules(current_lines, table)
+        times.append(time.time() - start)
+    times.sort()
+    print "_modify_rules:   %9.3fs best, %9.3fs median, %d lines out" % (
+            times[0], times[len(times) // 2], len(new_lines))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark for FilterScheduler placement against a synthetic cloud.
+
+Builds a population of compute nodes and a stream of boot requests with
+mixed flavors, instance counts and affinity hints, and drives
+HostManager.get_filtered_hosts, HostManager.get_weighed_hosts and
+FilterScheduler._schedule against them.  The db calls made by the
+scheduler and its filters are answered from the synthetic cloud, so no
+database or message queue is needed.
+
+Reports scheduling decisions per second, p50/p99 latency of each stage
+and the time spent in each filter.
+
+Run like:
+
+    ./tools/benchmarks/scheduler_placement.py --hosts 10000 --requests 200
+    ./tools/benchmarks/scheduler_placement.py --filters full --batch
+"""
+
+import argparse
+import gettext
+import os
+import random
+import sys
+import time
+import uuid
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(__file__),
+                                   os.pardir, os.pardir, os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+from nova.compute import api as compute_api
+from nova import config
+from nova import context
+from nova import db
+from nova.openstack.common import cfg
+from nova.openstack.common import timeutils
+from nova.scheduler import filter_scheduler
+from nova.scheduler import filters
+
+CONF = cfg.CONF
+CONF.import_opt('compute_topic', 'nova.config')
+CONF.import_opt('scheduler_order_filters_by_cost',
+                'nova.scheduler.host_manager')
+
+FLAVORS = [
+    dict(name='m1.tiny', memory_mb=512, vcpus=1, root_gb=0, ephemeral_gb=0),
+    dict(name='m1.small', memory_mb=2048, vcpus=1, root_gb=20,
+         ephemeral_gb=0),
+    dict(name='m1.medium', memory_mb=4096, vcpus=2, root_gb=40,
+         ephemeral_gb=0),
+    dict(name='m1.large', memory_mb=8192, vcpus=4, root_gb=80,
+         ephemeral_gb=0),
+    dict(name='m1.xlarge', memory_mb=16384, vcpus=8, root_gb=160,
+         ephemeral_gb=0),
+]
+
+HOST_SIZES = [
+    dict(memory_mb=65536, vcpus=16, local_gb=1024),
+    dict(memory_mb=131072, vcpus=32, local_gb=2048),
+    dict(memory_mb=262144, vcpus=64, local_gb=4096),
+]
+
+AVAILABILITY_ZONES = ['az1', 'az2', 'az3']
+
+
+class SyntheticCloud(object):
+    """Compute nodes, services and instances of a made-up cloud."""
+
+    def __init__(self, num_hosts, num_instances, rand):
+        now = timeutils.utcnow()
+        self.compute_nodes = []
+        self.capabilities = {}
+        self.instance_hosts = {}
+        for i in xrange(num_hosts):
+            host = 'host%05d' % i
+            size = rand.choice(HOST_SIZES)
+            service = dict(id=i, host=host, topic=CONF.compute_topic,
+                           disabled=False,
+                           availability_zone=rand.choice(AVAILABILITY_ZONES),
+                           created_at=now, updated_at=now)
+            used_ram = rand.randint(0, size['memory_mb'] // 2)
+            used_gb = rand.randint(0, size['local_gb'] // 2)
+            self.compute_nodes.append(dict(id=i, service=service,
+                    hypervisor_hostname=host,
+                    memory_mb=size['memory_mb'],
+                    free_ram_mb=size['memory_mb'] - used_ram,
+                    local_gb=size['local_gb'],
+                    local_gb_used=used_gb,
+                    free_disk_gb=size['local_gb'] - used_gb,
+                    disk_available_least=None,
+                    vcpus=size['vcpus'],
+                    vcpus_used=rand.randint(0, size['vcpus']),
+                    updated_at=now, stats=[]))
+            self.capabilities[host] = dict(
+                    hypervisor_hostname=host,
+                    host_ip='10.%d.%d.%d' % (i >> 16, (i >> 8) & 255,
+                                             i & 255),
+                    supported_instances=[['x86_64', 'kvm', 'hvm']],
+                    enabled=True)
+        hosts = [compute['service']['host'] for compute in self.compute_nodes]
+        for i in xrange(num_instances):
+            self.instance_hosts[str(uuid.uuid4())] = rand.choice(hosts)
+
+    def stub_db(self):
+        """Answer the db calls made while scheduling from this cloud."""
+        services = [compute['service'] for compute in self.compute_nodes]
+
+        def compute_node_get_all(context, updated_since=None):
+            if updated_since is not None:
+                return []
+            return self.compute_nodes
+
+        def service_get_all(context, disabled=None):
+            return services
+
+        def aggregate_metadata_get_by_host(context, host, key=None):
+            return {}
+
+        def instance_get_all_by_host_and_not_type(context, host,
+                                                  type_id=None):
+            return []
+
+        def get_all(api, context, search_opts=None, *args, **kwargs):
+            uuids = (search_opts or {}).get('uuid', [])
+            return [dict(uuid=instance_uuid,
+                         host=self.instance_hosts.get(instance_uuid))
+                    for instance_uuid in uuids]
+
+        db.compute_node_get_all = compute_node_get_all
+        db.service_get_all = service_get_all
+        db.aggregate_metadata_get_by_host = aggregate_metadata_get_by_host
+        db.instance_get_all_by_host_and_not_type = \
+                instance_get_all_by_host_and_not_type
+        compute_api.API.get_all = get_all
+
+    def make_request(self, rand, max_instances, hint_ratio):
+        """Return a (request_spec, filter_properties) for one boot."""
+        flavor = rand.choice(FLAVORS)
+        num_instances = rand.randint(1, max_instances)
+        project_id = 'project%d' % rand.randint(0, 99)
+        instance_properties = dict(project_id=project_id, os_type='linux',
+                                   image_ref='fake-image',
+                                   vm_state='building', task_state=None,
+                                   memory_mb=flavor['memory_mb'],
+                                   vcpus=flavor['vcpus'],
+                                   root_gb=flavor['root_gb'],
+                                   ephemeral_gb=flavor['ephemeral_gb'])
+        if rand.random() < 0.5:
+            instance_properties['availability_zone'] = rand.choice(
+                    AVAILABILITY_ZONES)
+        instance_type = dict(flavor, id=FLAVORS.index(flavor), extra_specs={})
+        request_spec = dict(instance_properties=instance_properties,
+                            instance_type=instance_type,
+                            image=dict(properties=dict(
+                                    architecture='x86_64')),
+                            num_instances=num_instances)
+
+        hints = {}
+        if rand.random() < hint_ratio:
+            hint = rand.choice(['different_host', 'same_host'])
+            hints[hint] = rand.sample(self.instance_hosts.keys(),
+                                      rand.randint(1, 3))
+        return request_spec, dict(scheduler_hints=hints)
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+def report(name, latencies, decisions=None):
+    total = sum(latencies)
+    line = ("%-20s runs:%6d  p50:%9.3fms  p99:%9.3fms" %
+            (name, len(latencies), percentile(latencies, 50) * 1000,
+             percentile(latencies, 99) * 1000))
+    if decisions is not None and total:
+        line += "  decisions/s:%9.1f" % (decisions / total)
+    print line
+
+
+def timed(func, *args, **kwargs):
+    start = time.time()
+    result = func(*args, **kwargs)
+    return time.time() - start, result
+
+
+def concrete_filters():
+    """Names of every filter class that implements host_passes."""
+    base = filters.BaseHostFilter.host_passes.im_func
+    return [cls.__name__ for cls in filters.all_filters()
+            if cls.host_passes.im_func is not base]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--hosts', type=int, default=10000,
+                        help='number of compute nodes')
+    parser.add_argument('--instances', type=int, default=100000,
+                        help='number of existing instances hints refer to')
+    parser.add_argument('--requests', type=int, default=100,
+                        help='number of boot requests to schedule')
+    parser.add_argument('--max-instances', type=int, default=10,
+                        help='maximum number of instances per request')
+    parser.add_argument('--hint-ratio', type=float, default=0.2,
+                        help='fraction of requests with affinity hints')
+    parser.add_argument('--filters', choices=['default', 'full'],
+                        default='default',
+                        help='scheduler_default_filters or every filter')
+    parser.add_argument('--batch', action='store_true',
+                        help='enable scheduler_batch_placement')
+    parser.add_argument('--order-filters-by-cost', action='store_true',
+                        help='enable scheduler_order_filters_by_cost')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed for the synthetic cloud')
+    args = parser.parse_args()
+
+    config.parse_args([sys.argv[0]])
+    rand = random.Random(args.seed)
+
+    if args.filters == 'full':
+        CONF.set_override('scheduler_default_filters', concrete_filters())
+    CONF.set_override('scheduler_batch_placement', args.batch)
+    CONF.set_override('scheduler_order_filters_by_cost',
+                      args.order_filters_by_cost)
+
+    print "Building cloud with %d hosts..." % args.hosts
+    cloud = SyntheticCloud(args.hosts, args.instances, rand)
+    cloud.stub_db()
+
+    scheduler = filter_scheduler.FilterScheduler()
+    host_manager = scheduler.host_manager
+    for host, capabilities in cloud.capabilities.iteritems():
+        host_manager.update_service_capabilities('compute', host,
+                                                 capabilities)
+    ctxt = context.get_admin_context()
+    requests = [cloud.make_request(rand, args.max_instances,
+                                   args.hint_ratio)
+                for i in xrange(args.requests)]
+
+    print "Filters: %s" % ', '.join(CONF.scheduler_default_filters)
+
+    # Filtering and weighing a single instance against all hosts.
+    filter_times = []
+    weigh_times = []
+    for request_spec, filter_properties in requests:
+        filter_properties = dict(filter_properties, context=ctxt,
+                                 request_spec=request_spec,
+                                 instance_type=request_spec['instance_type'])
+        hosts = host_manager.get_all_host_states(ctxt)
+        elapsed, hosts = timed(host_manager.get_filtered_hosts, hosts,
+                               filter_properties)
+        filter_times.append(elapsed)
+        if hosts:
+            elapsed, weighed = timed(host_manager.get_weighed_hosts, hosts,
+                                     filter_properties)
+            weigh_times.append(elapsed)
+    host_manager.filter_handler.filter_stats.clear()
+
+    # Complete scheduling decisions for every request.
+    schedule_times = []
+    decisions = 0
+    for request_spec, filter_properties in requests:
+        elapsed, selected = timed(scheduler._schedule, ctxt, request_spec,
+                                  dict(filter_properties))
+        schedule_times.append(elapsed)
+        decisions += len(selected)
+
+    print
+    report('get_filtered_hosts', filter_times)
+    report('get_weighed_hosts', weigh_times)
+    report('_schedule', schedule_times, decisions)
+
+    print
+    print "Time per filter during _schedule:"
+    stats = host_manager.filter_handler.filter_stats
+    for filter_cls, stat in sorted(stats.iteritems(),
+                                   key=lambda x: -x[1]['time']):
+        rejected = stat['objects'] - stat['passed']
+        print ("  %-36s %9.3fs  hosts:%9d  rejected:%9d" %
+               (filter_cls.__name__, stat['time'], stat['objects'],
+                rejected))
+
+
+if __name__ == '__main__':
+    main()